@@ -0,0 +1,53 @@
+"""Create users and todos tables
+
+Revision ID: 0a7c3e5f9b21
+Revises: 
+Create Date: 2026-10-18 12:58:21.604117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a7c3e5f9b21'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The schema main.py used to create with create_all() at import, before phone_number was added
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('email', sa.String(), unique=True),
+        sa.Column('username', sa.String(), unique=True),
+        sa.Column('first_name', sa.String()),
+        sa.Column('last_name', sa.String()),
+        sa.Column('hashed_password', sa.String()),
+        sa.Column('is_active', sa.Boolean()),
+        sa.Column('role', sa.String()),
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+    op.create_table(
+        'todos',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('title', sa.String()),
+        sa.Column('description', sa.String()),
+        sa.Column('priority', sa.String()),
+        sa.Column('complete', sa.Boolean()),
+        sa.Column('owner_id', sa.Integer(), sa.ForeignKey('users.id')),
+    )
+    op.create_index('ix_todos_id', 'todos', ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_todos_id', table_name='todos')
+    op.drop_table('todos')
+    op.drop_index('ix_users_id', table_name='users')
+    op.drop_table('users')
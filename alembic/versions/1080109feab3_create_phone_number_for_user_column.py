@@ -1,7 +1,7 @@
 """Create phone number for user column
 
 Revision ID: 1080109feab3
-Revises: 
+Revises: 0a7c3e5f9b21
 Create Date: 2025-09-14 19:07:08.216333
 
 """
@@ -13,7 +13,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision: str = '1080109feab3'
-down_revision: Union[str, Sequence[str], None] = None
+down_revision: Union[str, Sequence[str], None] = '0a7c3e5f9b21'
 branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
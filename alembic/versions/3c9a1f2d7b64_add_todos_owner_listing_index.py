@@ -0,0 +1,32 @@
+"""Add todos owner listing index
+
+Revision ID: 3c9a1f2d7b64
+Revises: 1080109feab3
+Create Date: 2026-10-18 09:12:41.503217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9a1f2d7b64'
+down_revision: Union[str, Sequence[str], None] = '1080109feab3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_todos_owner_complete_priority_id',
+        'todos',
+        ['owner_id', 'complete', 'priority', 'id'],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_todos_owner_complete_priority_id', table_name='todos')
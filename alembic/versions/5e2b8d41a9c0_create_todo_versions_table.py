@@ -0,0 +1,32 @@
+"""Create todo versions table
+
+Revision ID: 5e2b8d41a9c0
+Revises: 3c9a1f2d7b64
+Create Date: 2026-10-18 11:40:03.118452
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2b8d41a9c0'
+down_revision: Union[str, Sequence[str], None] = '3c9a1f2d7b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'todo_versions',
+        sa.Column('owner_id', sa.Integer(), primary_key=True),
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('todo_versions')
@@ -0,0 +1,59 @@
+"""Add todos full-text search
+
+Revision ID: 7d4f1b2c8e53
+Revises: 5e2b8d41a9c0
+Create Date: 2026-10-18 13:31:47.209815
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d4f1b2c8e53'
+down_revision: Union[str, Sequence[str], None] = '5e2b8d41a9c0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE todos_fts USING fts5("
+    "title, description, owner_id, content='todos', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER todos_fts_ai AFTER INSERT ON todos BEGIN "
+    "INSERT INTO todos_fts(rowid, title, description, owner_id) VALUES (new.id, new.title, new.description, new.owner_id); END",
+    "CREATE TRIGGER todos_fts_ad AFTER DELETE ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, title, description, owner_id) VALUES ('delete', old.id, old.title, old.description, old.owner_id); END",
+    "CREATE TRIGGER todos_fts_au AFTER UPDATE OF title, description, owner_id ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, title, description, owner_id) VALUES ('delete', old.id, old.title, old.description, old.owner_id); "
+    "INSERT INTO todos_fts(rowid, title, description, owner_id) VALUES (new.id, new.title, new.description, new.owner_id); END",
+    # Index the rows that already exist
+    "INSERT INTO todos_fts(todos_fts) VALUES ('rebuild')",
+]
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER todos_fts_au",
+    "DROP TRIGGER todos_fts_ad",
+    "DROP TRIGGER todos_fts_ai",
+    "DROP TABLE todos_fts",
+]
+POSTGRES_SEARCH_VECTOR = "to_tsvector('english'::regconfig, coalesce(title, '') || ' ' || coalesce(description, ''))"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        # CONCURRENTLY can't run in a transaction, but doesn't block writes while a large table is indexed
+        with op.get_context().autocommit_block():
+            op.execute(f"CREATE INDEX CONCURRENTLY ix_todos_search ON todos USING GIN ({POSTGRES_SEARCH_VECTOR})")
+    else:
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        op.drop_index('ix_todos_search', table_name='todos')
+    else:
+        for statement in SQLITE_DOWNGRADE:
+            op.execute(statement)
@@ -0,0 +1,95 @@
+"""Create todo stats table
+
+Revision ID: 9b3e6a0d2f18
+Revises: 7d4f1b2c8e53
+Create Date: 2026-10-18 14:12:09.551270
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b3e6a0d2f18'
+down_revision: Union[str, Sequence[str], None] = '7d4f1b2c8e53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SQLITE_UPGRADE = [
+    "CREATE TRIGGER todo_stats_ai AFTER INSERT ON todos BEGIN "
+    "INSERT INTO todo_stats (owner_id, priority, complete, count) "
+    "VALUES (new.owner_id, coalesce(CAST(new.priority AS INTEGER), 0), coalesce(new.complete, 0), 1) "
+    "ON CONFLICT (owner_id, priority, complete) DO UPDATE SET count = count + 1; END",
+    "CREATE TRIGGER todo_stats_ad AFTER DELETE ON todos BEGIN "
+    "UPDATE todo_stats SET count = count - 1 WHERE owner_id = old.owner_id "
+    "AND priority = coalesce(CAST(old.priority AS INTEGER), 0) AND complete = coalesce(old.complete, 0); END",
+    "CREATE TRIGGER todo_stats_au AFTER UPDATE OF owner_id, priority, complete ON todos BEGIN "
+    "UPDATE todo_stats SET count = count - 1 WHERE owner_id = old.owner_id "
+    "AND priority = coalesce(CAST(old.priority AS INTEGER), 0) AND complete = coalesce(old.complete, 0); "
+    "INSERT INTO todo_stats (owner_id, priority, complete, count) "
+    "VALUES (new.owner_id, coalesce(CAST(new.priority AS INTEGER), 0), coalesce(new.complete, 0), 1) "
+    "ON CONFLICT (owner_id, priority, complete) DO UPDATE SET count = count + 1; END",
+]
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER todo_stats_au",
+    "DROP TRIGGER todo_stats_ad",
+    "DROP TRIGGER todo_stats_ai",
+]
+POSTGRES_UPGRADE = [
+    """CREATE FUNCTION todo_stats_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE todo_stats SET count = count - 1
+        WHERE owner_id = OLD.owner_id
+          AND priority = coalesce(OLD.priority::integer, 0)
+          AND complete = coalesce(OLD.complete, false);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO todo_stats (owner_id, priority, complete, count)
+        VALUES (NEW.owner_id, coalesce(NEW.priority::integer, 0), coalesce(NEW.complete, false), 1)
+        ON CONFLICT (owner_id, priority, complete) DO UPDATE SET count = todo_stats.count + 1;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql""",
+    "CREATE TRIGGER todo_stats_sync AFTER INSERT OR DELETE OR UPDATE OF owner_id, priority, complete ON todos "
+    "FOR EACH ROW EXECUTE FUNCTION todo_stats_apply()",
+]
+POSTGRES_DOWNGRADE = [
+    "DROP TRIGGER todo_stats_sync ON todos",
+    "DROP FUNCTION todo_stats_apply()",
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'todo_stats',
+        sa.Column('owner_id', sa.Integer(), primary_key=True),
+        sa.Column('priority', sa.Integer(), primary_key=True),
+        sa.Column('complete', sa.Boolean(), primary_key=True),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+    )
+    is_postgres = op.get_bind().dialect.name == "postgresql"
+    if is_postgres:
+        # Writes wait while the existing todos are counted, so none is missed or counted twice
+        op.execute("LOCK TABLE todos IN SHARE MODE")
+    for statement in POSTGRES_UPGRADE if is_postgres else SQLITE_UPGRADE:
+        op.execute(statement)
+    # Count the todos that already exist
+    op.execute(
+        "INSERT INTO todo_stats (owner_id, priority, complete, count) "
+        "SELECT owner_id, coalesce(CAST(priority AS INTEGER), 0), coalesce(complete, false), count(*) "
+        "FROM todos WHERE owner_id IS NOT NULL "
+        "GROUP BY owner_id, coalesce(CAST(priority AS INTEGER), 0), coalesce(complete, false)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    is_postgres = op.get_bind().dialect.name == "postgresql"
+    for statement in POSTGRES_DOWNGRADE if is_postgres else SQLITE_DOWNGRADE:
+        op.execute(statement)
+    op.drop_table('todo_stats')
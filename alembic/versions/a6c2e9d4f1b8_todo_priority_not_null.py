@@ -0,0 +1,122 @@
+"""Todo priority NOT NULL
+
+Revision ID: a6c2e9d4f1b8
+Revises: f3a9c1d5b7e2
+Create Date: 2026-10-19 11:37:12.640285
+
+d1f5a8c3e7b9 turned legacy priorities outside 1-5 into NULL, which the
+API can't return (every todo has a priority) nor sort across shards. They
+get the middle priority, FALLBACK_PRIORITY, in todos and archived_todos,
+and both columns become NOT NULL.
+
+On Postgres, d1f5a8c3e7b9 set those NULLs on the new column behind the
+stats trigger's back, so todo_stats still counts them under their old
+priority: it is recomputed here. NOT NULL is added online: a CHECK is
+validated without blocking writes, then SET NOT NULL relies on it instead
+of scanning under an exclusive lock. SQLite rebuilds the tables.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6c2e9d4f1b8'
+down_revision: Union[str, Sequence[str], None] = 'f3a9c1d5b7e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 10000
+FALLBACK_PRIORITY = 3
+
+# Triggers on todos (7d4f1b2c8e53, 9b3e6a0d2f18); SQLite drops them with the old table
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER todos_fts_ai AFTER INSERT ON todos BEGIN "
+    "INSERT INTO todos_fts(rowid, title, description, owner_id) VALUES (new.id, new.title, new.description, new.owner_id); END",
+    "CREATE TRIGGER todos_fts_ad AFTER DELETE ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, title, description, owner_id) VALUES ('delete', old.id, old.title, old.description, old.owner_id); END",
+    "CREATE TRIGGER todos_fts_au AFTER UPDATE OF title, description, owner_id ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, title, description, owner_id) VALUES ('delete', old.id, old.title, old.description, old.owner_id); "
+    "INSERT INTO todos_fts(rowid, title, description, owner_id) VALUES (new.id, new.title, new.description, new.owner_id); END",
+    "CREATE TRIGGER todo_stats_ai AFTER INSERT ON todos BEGIN "
+    "INSERT INTO todo_stats (owner_id, priority, complete, count) "
+    "VALUES (new.owner_id, coalesce(CAST(new.priority AS INTEGER), 0), coalesce(new.complete, 0), 1) "
+    "ON CONFLICT (owner_id, priority, complete) DO UPDATE SET count = count + 1; END",
+    "CREATE TRIGGER todo_stats_ad AFTER DELETE ON todos BEGIN "
+    "UPDATE todo_stats SET count = count - 1 WHERE owner_id = old.owner_id "
+    "AND priority = coalesce(CAST(old.priority AS INTEGER), 0) AND complete = coalesce(old.complete, 0); END",
+    "CREATE TRIGGER todo_stats_au AFTER UPDATE OF owner_id, priority, complete ON todos BEGIN "
+    "UPDATE todo_stats SET count = count - 1 WHERE owner_id = old.owner_id "
+    "AND priority = coalesce(CAST(old.priority AS INTEGER), 0) AND complete = coalesce(old.complete, 0); "
+    "INSERT INTO todo_stats (owner_id, priority, complete, count) "
+    "VALUES (new.owner_id, coalesce(CAST(new.priority AS INTEGER), 0), coalesce(new.complete, 0), 1) "
+    "ON CONFLICT (owner_id, priority, complete) DO UPDATE SET count = count + 1; END",
+]
+
+MAX_ID = "SELECT max(coalesce((SELECT max(id) FROM todos), 0), coalesce((SELECT max(id) FROM archived_todos), 0))"
+
+# Same as `python -m <package>.stats rebuild`, in the migration's transaction
+POSTGRES_REBUILD_STATS = [
+    "LOCK TABLE todos IN SHARE MODE",
+    "DELETE FROM todo_stats",
+    "INSERT INTO todo_stats (owner_id, priority, complete, count) "
+    "SELECT owner_id, coalesce(priority::integer, 0), coalesce(complete, false), count(*) FROM todos "
+    "WHERE owner_id IS NOT NULL GROUP BY 1, 2, 3",
+]
+
+
+def fill_priorities(table: str) -> None:
+    # Through `priority` itself, so the SQLite stats triggers move the rows to their new bucket
+    bind = op.get_bind()
+    low, high = bind.execute(sa.text(f"SELECT min(id), max(id) FROM {table} WHERE priority IS NULL")).one()
+    if low is None:
+        return
+    with op.get_context().autocommit_block():
+        for start in range(low, high + 1, BATCH_SIZE):
+            bind.execute(
+                sa.text(f"UPDATE {table} SET priority = :priority WHERE priority IS NULL AND id >= :low AND id < :high"),
+                {"priority": FALLBACK_PRIORITY, "low": start, "high": start + BATCH_SIZE},
+            )
+
+
+def set_not_null_postgresql(table: str) -> None:
+    check = f"ck_{table}_priority_not_null"
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {check} CHECK (priority IS NOT NULL) NOT VALID")
+    with op.get_context().autocommit_block():
+        op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check}")
+    op.execute(f"ALTER TABLE {table} ALTER COLUMN priority SET NOT NULL")  # Proven by the CHECK, no scan
+    op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {check}")
+
+
+def alter_priority_sqlite(nullable: bool) -> None:
+    for table, table_kwargs in (('todos', {'sqlite_autoincrement': True}), ('archived_todos', {})):
+        with op.batch_alter_table(table, recreate='always', table_kwargs=table_kwargs) as batch_op:
+            batch_op.alter_column('priority', existing_type=sa.SmallInteger(), nullable=nullable)
+    for statement in SQLITE_TRIGGERS:
+        op.execute(statement)
+    # The copy restarted the AUTOINCREMENT sequence at max(todos.id): keep it above archived ids (f3a9c1d5b7e2)
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'todos'")
+    op.execute(f"INSERT INTO sqlite_sequence (name, seq) VALUES ('todos', ({MAX_ID}))")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('todos', 'archived_todos'):
+        fill_priorities(table)
+    if op.get_bind().dialect.name == 'postgresql':
+        for statement in POSTGRES_REBUILD_STATS:
+            op.execute(statement)
+        for table in ('todos', 'archived_todos'):
+            set_not_null_postgresql(table)
+    else:
+        alter_priority_sqlite(nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        for table in ('todos', 'archived_todos'):
+            op.alter_column(table, 'priority', existing_type=sa.SmallInteger(), nullable=True)
+    else:
+        alter_priority_sqlite(nullable=True)
@@ -0,0 +1,34 @@
+"""Create todo id blocks table
+
+Revision ID: b4d2e7f1c5a3
+Revises: 9b3e6a0d2f18
+Create Date: 2026-10-18 16:02:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d2e7f1c5a3'
+down_revision: Union[str, Sequence[str], None] = '9b3e6a0d2f18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Only used on DATABASE_URL, to hand out todo ids once todos are sharded;
+    # shards get the (empty) table too since they share the migration chain
+    op.create_table(
+        'todo_id_blocks',
+        sa.Column('name', sa.String(), primary_key=True),
+        sa.Column('next_id', sa.Integer(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('todo_id_blocks')
@@ -0,0 +1,189 @@
+"""Integer todo priority and constraints
+
+Revision ID: d1f5a8c3e7b9
+Revises: b4d2e7f1c5a3
+Create Date: 2026-10-18 17:25:03.871592
+
+Stores todos.priority as a SMALLINT (1-5, CHECK), so sorting and range
+filters compare numbers, and bounds title/description with CHECKs that
+SQLite enforces too (it ignores VARCHAR lengths). Adds an (owner_id,
+priority, id) index for priority-sorted listings; the existing (owner_id,
+complete, priority, id) index already covers owner_id and (owner_id,
+complete) lookups.
+
+Postgres is migrated online: a new column is backfilled in batches of
+BATCH_SIZE ids, each its own transaction, while a trigger keeps it in step
+with concurrent writes. Indexes are built CONCURRENTLY and constraints are
+validated without blocking writes. Only the final column swap takes a
+brief exclusive lock. SQLite locks the whole database on any write anyway,
+so the table is rebuilt in one step.
+
+Priorities other than 1-5 become NULL (a6c2e9d4f1b8 later gives them a
+valid one) and overlong titles/descriptions are truncated. On Postgres the
+NULLs are set on the new column, which the stats trigger doesn't see, so
+todo_stats is recomputed after the swap.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd1f5a8c3e7b9'
+down_revision: Union[str, Sequence[str], None] = 'b4d2e7f1c5a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 10000
+TITLE_MAX = 200
+DESCRIPTION_MAX = 100
+
+CHECKS = {
+    'ck_todos_priority': 'priority BETWEEN 1 AND 5',
+    'ck_todos_title_length': f'length(title) <= {TITLE_MAX}',
+    'ck_todos_description_length': f'length(description) <= {DESCRIPTION_MAX}',
+}
+
+# Triggers on todos (7d4f1b2c8e53, 9b3e6a0d2f18); SQLite drops them with the old table
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER todos_fts_ai AFTER INSERT ON todos BEGIN "
+    "INSERT INTO todos_fts(rowid, title, description, owner_id) VALUES (new.id, new.title, new.description, new.owner_id); END",
+    "CREATE TRIGGER todos_fts_ad AFTER DELETE ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, title, description, owner_id) VALUES ('delete', old.id, old.title, old.description, old.owner_id); END",
+    "CREATE TRIGGER todos_fts_au AFTER UPDATE OF title, description, owner_id ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, title, description, owner_id) VALUES ('delete', old.id, old.title, old.description, old.owner_id); "
+    "INSERT INTO todos_fts(rowid, title, description, owner_id) VALUES (new.id, new.title, new.description, new.owner_id); END",
+    "CREATE TRIGGER todo_stats_ai AFTER INSERT ON todos BEGIN "
+    "INSERT INTO todo_stats (owner_id, priority, complete, count) "
+    "VALUES (new.owner_id, coalesce(CAST(new.priority AS INTEGER), 0), coalesce(new.complete, 0), 1) "
+    "ON CONFLICT (owner_id, priority, complete) DO UPDATE SET count = count + 1; END",
+    "CREATE TRIGGER todo_stats_ad AFTER DELETE ON todos BEGIN "
+    "UPDATE todo_stats SET count = count - 1 WHERE owner_id = old.owner_id "
+    "AND priority = coalesce(CAST(old.priority AS INTEGER), 0) AND complete = coalesce(old.complete, 0); END",
+    "CREATE TRIGGER todo_stats_au AFTER UPDATE OF owner_id, priority, complete ON todos BEGIN "
+    "UPDATE todo_stats SET count = count - 1 WHERE owner_id = old.owner_id "
+    "AND priority = coalesce(CAST(old.priority AS INTEGER), 0) AND complete = coalesce(old.complete, 0); "
+    "INSERT INTO todo_stats (owner_id, priority, complete, count) "
+    "VALUES (new.owner_id, coalesce(CAST(new.priority AS INTEGER), 0), coalesce(new.complete, 0), 1) "
+    "ON CONFLICT (owner_id, priority, complete) DO UPDATE SET count = count + 1; END",
+]
+
+POSTGRES_STATS_TRIGGER = (
+    "CREATE TRIGGER todo_stats_sync AFTER INSERT OR DELETE OR UPDATE OF owner_id, priority, complete ON todos "
+    "FOR EACH ROW EXECUTE FUNCTION todo_stats_apply()"
+)
+# Same as `python -m <package>.stats rebuild`, in the migration's transaction
+POSTGRES_REBUILD_STATS = [
+    "LOCK TABLE todos IN SHARE MODE",
+    "DELETE FROM todo_stats",
+    "INSERT INTO todo_stats (owner_id, priority, complete, count) "
+    "SELECT owner_id, coalesce(priority::integer, 0), coalesce(complete, false), count(*) FROM todos "
+    "WHERE owner_id IS NOT NULL GROUP BY 1, 2, 3",
+]
+# Keeps priority_new current for rows written while the backfill runs
+POSTGRES_SYNC = [
+    """CREATE FUNCTION todos_priority_sync() RETURNS trigger AS $$
+BEGIN
+    NEW.priority_new := CASE WHEN NEW.priority IN ('1', '2', '3', '4', '5') THEN NEW.priority::smallint END;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql""",
+    "CREATE TRIGGER todos_priority_sync BEFORE INSERT OR UPDATE OF priority ON todos "
+    "FOR EACH ROW EXECUTE FUNCTION todos_priority_sync()",
+]
+
+
+def in_batches(statement: str) -> None:
+    """Run `statement` (with :low/:high id bounds) over the whole table, one committed batch at a time"""
+    bind = op.get_bind()
+    low, high = bind.execute(sa.text("SELECT min(id), max(id) FROM todos")).one()
+    if low is None:
+        return
+    with op.get_context().autocommit_block():
+        for start in range(low, high + 1, BATCH_SIZE):
+            bind.execute(sa.text(statement), {"low": start, "high": start + BATCH_SIZE})
+
+
+def truncate_text() -> None:
+    # Rare rows, but a single statement would hold their locks until it finished
+    in_batches(
+        f"UPDATE todos SET title = substr(title, 1, {TITLE_MAX}), description = substr(description, 1, {DESCRIPTION_MAX}) "
+        f"WHERE id >= :low AND id < :high AND (length(title) > {TITLE_MAX} OR length(description) > {DESCRIPTION_MAX})"
+    )
+
+
+def upgrade_postgresql() -> None:
+    op.add_column('todos', sa.Column('priority_new', sa.SmallInteger()))
+    for statement in POSTGRES_SYNC:
+        op.execute(statement)
+    in_batches(
+        "UPDATE todos SET priority_new = CASE WHEN priority IN ('1', '2', '3', '4', '5') THEN priority::smallint END "
+        "WHERE id >= :low AND id < :high"
+    )
+    truncate_text()
+    with op.get_context().autocommit_block():
+        op.create_index('ix_todos_owner_complete_priority_new', 'todos', ['owner_id', 'complete', 'priority_new', 'id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_todos_owner_priority_id', 'todos', ['owner_id', 'priority_new', 'id'],
+                        postgresql_concurrently=True)
+
+    # The swap: catalog changes only, the exclusive lock is held for milliseconds
+    op.execute("DROP TRIGGER todos_priority_sync ON todos")
+    op.execute("DROP FUNCTION todos_priority_sync()")
+    op.execute("DROP TRIGGER todo_stats_sync ON todos")
+    op.drop_index('ix_todos_owner_complete_priority_id', table_name='todos')
+    op.drop_column('todos', 'priority')
+    op.alter_column('todos', 'priority_new', new_column_name='priority')
+    op.execute("ALTER INDEX ix_todos_owner_complete_priority_new RENAME TO ix_todos_owner_complete_priority_id")
+    op.execute(POSTGRES_STATS_TRIGGER)
+    # Rows whose priority became NULL are still counted under their old priority
+    for statement in POSTGRES_REBUILD_STATS:
+        op.execute(statement)
+    for name, condition in CHECKS.items():
+        op.execute(f"ALTER TABLE todos ADD CONSTRAINT {name} CHECK ({condition}) NOT VALID")
+
+    with op.get_context().autocommit_block():
+        for name in CHECKS:
+            # Scans the table, but only blocks other schema changes
+            op.execute(f"ALTER TABLE todos VALIDATE CONSTRAINT {name}")
+
+
+def upgrade_sqlite() -> None:
+    op.execute("UPDATE todos SET priority = NULL WHERE priority NOT IN ('1', '2', '3', '4', '5')")
+    truncate_text()
+    with op.batch_alter_table('todos', recreate='always') as batch_op:
+        batch_op.alter_column('priority', type_=sa.SmallInteger(), existing_type=sa.String())
+        for name, condition in CHECKS.items():
+            batch_op.create_check_constraint(name, condition)
+        batch_op.create_index('ix_todos_owner_priority_id', ['owner_id', 'priority', 'id'])
+    for statement in SQLITE_TRIGGERS:
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        upgrade_postgresql()
+    else:
+        upgrade_sqlite()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_todos_owner_priority_id', table_name='todos')
+        for name in CHECKS:
+            op.drop_constraint(name, 'todos', type_='check')
+        op.execute("DROP TRIGGER todo_stats_sync ON todos")
+        op.alter_column('todos', 'priority', type_=sa.String(), existing_type=sa.SmallInteger(),
+                        postgresql_using='priority::text')
+        op.execute(POSTGRES_STATS_TRIGGER)
+        return
+    with op.batch_alter_table('todos', recreate='always') as batch_op:
+        batch_op.drop_index('ix_todos_owner_priority_id')
+        for name in CHECKS:
+            batch_op.drop_constraint(name, type_='check')
+        batch_op.alter_column('priority', type_=sa.String(), existing_type=sa.SmallInteger())
+    for statement in SQLITE_TRIGGERS:
+        op.execute(statement)
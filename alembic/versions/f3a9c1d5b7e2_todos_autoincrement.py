@@ -0,0 +1,80 @@
+"""Never reuse todo ids on SQLite
+
+Revision ID: f3a9c1d5b7e2
+Revises: e8c4b2a6f0d3
+Create Date: 2026-10-19 10:04:51.220913
+
+A plain INTEGER PRIMARY KEY on SQLite hands the highest id out again once
+that row is gone, and archived todos keep their id: a new todo could get
+the id of an archived one and then fail to be archived itself. The todos
+table is rebuilt with AUTOINCREMENT, its sequence starting above the
+archived ids too. Archived todos that already share an id with a live one
+get a fresh id. Postgres sequences never go back, nothing to do there.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a9c1d5b7e2'
+down_revision: Union[str, Sequence[str], None] = 'e8c4b2a6f0d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Triggers on todos (7d4f1b2c8e53, 9b3e6a0d2f18); SQLite drops them with the old table
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER todos_fts_ai AFTER INSERT ON todos BEGIN "
+    "INSERT INTO todos_fts(rowid, title, description, owner_id) VALUES (new.id, new.title, new.description, new.owner_id); END",
+    "CREATE TRIGGER todos_fts_ad AFTER DELETE ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, title, description, owner_id) VALUES ('delete', old.id, old.title, old.description, old.owner_id); END",
+    "CREATE TRIGGER todos_fts_au AFTER UPDATE OF title, description, owner_id ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, title, description, owner_id) VALUES ('delete', old.id, old.title, old.description, old.owner_id); "
+    "INSERT INTO todos_fts(rowid, title, description, owner_id) VALUES (new.id, new.title, new.description, new.owner_id); END",
+    "CREATE TRIGGER todo_stats_ai AFTER INSERT ON todos BEGIN "
+    "INSERT INTO todo_stats (owner_id, priority, complete, count) "
+    "VALUES (new.owner_id, coalesce(CAST(new.priority AS INTEGER), 0), coalesce(new.complete, 0), 1) "
+    "ON CONFLICT (owner_id, priority, complete) DO UPDATE SET count = count + 1; END",
+    "CREATE TRIGGER todo_stats_ad AFTER DELETE ON todos BEGIN "
+    "UPDATE todo_stats SET count = count - 1 WHERE owner_id = old.owner_id "
+    "AND priority = coalesce(CAST(old.priority AS INTEGER), 0) AND complete = coalesce(old.complete, 0); END",
+    "CREATE TRIGGER todo_stats_au AFTER UPDATE OF owner_id, priority, complete ON todos BEGIN "
+    "UPDATE todo_stats SET count = count - 1 WHERE owner_id = old.owner_id "
+    "AND priority = coalesce(CAST(old.priority AS INTEGER), 0) AND complete = coalesce(old.complete, 0); "
+    "INSERT INTO todo_stats (owner_id, priority, complete, count) "
+    "VALUES (new.owner_id, coalesce(CAST(new.priority AS INTEGER), 0), coalesce(new.complete, 0), 1) "
+    "ON CONFLICT (owner_id, priority, complete) DO UPDATE SET count = count + 1; END",
+]
+
+MAX_ID = "SELECT max(coalesce((SELECT max(id) FROM todos), 0), coalesce((SELECT max(id) FROM archived_todos), 0))"
+
+
+def rebuild_todos(autoincrement: bool) -> None:
+    with op.batch_alter_table('todos', recreate='always', table_kwargs={'sqlite_autoincrement': autoincrement}):
+        pass
+    for statement in SQLITE_TRIGGERS:
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    # Ids handed out again before this migration: move the archived copy out of the way
+    reused = bind.execute(sa.text("SELECT id FROM archived_todos WHERE id IN (SELECT id FROM todos) ORDER BY id")).scalars().all()
+    next_id = bind.execute(sa.text(MAX_ID)).scalar() + 1
+    for new_id, old_id in enumerate(reused, start=next_id):
+        bind.execute(sa.text("UPDATE archived_todos SET id = :new_id WHERE id = :old_id"), {"new_id": new_id, "old_id": old_id})
+    rebuild_todos(autoincrement=True)
+    # The copy left the sequence at max(todos.id); archived ids must not come back either
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'todos'")
+    op.execute(f"INSERT INTO sqlite_sequence (name, seq) VALUES ('todos', ({MAX_ID}))")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    rebuild_todos(autoincrement=False)
@@ -0,0 +1,130 @@
+"""Hot/cold archival of completed todos.
+
+Todos completed more than ARCHIVE_AFTER_DAYS ago are moved from `todos`
+to `archived_todos` (on the same shard), so the hot table and its indexes
+only hold what the list, search and admin queries usually look for.
+Archived todos are listed by GET /todos/archived. They leave the search
+index and the todo_stats counts with the move.
+
+Each batch of ARCHIVE_BATCH_SIZE todos is one transaction: a DELETE ...
+RETURNING on todos and an INSERT of the same rows into archived_todos. An
+interrupted run leaves nothing half-moved and the next one carries on
+where it stopped; concurrent runs don't move a todo twice. Owners get a
+version bump (new ETags) and an `archived` event per batch.
+
+Run it from cron with:
+
+    python -m todoapp_fastapi.archive run [--older-than-days N] [--batch-size N]
+
+(use the name of the directory the app lives in), or let one process
+started with ARCHIVE_WORKER=true do it every ARCHIVE_INTERVAL_SECONDS. With DATABASE_SHARD_URLS set it archives
+every shard.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, insert, select
+
+from .config import get_settings
+from .database import dispose_engines, open_session
+from .etags import bump_todo_versions
+from .events import get_event_broker, todo_ids_by_owner
+from .models import ArchivedTodos, Todos
+from .shards import get_shard_map
+
+logger = logging.getLogger("uvicorn.error")
+
+ARCHIVED_COLUMNS = tuple(column for column in Todos.__table__.columns)
+
+
+async def archive_batch(db, cutoff: datetime, batch_size: int) -> tuple:
+    """Move up to `batch_size` todos completed before `cutoff` in the caller's transaction.
+
+    Returns ({owner_id: [todo ids]}, {owner_id: new version}).
+    """
+    oldest = (
+        select(Todos.id)
+        .where(Todos.completed_at < cutoff)
+        .order_by(Todos.completed_at)  # ix_todos_completed_at order, oldest first
+        .limit(batch_size)
+    )
+    rows = (await db.execute(
+        delete(Todos)
+        .where(Todos.id.in_(oldest))
+        .returning(*ARCHIVED_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )).all()
+    if not rows:
+        return {}, {}
+    archived_at = datetime.now(timezone.utc)
+    await db.execute(insert(ArchivedTodos), [{**row._asdict(), "archived_at": archived_at} for row in rows])
+    moved = todo_ids_by_owner(rows)
+    return moved, await bump_todo_versions(db, moved)
+
+
+async def archive_database(open_db, cutoff: datetime, batch_size: int) -> int:
+    """Archive batches from one database until none are left, returns the number of todos moved"""
+    archived = 0
+    while True:
+        async with open_db() as db:
+            moved, versions = await archive_batch(db, cutoff, batch_size)
+            await db.commit()
+        count = sum(len(todo_ids) for todo_ids in moved.values())
+        if count:
+            await get_event_broker().publish_changes(versions, "archived", moved)
+            archived += count
+        if count < batch_size:
+            return archived
+
+
+async def archive_completed(older_than_days: Optional[float] = None, batch_size: Optional[int] = None) -> int:
+    """Archive todos completed more than `older_than_days` (default ARCHIVE_AFTER_DAYS) ago on every shard"""
+    settings = get_settings()
+    days = settings.archive_after_days if older_than_days is None else older_than_days
+    batch_size = batch_size or settings.archive_batch_size
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    archived = 0
+    for url in get_shard_map().urls.values():
+        moved = await archive_database(lambda: open_session(url, "shard"), cutoff, batch_size)
+        if moved:
+            logger.info("Archived %d todos completed before %s", moved, cutoff.isoformat())
+        archived += moved
+    return archived
+
+
+async def run_archiver(interval: float) -> None:
+    """Background task: archive every `interval` seconds until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await archive_completed()
+        except Exception:
+            # Whatever was committed stays archived, the next run picks up the rest
+            logger.exception("Archiving completed todos failed, retrying in %ss", interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old completed todos into archived_todos")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    run_parser = subcommands.add_parser("run", help="archive every todo completed before the cutoff")
+    run_parser.add_argument("--older-than-days", type=float, help="defaults to ARCHIVE_AFTER_DAYS")
+    run_parser.add_argument("--batch-size", type=int, help="defaults to ARCHIVE_BATCH_SIZE")
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            return await archive_completed(args.older_than_days, args.batch_size)
+        finally:
+            if get_event_broker.cache_info().currsize:
+                await get_event_broker().close()
+            await dispose_engines()
+
+    logger.info("Archived %d todos", asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
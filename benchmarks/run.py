@@ -0,0 +1,390 @@
+"""Load-test / micro-benchmark suite for every router.
+
+Seeds a throwaway SQLite database, then drives each endpoint concurrently
+through an in-process ASGI client and reports throughput and p50/p95/p99
+latency per endpoint. Results are written as JSON; pass a previous result
+file as --baseline to fail the run on regressions.
+
+Run from the parent directory (the app uses relative imports):
+
+    python -m todoapp_fastapi.benchmarks.run --users 50 --todos-per-user 200 \\
+        --requests 500 --concurrency 32 --output bench.json
+    python -m todoapp_fastapi.benchmarks.run --baseline bench.json --output bench-new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Annotated, Callable, Optional
+
+import httpx
+from fastapi import Depends
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from ..database import Base, ThreadedSession, apply_sqlite_pragmas, get_db, get_read_db, to_async_url
+from ..hashing import get_crypt_context
+from ..main import app
+from ..shards import ShardSessions, get_shard_dbs, get_shard_read_dbs, get_todo_db, get_todo_read_db
+from ..models import Todos, Users
+from ..routers.auth import create_access_token, rate_limited_login_form
+
+PASSWORD = "benchmark-password"
+
+
+@dataclass
+class BenchState:
+    """Seeded data the scenarios draw from"""
+    users: list  # [(user_id, username, auth_headers)]
+    todo_ids: dict  # user_id -> todo ids that stay in place for reads/updates
+    deletable_ids: dict  # user_id -> todo ids reserved for delete scenarios
+    rng: random.Random
+    counter: int = 0
+    etags: dict = field(default_factory=dict)
+
+    def user(self):
+        return self.rng.choice(self.users)
+
+    def next_number(self) -> int:
+        self.counter += 1
+        return self.counter
+
+    def pop_deletable(self, count: int = 1):
+        # Pick a user that still has reserved todos left
+        for user_id, username, headers in self.rng.sample(self.users, len(self.users)):
+            ids = self.deletable_ids[user_id]
+            if len(ids) >= count:
+                return headers, [ids.pop() for _ in range(count)]
+        raise RuntimeError("Ran out of seeded todos to delete, seed more with --todos-per-user")
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    build: Callable[[BenchState], dict]  # returns httpx request kwargs (url, json, data, headers, params)
+    expected_status: tuple = (200,)
+    # Optional hook run with the response; gets the "context" value build() returned, if any
+    after: Optional[Callable[[BenchState, object, httpx.Response], None]] = None
+
+
+def todo_payload(state: BenchState) -> dict:
+    return {
+        "title": f"bench todo {state.next_number()}",
+        "description": "created by the benchmark",
+        "priority": state.rng.randint(1, 5),
+        "complete": False,
+    }
+
+
+def conditional_list(state: BenchState) -> dict:
+    # Replays the last ETag seen for the user, like a polling mobile client
+    user_id, _, headers = state.user()
+    etag = state.etags.get(user_id)
+    return {"url": "/", "headers": {**headers, "If-None-Match": etag} if etag else headers, "context": user_id}
+
+
+def remember_etag(state: BenchState, user_id, response: httpx.Response) -> None:
+    if "etag" in response.headers:
+        state.etags[user_id] = response.headers["etag"]
+
+
+def user_todo(state: BenchState):
+    user_id, _, headers = state.user()
+    return headers, state.rng.choice(state.todo_ids[user_id])
+
+
+SCENARIOS = [
+    Scenario("GET /healthy", "GET", lambda s: {"url": "/healthy"}),
+    # auth
+    Scenario("POST /auth/", "POST", lambda s: {"url": "/auth/", "json": {
+        "email": f"new{s.next_number()}@bench.test", "username": f"new-user-{s.counter}",
+        "first_name": "Bench", "last_name": "User", "password": PASSWORD,
+        "role": "user", "phone_number": "1234567890",
+    }}, (201,)),
+    Scenario("POST /auth/token", "POST", lambda s: {"url": "/auth/token", "data": {
+        "username": s.user()[1], "password": PASSWORD,
+    }}),
+    # todo
+    Scenario("GET /", "GET", lambda s: {"url": "/", "headers": s.user()[2]}),
+    Scenario("GET / (filtered)", "GET", lambda s: {"url": "/", "headers": s.user()[2], "params": {
+        "complete": "false", "priority": s.rng.randint(1, 5), "sort": "-priority", "limit": 20,
+    }}),
+    Scenario("GET / (If-None-Match)", "GET", conditional_list, (200, 304), after=remember_etag),
+    Scenario("GET /todos/{id}", "GET", lambda s: (lambda headers, todo_id: {
+        "url": f"/todos/{todo_id}", "headers": headers,
+    })(*user_todo(s))),
+    Scenario("POST /todos", "POST", lambda s: {"url": "/todos", "headers": s.user()[2], "json": todo_payload(s)}),
+    Scenario("PUT /todos/{id}", "PUT", lambda s: (lambda headers, todo_id: {
+        "url": f"/todos/{todo_id}", "headers": headers, "json": todo_payload(s),
+    })(*user_todo(s))),
+    Scenario("DELETE /todos/{id}", "DELETE", lambda s: (lambda headers, ids: {
+        "url": f"/todos/{ids[0]}", "headers": headers,
+    })(*s.pop_deletable())),
+    Scenario("POST /todos/bulk", "POST", lambda s: {
+        "url": "/todos/bulk", "headers": s.user()[2], "json": [todo_payload(s) for _ in range(50)],
+    }),
+    Scenario("PUT /todos/bulk", "PUT", lambda s: (lambda user: {
+        "url": "/todos/bulk", "headers": user[2],
+        "json": [{**todo_payload(s), "id": todo_id} for todo_id in s.rng.sample(s.todo_ids[user[0]], min(20, len(s.todo_ids[user[0]])))],
+    })(s.user())),
+    Scenario("POST /todos/bulk/complete", "POST", lambda s: (lambda user: {
+        "url": "/todos/bulk/complete", "headers": user[2],
+        "json": s.rng.sample(s.todo_ids[user[0]], min(20, len(s.todo_ids[user[0]]))),
+    })(s.user())),
+    Scenario("POST /todos/bulk/delete", "POST", lambda s: (lambda headers, ids: {
+        "url": "/todos/bulk/delete", "headers": headers, "json": ids,
+    })(*s.pop_deletable(5))),
+    # admin
+    Scenario("GET /admin/todo", "GET", lambda s: {"url": "/admin/todo", "headers": s.user()[2], "params": {"limit": 100}}),
+    Scenario("DELETE /admin/todo/{id}", "DELETE", lambda s: (lambda headers, ids: {
+        "url": f"/admin/todo/{ids[0]}", "headers": headers,
+    })(*s.pop_deletable())),
+    Scenario("POST /admin/todo/bulk/delete", "POST", lambda s: (lambda headers, ids: {
+        "url": "/admin/todo/bulk/delete", "headers": headers, "json": ids,
+    })(*s.pop_deletable(5))),
+    Scenario("GET /admin/hash-pool", "GET", lambda s: {"url": "/admin/hash-pool", "headers": s.user()[2]}),
+    Scenario("GET /admin/token-cache", "GET", lambda s: {"url": "/admin/token-cache", "headers": s.user()[2]}),
+    # users
+    Scenario("GET /user/", "GET", lambda s: {"url": "/user/", "headers": s.user()[2]}),
+    Scenario("PUT /user/password", "PUT", lambda s: {"url": "/user/password", "headers": s.user()[2], "json": {
+        "password": PASSWORD, "new_password": PASSWORD,
+    }}, (204,)),
+    Scenario("PUT /user/phone_number", "PUT", lambda s: {"url": "/user/phone_number", "headers": s.user()[2], "json": {
+        "phone_number": f"{s.rng.randrange(10**9, 10**10)}",
+    }}, (204,)),
+]
+
+# Scenarios that consume reserved todos, used to size the seed
+DELETES_PER_REQUEST = {
+    "DELETE /todos/{id}": 1,
+    "POST /todos/bulk/delete": 5,
+    "DELETE /admin/todo/{id}": 1,
+    "POST /admin/todo/bulk/delete": 5,
+}
+
+
+def seed_database(url: str, users: int, todos_per_user: int, deletable_per_user: int, rng: random.Random) -> BenchState:
+    seed_engine = create_engine(url)
+    Base.metadata.create_all(bind=seed_engine)
+    hashed_password = get_crypt_context().hash(PASSWORD)  # Hash once, every seeded user shares it
+    state_users = []
+    with seed_engine.begin() as connection:
+        connection.execute(insert(Users), [{
+            "id": user_id, "email": f"user{user_id}@bench.test", "username": f"user{user_id}",
+            "first_name": "Bench", "last_name": str(user_id), "hashed_password": hashed_password,
+            "is_active": True, "role": "admin", "phone_number": "1234567890",
+        } for user_id in range(1, users + 1)])
+        todo_ids, deletable_ids = {}, {}
+        for user_id in range(1, users + 1):
+            rows = [{
+                "title": f"seeded {n}", "description": "seeded by the benchmark",
+                "priority": rng.randint(1, 5), "complete": rng.random() < 0.3, "owner_id": user_id,
+            } for n in range(todos_per_user + deletable_per_user)]
+            ids = connection.execute(insert(Todos).returning(Todos.id, sort_by_parameter_order=True), rows).scalars().all()
+            todo_ids[user_id] = ids[:todos_per_user]
+            deletable_ids[user_id] = ids[todos_per_user:]
+            token = create_access_token(f"user{user_id}", user_id, "admin", timedelta(hours=2))
+            token = token.decode() if isinstance(token, bytes) else token
+            state_users.append((user_id, f"user{user_id}", {"Authorization": f"Bearer {token}"}))
+    seed_engine.dispose()
+    return BenchState(users=state_users, todo_ids=todo_ids, deletable_ids=deletable_ids, rng=rng)
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(ordered) if ordered else 0.0,
+        "p50_ms": percentile(ordered, 0.50),
+        "p95_ms": percentile(ordered, 0.95),
+        "p99_ms": percentile(ordered, 0.99),
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, state: BenchState, requests: int, concurrency: int) -> dict:
+    latencies, errors = [], 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            kwargs = scenario.build(state)
+            context = kwargs.pop("context", None)
+            started = time.perf_counter()
+            response = await client.request(scenario.method, **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code not in scenario.expected_status:
+                errors += 1
+            if scenario.after is not None:
+                scenario.after(state, context, response)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def bench_login_form(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> OAuth2PasswordRequestForm:
+    return form_data
+
+
+async def run_benchmark(users: int = 10, todos_per_user: int = 100, requests: int = 200, concurrency: int = 16,
+                        use_async: bool = False, db_path: Optional[str] = None, only: Optional[list] = None,
+                        seed: int = 1234) -> dict:
+    """Seed a database, run every scenario against the app and return the results document"""
+    scenarios = [scenario for scenario in SCENARIOS if not only or scenario.name in only]
+    deletable_per_user = sum(
+        DELETES_PER_REQUEST.get(scenario.name, 0) for scenario in scenarios
+    ) * requests // users + 5
+
+    workdir = None
+    if db_path is None:
+        workdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(workdir.name, "bench.db")
+    url = f"sqlite:///{db_path}"
+    state = seed_database(url, users, todos_per_user, deletable_per_user, random.Random(seed))
+
+    # Point the app at the benchmark database through get_db, the same way the tests do,
+    # so the run never depends on (or touches) the configured DATABASE_URL
+    if use_async:
+        bench_engine = create_async_engine(to_async_url(url))
+        apply_sqlite_pragmas(bench_engine.sync_engine)
+        BenchSessionLocal = async_sessionmaker(bench_engine, autoflush=False, expire_on_commit=False)
+
+        async def bench_get_db():
+            async with BenchSessionLocal() as db:
+                yield db
+    else:
+        bench_engine = create_engine(url, connect_args={"check_same_thread": False})
+        apply_sqlite_pragmas(bench_engine)
+        BenchSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=bench_engine)
+
+        async def bench_get_db():
+            db = ThreadedSession(BenchSessionLocal())
+            try:
+                yield db
+            finally:
+                await db.close()
+
+    saved_overrides = dict(app.dependency_overrides)
+    app.dependency_overrides.clear()  # Real auth, no test stand-ins
+    async def bench_get_shard_dbs():
+        async for db in bench_get_db():
+            yield ShardSessions(primary=db)
+
+    for dependency in (get_db, get_read_db, get_todo_db, get_todo_read_db):
+        app.dependency_overrides[dependency] = bench_get_db
+    for dependency in (get_shard_dbs, get_shard_read_dbs):
+        app.dependency_overrides[dependency] = bench_get_shard_dbs
+    # Every login comes from one client: measure bcrypt, not the rate limiter
+    app.dependency_overrides[rate_limited_login_form] = bench_login_form
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for scenario in scenarios:
+                results[scenario.name] = await run_scenario(client, scenario, state, requests, concurrency)
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(saved_overrides)
+        if use_async:
+            await bench_engine.dispose()
+        else:
+            bench_engine.dispose()
+        if workdir is not None:
+            workdir.cleanup()
+
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "users": users,
+            "todos_per_user": todos_per_user,
+            "requests_per_endpoint": requests,
+            "concurrency": concurrency,
+            "db_async": use_async,
+        },
+        "endpoints": results,
+    }
+
+
+def compare(baseline: dict, current: dict, max_regression: float) -> list:
+    """List regressions: p95 latency up, or throughput down, by more than `max_regression` (a fraction)"""
+    regressions = []
+    for name, now in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if before is None:
+            continue
+        if before["p95_ms"] and now["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f}ms -> {now['p95_ms']:.2f}ms")
+        if before["throughput_rps"] and now["throughput_rps"] < before["throughput_rps"] * (1 - max_regression):
+            regressions.append(f"{name}: throughput {before['throughput_rps']:.1f} -> {now['throughput_rps']:.1f} req/s")
+        if now["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {now['errors']}")
+    return regressions
+
+
+def print_table(document: dict) -> None:
+    print(f"{'endpoint':34} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for name, stats in document["endpoints"].items():
+        print(f"{name:34} {stats['throughput_rps']:9.1f} {stats['p50_ms']:8.2f} "
+              f"{stats['p95_ms']:8.2f} {stats['p99_ms']:8.2f} {stats['errors']:6d}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--todos-per-user", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--async", dest="use_async", action="store_true", help="use the AsyncSession path")
+    parser.add_argument("--db", help="SQLite file to seed (default: a temporary file)")
+    parser.add_argument("--only", action="append", help="run only this endpoint (repeatable)")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.20,
+                        help="allowed p95/throughput change before failing (fraction, default 0.20)")
+    args = parser.parse_args(argv)
+
+    document = asyncio.run(run_benchmark(
+        users=args.users, todos_per_user=args.todos_per_user, requests=args.requests,
+        concurrency=args.concurrency, use_async=args.use_async, db_path=args.db, only=args.only,
+    ))
+    print_table(document)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(document, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(json.load(baseline_file), document, args.max_regression)
+        if regressions:
+            print("\nRegressions against baseline:", *regressions, sep="\n  ")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Runtime configuration read from the environment (and .env)"""
+    database_url: str
+    database_replica_urls: tuple  # read replicas for read-only handlers, empty means everything uses the primary
+    read_your_writes_seconds: float  # after a write, the user's reads stay on the primary this long
+    database_shard_urls: tuple  # "name=url" entries holding the todo tables, sharded by owner_id (empty: all on database_url)
+    secret_key: str  # signs the JWT access tokens
+    access_token_expire_minutes: int
+    run_migrations_on_startup: bool  # single-process deployments only; otherwise run `python -m <package>.migrate` once before the workers
+    db_async: bool  # True: AsyncEngine/AsyncSession, False: blocking Session run on the threadpool
+    db_pool_size: int  # connections kept open per worker
+    db_max_overflow: int  # extra connections allowed above pool_size under bursts
+    db_pool_timeout: float  # seconds to wait for a free connection before erroring
+    db_pool_pre_ping: bool  # test connections on checkout, drops ones the server closed
+    db_pool_recycle: int  # seconds after which a connection is replaced (-1 never)
+    sqlite_journal_mode: str  # WAL lets readers run while a writer commits
+    sqlite_synchronous: str  # NORMAL is safe with WAL and skips an fsync per commit
+    sqlite_busy_timeout_ms: int  # wait this long for the write lock instead of failing "database is locked"
+    sqlite_mmap_size: int  # bytes of the database file memory-mapped for reads
+    sqlite_cache_size: int  # page cache, negative values are KiB (SQLite convention)
+    db_slow_query_ms: float  # statements slower than this are logged and counted
+    password_schemes: tuple  # passlib schemes, the first hashes new passwords; hashes in the others are upgraded on login
+    bcrypt_rounds: int  # bcrypt work factor (log2 iterations); hashes at another cost are redone on login
+    hash_pool_workers: int  # bcrypt workers, roughly one per core
+    hash_pool_max_queue: int  # hash jobs allowed to wait for a worker before we answer 503
+    hash_pool_processes: bool  # process pool instead of threads (bcrypt releases the GIL, so threads usually suffice)
+    hash_pool_retry_after: int  # seconds sent in Retry-After when the pool is saturated
+    token_cache_size: int  # verified bearer tokens kept in memory (0 disables the cache)
+    token_cache_ttl: float  # seconds a verified token is trusted before it is decoded again
+    events_backend: str  # "local" (one worker) or "redis" (pub/sub shared by every worker)
+    events_redis_url: str
+    events_queue_size: int  # events buffered per stream before a slow client gets a reset
+    events_replay_size: int  # recent events kept per owner for Last-Event-ID resume
+    events_heartbeat: float  # seconds between keep-alive comments on an idle stream
+    idempotency_backend: str  # "local" (one worker) or "redis" (stored responses shared by every worker)
+    idempotency_redis_url: str
+    idempotency_ttl: float  # seconds a response is replayed for repeats of its Idempotency-Key
+    idempotency_max_keys: int  # stored responses kept in memory by the local backend
+    idempotency_wait: float  # seconds a repeat waits for the first request still running on another worker
+    write_batch_window_ms: float  # group commit: todo writes arriving this close together share one transaction (0 disables)
+    write_batch_max_ops: int  # a batch is committed as soon as it holds this many writes
+    archive_after_days: float  # completed todos older than this are moved to archived_todos
+    archive_batch_size: int  # todos moved per transaction
+    archive_interval_seconds: float  # how often the archive worker runs the archival job (0: only via the CLI)
+    archive_worker: bool  # this process runs the archival job every archive_interval_seconds (enable on one process only)
+    login_rate_limit_backend: str  # "local" (buckets per worker) or "redis" (shared by every worker)
+    login_rate_limit_redis_url: str
+    login_rate_limit_max_keys: int  # buckets kept in memory by the local backend, least recently used evicted
+    login_rate_limit_ip_burst: float  # login attempts a client IP may make back to back (0 disables)
+    login_rate_limit_ip_per_minute: float  # rate the IP bucket refills at
+    login_rate_limit_user_burst: float  # login attempts against one username back to back (0 disables)
+    login_rate_limit_user_per_minute: float
+    profiling_enabled: bool  # admins may profile a request with an X-Profile header (off by default)
+    profile_ring_size: int  # request profiles kept in memory per worker for /admin/profiles
+    profile_interval_ms: float  # stack sampling interval of profiled requests
+    profile_sample_rate: float  # share of all requests sampled into the per-route hot stacks (0 disables)
+
+
+@lru_cache
+def get_settings() -> Settings:
+    load_dotenv()
+    hash_pool_workers = int(os.getenv("HASH_POOL_WORKERS", os.cpu_count() or 1))
+    return Settings(
+        database_url=os.getenv("DATABASE_URL", "sqlite:///./todosapp.db"),
+        database_replica_urls=tuple(url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()),
+        read_your_writes_seconds=float(os.getenv("READ_YOUR_WRITES_SECONDS", 5)),
+        database_shard_urls=tuple(url.strip() for url in os.getenv("DATABASE_SHARD_URLS", "").split(",") if url.strip()),
+        secret_key=os.getenv("SECRET_KEY"),
+        access_token_expire_minutes=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30)),
+        run_migrations_on_startup=env_bool("RUN_MIGRATIONS_ON_STARTUP", False),
+        db_async=env_bool("DB_ASYNC", False),
+        db_pool_size=int(os.getenv("DB_POOL_SIZE", 5)),
+        db_max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        db_pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        db_pool_pre_ping=env_bool("DB_POOL_PRE_PING", True),
+        db_pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        sqlite_journal_mode=os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+        sqlite_synchronous=os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        sqlite_busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+        sqlite_mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+        sqlite_cache_size=int(os.getenv("SQLITE_CACHE_SIZE", -64000)),
+        db_slow_query_ms=float(os.getenv("DB_SLOW_QUERY_MS", 200)),
+        password_schemes=tuple(scheme.strip() for scheme in os.getenv("PASSWORD_SCHEMES", "bcrypt").split(",") if scheme.strip()),
+        bcrypt_rounds=int(os.getenv("BCRYPT_ROUNDS", 12)),
+        hash_pool_workers=hash_pool_workers,
+        hash_pool_max_queue=int(os.getenv("HASH_POOL_MAX_QUEUE", hash_pool_workers * 4)),
+        hash_pool_processes=env_bool("HASH_POOL_PROCESSES", False),
+        hash_pool_retry_after=int(os.getenv("HASH_POOL_RETRY_AFTER", 1)),
+        token_cache_size=int(os.getenv("TOKEN_CACHE_SIZE", 10000)),
+        token_cache_ttl=float(os.getenv("TOKEN_CACHE_TTL", 60)),
+        events_backend=os.getenv("EVENTS_BACKEND", "local"),
+        events_redis_url=os.getenv("EVENTS_REDIS_URL", "redis://localhost:6379/0"),
+        events_queue_size=int(os.getenv("EVENTS_QUEUE_SIZE", 100)),
+        events_replay_size=int(os.getenv("EVENTS_REPLAY_SIZE", 100)),
+        events_heartbeat=float(os.getenv("EVENTS_HEARTBEAT", 15)),
+        idempotency_backend=os.getenv("IDEMPOTENCY_BACKEND", "local"),
+        idempotency_redis_url=os.getenv("IDEMPOTENCY_REDIS_URL", "redis://localhost:6379/0"),
+        idempotency_ttl=float(os.getenv("IDEMPOTENCY_TTL", 86400)),
+        idempotency_max_keys=int(os.getenv("IDEMPOTENCY_MAX_KEYS", 10000)),
+        idempotency_wait=float(os.getenv("IDEMPOTENCY_WAIT", 30)),
+        write_batch_window_ms=float(os.getenv("WRITE_BATCH_WINDOW_MS", 0)),
+        write_batch_max_ops=int(os.getenv("WRITE_BATCH_MAX_OPS", 64)),
+        archive_after_days=float(os.getenv("ARCHIVE_AFTER_DAYS", 30)),
+        archive_batch_size=int(os.getenv("ARCHIVE_BATCH_SIZE", 1000)),
+        archive_interval_seconds=float(os.getenv("ARCHIVE_INTERVAL_SECONDS", 0)),
+        archive_worker=env_bool("ARCHIVE_WORKER", False),
+        login_rate_limit_backend=os.getenv("LOGIN_RATE_LIMIT_BACKEND", "local"),
+        login_rate_limit_redis_url=os.getenv("LOGIN_RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0"),
+        login_rate_limit_max_keys=int(os.getenv("LOGIN_RATE_LIMIT_MAX_KEYS", 100000)),
+        login_rate_limit_ip_burst=float(os.getenv("LOGIN_RATE_LIMIT_IP_BURST", 20)),
+        login_rate_limit_ip_per_minute=float(os.getenv("LOGIN_RATE_LIMIT_IP_PER_MINUTE", 60)),
+        login_rate_limit_user_burst=float(os.getenv("LOGIN_RATE_LIMIT_USER_BURST", 5)),
+        login_rate_limit_user_per_minute=float(os.getenv("LOGIN_RATE_LIMIT_USER_PER_MINUTE", 5)),
+        profiling_enabled=env_bool("PROFILING_ENABLED", False),
+        profile_ring_size=int(os.getenv("PROFILE_RING_SIZE", 50)),
+        profile_interval_ms=float(os.getenv("PROFILE_INTERVAL_MS", 5)),
+        profile_sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 0)),
+    )
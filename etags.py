@@ -0,0 +1,50 @@
+import hashlib
+from typing import Iterable, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from starlette import status
+
+from .models import TodoVersions
+
+
+async def get_todo_version(db, owner_id: int) -> int:
+    """Current todo version of an owner, 0 until their first write"""
+    version = await db.scalar(select(TodoVersions.version).where(TodoVersions.owner_id == owner_id))
+    return version or 0
+
+
+async def bump_todo_versions(db, owner_ids: Iterable[int]) -> dict:
+    """Increment the version of every given owner inside the caller's transaction, returns {owner_id: new version}"""
+    rows = [{"owner_id": owner_id, "version": 1} for owner_id in sorted(set(owner_ids))]
+    if not rows:
+        return {}
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(TodoVersions).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TodoVersions.owner_id],
+        set_={"version": TodoVersions.version + 1},
+    )
+    result = await db.execute(stmt.returning(TodoVersions.owner_id, TodoVersions.version))
+    return {row.owner_id: row.version for row in result}
+
+
+def make_etag(owner_id: int, version: int, *parts) -> str:
+    # Strong validator: same owner version + same request shape means byte-identical body
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:16]
+    return f'"{owner_id}-{version}-{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match: Optional[str] = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return etag in candidates
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
@@ -0,0 +1,241 @@
+"""Todo change feed behind GET /todos/events.
+
+Write handlers publish one event per owner and committed transaction. The
+event id is the owner's todo version after the write (see etags.py), so ids
+are contiguous per owner, shared by every worker and survive restarts. A
+subscriber that sees a jump in ids, or falls too far behind, gets a `reset`
+event telling it to reload instead of silently missing changes.
+
+Backends carry events between workers: `LocalBackend` delivers in-process
+(single worker, tests), `RedisBackend` fans out over Redis pub/sub.
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from .cache import TTLCache
+from .config import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+REPLAY_OWNERS = 10000  # Owners whose recent events are kept for Last-Event-ID resume
+REPLAY_TTL = 3600  # Seconds an idle owner's replay buffer is kept
+REDIS_CHANNEL = "todo-events"
+
+
+@dataclass
+class TodoEvent:
+    owner_id: int
+    id: int  # Owner's todo version after the write
+    type: str  # created, updated, deleted, archived or reset
+    todo_ids: list = field(default_factory=list)
+
+    def to_sse(self) -> str:
+        data = json.dumps({"type": self.type, "todo_ids": self.todo_ids}, separators=(",", ":"))
+        return f"id: {self.id}\nevent: {self.type}\ndata: {data}\n\n"
+
+
+class Subscription:
+    """One stream's bounded queue. A full queue is replaced by a single reset
+    event, so a slow client costs at most `queue_size` events of memory and
+    never slows down publishers."""
+
+    def __init__(self, owner_id: int, last_event_id: int, queue_size: int):
+        self.owner_id = owner_id
+        self.last_event_id = last_event_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflows = 0
+
+    def offer(self, event: TodoEvent) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflows += 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(TodoEvent(self.owner_id, event.id, "reset"))
+
+    async def next_event(self, timeout: float) -> Optional[TodoEvent]:
+        """Next event to send (None on timeout), turning id gaps into a reset"""
+        try:
+            event = self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            try:
+                event = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        if event.type != "reset":
+            if event.id <= self.last_event_id:
+                return await self.next_event(timeout)  # Already sent (replayed, or arrived out of order)
+            if event.id > self.last_event_id + 1:
+                event = TodoEvent(self.owner_id, event.id, "reset")  # Missed one, e.g. published by another worker
+        self.last_event_id = event.id
+        return event
+
+
+class LocalBackend:
+    """Delivers events to this process only"""
+
+    def __init__(self):
+        self.deliver = None
+
+    async def publish(self, event: TodoEvent) -> None:
+        self.deliver(event)
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisBackend:
+    """Fans events out to every worker through Redis pub/sub (`pip install redis`)"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis  # Optional dependency, only needed with EVENTS_BACKEND=redis
+
+        self.client = redis.from_url(url)
+        self.deliver = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def publish(self, event: TodoEvent) -> None:
+        if self._listener is None:
+            self.start()
+        await self.client.publish(REDIS_CHANNEL, json.dumps(asdict(event)))
+
+    def start(self) -> None:
+        if self._listener is None:
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self) -> None:
+        pubsub = self.client.pubsub()
+        try:
+            await pubsub.subscribe(REDIS_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self.deliver(TodoEvent(**json.loads(message["data"])))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Subscribers see the missed ids as a gap (reset) once events flow again
+            logger.exception("Redis event listener stopped, restarting on next publish")
+            self._listener = None
+        finally:
+            await pubsub.aclose()
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        await self.client.aclose()
+
+
+class EventBroker:
+    """Routes published events to the subscriptions of their owner and keeps
+    the last `replay_size` events per owner for resuming streams"""
+
+    def __init__(self, backend, queue_size: int, replay_size: int):
+        self.backend = backend
+        self.backend.deliver = self.dispatch
+        self.queue_size = queue_size
+        self.replay_size = replay_size
+        self._subscriptions: dict = {}  # owner_id -> set of Subscription
+        self._replay = TTLCache(maxsize=REPLAY_OWNERS, ttl=REPLAY_TTL)
+        self.published = 0
+        self.overflows = 0
+
+    async def publish(self, event: TodoEvent) -> None:
+        self.published += 1
+        await self.backend.publish(event)
+
+    async def publish_changes(self, versions: dict, event_type: str, todo_ids_by_owner: dict) -> None:
+        """Publish one event per owner after the write that produced `versions` has committed"""
+        for owner_id, version in versions.items():
+            await self.publish(TodoEvent(owner_id, version, event_type, sorted(todo_ids_by_owner.get(owner_id, []))))
+
+    def dispatch(self, event: TodoEvent) -> None:
+        buffer = self._replay.get(event.owner_id)
+        if buffer is None:
+            buffer = deque(maxlen=self.replay_size)
+        buffer.append(event)
+        self._replay.set(event.owner_id, buffer)
+        for subscription in list(self._subscriptions.get(event.owner_id, ())):
+            before = subscription.overflows
+            subscription.offer(event)
+            self.overflows += subscription.overflows - before
+
+    def subscribe(self, owner_id: int, last_event_id: Optional[int], current_version: int) -> Subscription:
+        """Register a stream, queueing the events it missed since `last_event_id` (or a reset).
+
+        `current_version` is the owner's version read just before subscribing;
+        without a Last-Event-ID the stream starts from there.
+        """
+        if isinstance(self.backend, RedisBackend):
+            self.backend.start()
+        last = current_version if last_event_id is None else last_event_id
+        subscription = Subscription(owner_id, last, self.queue_size)
+        missed = [event for event in self._replay.get(owner_id, ()) if event.id > last]
+        replayable = (
+            bool(missed) and missed[0].id == last + 1 and missed[-1].id >= current_version
+            and len(missed) <= self.queue_size
+        )
+        if last < current_version and not replayable:
+            # Older than the replay buffer (or missed by this worker): the client must reload
+            subscription.offer(TodoEvent(owner_id, current_version, "reset"))
+            missed = [event for event in missed if event.id > current_version]
+        for event in missed:
+            subscription.offer(event)
+        self._subscriptions.setdefault(owner_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.owner_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.owner_id]
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "subscribers": sum(len(subscriptions) for subscriptions in self._subscriptions.values()),
+            "published": self.published,
+            "overflows": self.overflows,
+        }
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+async def event_stream(request, broker: EventBroker, subscription: Subscription, heartbeat: float):
+    """Server-sent events for one subscription until the client disconnects"""
+    try:
+        yield f"retry: 3000\nid: {subscription.last_event_id}\nevent: ready\ndata: {{}}\n\n"
+        while not await request.is_disconnected():
+            event = await subscription.next_event(timeout=heartbeat)
+            # A comment line keeps proxies from closing an idle stream
+            yield ": ping\n\n" if event is None else event.to_sse()
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def todo_ids_by_owner(rows: Iterable) -> dict:
+    """{owner_id: [todo ids]} from rows with `id` and `owner_id`"""
+    grouped: dict = {}
+    for row in rows:
+        grouped.setdefault(row.owner_id, []).append(row.id)
+    return grouped
+
+
+@lru_cache
+def get_event_broker() -> EventBroker:
+    settings = get_settings()
+    if settings.events_backend == "redis":
+        backend = RedisBackend(settings.events_redis_url)
+    elif settings.events_backend == "local":
+        backend = LocalBackend()
+    else:
+        raise ValueError(f"Unknown EVENTS_BACKEND '{settings.events_backend}', expected 'local' or 'redis'")
+    return EventBroker(backend, queue_size=settings.events_queue_size, replay_size=settings.events_replay_size)
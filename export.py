@@ -0,0 +1,111 @@
+"""Streaming NDJSON and CSV export of todos.
+
+The list endpoints build a whole page in memory before sending it, fine
+for a page but not for "everything". An export instead reads rows through
+a server-side cursor (`yield_per`), EXPORT_BATCH_SIZE at a time, encodes
+each batch and hands it to the client before fetching the next, so a
+worker's memory stays flat whether the export has ten rows or ten million.
+With `Accept-Encoding: gzip` the stream is compressed as it goes.
+
+The export reads on its own session (on the same database as the
+request's), which is closed when the stream ends or the client goes away.
+"""
+import csv
+import io
+import zlib
+from enum import Enum
+
+import orjson
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from .database import ThreadedSession, session_like
+
+EXPORT_BATCH_SIZE = 1000  # Rows per fetch from the cursor, and per chunk sent
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {ExportFormat.ndjson: "application/x-ndjson", ExportFormat.csv: "text/csv; charset=utf-8"}
+
+
+async def stream_rows(db, stmt, batch_size: int = EXPORT_BATCH_SIZE):
+    """Yield the rows of `stmt` in batches, without ever holding more than one batch"""
+    session = session_like(db)
+    try:
+        if isinstance(session, ThreadedSession):
+            # Not ThreadedSession.execute: it buffers the whole result
+            result = await run_in_threadpool(
+                session.sync_session.execute, stmt.execution_options(yield_per=batch_size)
+            )
+            partitions = result.partitions()
+            while (batch := await run_in_threadpool(next, partitions, None)) is not None:
+                yield batch
+        else:
+            result = await session.stream(stmt.execution_options(yield_per=batch_size))
+            async for batch in result.partitions():
+                yield batch
+    finally:
+        await session.close()
+
+
+def encode_ndjson(batch) -> bytes:
+    return b"".join(orjson.dumps(row._asdict()) + b"\n" for row in batch)
+
+
+def encode_csv(batch) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(batch)
+    return buffer.getvalue().encode()
+
+
+def accepts_gzip(request: Request) -> bool:
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() not in ("gzip", "*"):
+            continue
+        quality = params.strip().lower()
+        if not quality.startswith("q="):
+            return True
+        try:
+            return float(quality[2:]) > 0  # q=0 means "not gzip"
+        except ValueError:
+            return False
+    return False
+
+
+async def export_chunks(sources, columns: list, export_format: ExportFormat, gzip: bool):
+    """Encoded (and compressed) chunks of every (session, statement) in `sources`, one after the other"""
+    compressor = zlib.compressobj(wbits=31) if gzip else None  # wbits=31: gzip container
+
+    def pack(data: bytes) -> bytes:
+        # A sync flush per batch sends each batch right away instead of whenever zlib's buffer fills
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH) if compressor else data
+
+    if export_format is ExportFormat.csv:
+        yield pack(encode_csv([columns]))
+    encode = encode_csv if export_format is ExportFormat.csv else encode_ndjson
+    for db, stmt in sources:
+        async for batch in stream_rows(db, stmt):
+            yield pack(encode(batch))
+    if compressor:
+        yield compressor.flush()
+
+
+def export_response(request: Request, sources, columns: list, export_format: ExportFormat, filename: str) -> StreamingResponse:
+    gzip = accepts_gzip(request)
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}.{export_format.value}"',
+        "Vary": "Accept-Encoding",
+    }
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_chunks(sources, columns, export_format, gzip),
+        media_type=MEDIA_TYPES[export_format],
+        headers=headers,
+    )
@@ -0,0 +1,167 @@
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from starlette import status
+
+from .config import get_settings
+
+
+@lru_cache
+def get_crypt_context() -> CryptContext:
+    # Password hashing context, built once per process on first use. New hashes
+    # use the first of PASSWORD_SCHEMES (bcrypt at BCRYPT_ROUNDS); hashes in any
+    # other scheme or at another cost report needs_update and are redone on login
+    settings = get_settings()
+    options = {"bcrypt__rounds": settings.bcrypt_rounds} if "bcrypt" in settings.password_schemes else {}
+    return CryptContext(schemes=list(settings.password_schemes), deprecated="auto", **options)
+
+
+# Module level so they can be pickled into a process pool
+def _hash(password: str) -> str:
+    return get_crypt_context().hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return get_crypt_context().verify(password, hashed_password)
+
+
+def _verify_needs_update(password: str, hashed_password: str) -> tuple:
+    # verify_and_update without the rehash: that is a second full hash, left to the caller to run off the request path
+    context = get_crypt_context()
+    if not context.verify(password, hashed_password):
+        return False, False
+    return True, context.needs_update(hashed_password)
+
+
+def hash_cost(hashed_password: str) -> tuple:
+    """(scheme, rounds) of a stored hash, ("unknown", None) if no configured scheme recognises it"""
+    context = get_crypt_context()
+    scheme = context.identify(hashed_password)
+    if scheme is None:
+        return "unknown", None
+    return scheme, getattr(context.handler(scheme).from_string(hashed_password), "rounds", None)
+
+
+def hash_cost_report(hashed_passwords) -> dict:
+    """How many stored hashes use each scheme and cost, and which of those get rehashed on the next login"""
+    context = get_crypt_context()
+    groups = {}  # (scheme, rounds) -> [count, one hash of the group]
+    for hashed_password in hashed_passwords:
+        try:
+            key = hash_cost(hashed_password)
+        except ValueError:  # Recognised prefix but malformed
+            key = ("unknown", None)
+        group = groups.setdefault(key, [0, hashed_password])
+        group[0] += 1
+    costs = []
+    for (scheme, rounds), (count, sample) in sorted(groups.items(), key=lambda item: (item[0][0], item[0][1] or 0)):
+        outdated = scheme == "unknown" or context.needs_update(sample)  # Same scheme and cost, same answer
+        costs.append({"scheme": scheme, "rounds": rounds, "count": count, "needs_update": outdated})
+    default_scheme = context.default_scheme()
+    return {
+        "target": {"scheme": default_scheme, "rounds": get_settings().bcrypt_rounds if default_scheme == "bcrypt" else None},
+        "total": sum(cost["count"] for cost in costs),
+        "needs_update": sum(cost["count"] for cost in costs if cost["needs_update"]),
+        "costs": costs,
+    }
+
+
+class HashPoolBusy(HTTPException):
+    """Raised instead of queueing when every worker and queue slot is taken"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded worker pool so it never blocks the event loop.
+
+    At most `workers + max_queue` jobs are admitted at once; anything beyond
+    that is shed with a 503 right away rather than piling up behind a burst.
+    """
+
+    def __init__(self, workers: int, max_queue: int, use_processes: bool = False, retry_after: int = 1):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.use_processes = use_processes
+        self.retry_after = retry_after
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def _get_executor(self):
+        # Created on first use so importing the app never spawns workers
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+                    self._executor = executor_class(max_workers=self.workers)
+        return self._executor
+
+    async def _submit(self, fn, *args):
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                self._rejected += 1
+                raise HashPoolBusy(self.retry_after)
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._submit(_verify, password, hashed_password)
+
+    async def verify_needs_update(self, password: str, hashed_password: str) -> tuple:
+        """(password matches, stored hash should be redone with the current scheme/cost)"""
+        return await self._submit(_verify_needs_update, password, hashed_password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = self._in_flight
+            return {
+                "mode": "process" if self.use_processes else "thread",
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": in_flight,
+                "busy_workers": min(in_flight, self.workers),
+                "queued": max(0, in_flight - self.workers),
+                "saturation": in_flight / (self.workers + self.max_queue),
+                "peak_in_flight": self._peak_in_flight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+@lru_cache
+def get_password_hasher() -> PasswordHasher:
+    settings = get_settings()
+    return PasswordHasher(
+        workers=settings.hash_pool_workers,
+        max_queue=settings.hash_pool_max_queue,
+        use_processes=settings.hash_pool_processes,
+        retry_after=settings.hash_pool_retry_after,
+    )
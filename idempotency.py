@@ -0,0 +1,215 @@
+"""Idempotency-Key support for the create endpoints.
+
+A client that retries a POST after a timeout sends the same Idempotency-Key
+header; the first successful response is stored for IDEMPOTENCY_TTL
+seconds and every repeat is answered from the store (with
+`Idempotency-Replayed: true`) instead of inserting a duplicate or hashing
+the password again. Repeats that arrive while the first request is still
+running wait for its result rather than running it a second time.
+
+Keys are scoped per endpoint and per user (per username for signups). Reusing a
+key with a different body is a client bug and gets 422. Failed requests
+are not stored, so the retry runs again.
+
+Backends hold the stored responses: `LocalIdempotencyBackend` keeps them
+in this process (single worker, tests), `RedisIdempotencyBackend` shares
+them, and the in-flight claims, between workers.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from starlette import status
+
+from .cache import TTLCache
+from .config import get_settings
+
+REDIS_PREFIX = "idempotency:"
+REDIS_POLL_INTERVAL = 0.05  # Seconds between checks while another worker runs the request
+
+
+@dataclass
+class StoredResponse:
+    fingerprint: str  # Hash of the request body the key was first used with
+    body: Any  # JSON-compatible handler result
+
+
+def request_fingerprint(payload) -> str:
+    # Keyed, so a stored fingerprint of a signup body can't be used to guess its password
+    raw = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hmac.new(get_settings().secret_key.encode(), raw.encode(), hashlib.sha256).hexdigest()
+
+
+class LocalIdempotencyBackend:
+    """Stored responses in this process only, bounded LRU with a TTL"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        return self.cache.get(key)
+
+    async def claim(self, key: str) -> bool:
+        return True  # In-process repeats already wait on the in-flight future
+
+    async def set(self, key: str, stored: StoredResponse) -> None:
+        self.cache.set(key, stored)
+
+    async def release(self, key: str) -> None:
+        pass
+
+    async def wait(self, key: str, timeout: float) -> Optional[StoredResponse]:
+        return None
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisIdempotencyBackend:
+    """Stored responses and in-flight claims shared by every worker through Redis (`pip install redis`)"""
+
+    def __init__(self, url: str, ttl: float, claim_ttl: float):
+        import redis.asyncio as redis  # Optional dependency, only needed with IDEMPOTENCY_BACKEND=redis
+
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.claim_ttl = claim_ttl  # A crashed worker's claim expires after this long
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        raw = await self.client.get(REDIS_PREFIX + key)
+        return None if raw is None else StoredResponse(**json.loads(raw))
+
+    async def claim(self, key: str) -> bool:
+        return bool(await self.client.set(f"{REDIS_PREFIX}{key}:claim", 1, nx=True, px=int(self.claim_ttl * 1000)))
+
+    async def set(self, key: str, stored: StoredResponse) -> None:
+        async with self.client.pipeline() as pipe:
+            pipe.set(REDIS_PREFIX + key, json.dumps(asdict(stored)), px=int(self.ttl * 1000))
+            pipe.delete(f"{REDIS_PREFIX}{key}:claim")
+            await pipe.execute()
+
+    async def release(self, key: str) -> None:
+        await self.client.delete(f"{REDIS_PREFIX}{key}:claim")
+
+    async def wait(self, key: str, timeout: float) -> Optional[StoredResponse]:
+        """The response stored by the worker holding the claim, None if it gave up or `timeout` passed"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            stored = await self.get(key)
+            if stored is not None or not await self.client.exists(f"{REDIS_PREFIX}{key}:claim"):
+                return stored
+            await asyncio.sleep(REDIS_POLL_INTERVAL)
+        return None
+
+    def stats(self) -> dict:
+        return {}
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class IdempotencyStore:
+    """Runs each (scope, key) once and replays its stored result to repeats"""
+
+    def __init__(self, backend, wait_timeout: float):
+        self.backend = backend
+        self.wait_timeout = wait_timeout
+        self._in_flight: dict = {}  # key -> Future resolved with the StoredResponse, or None on failure
+        self.executed = 0
+        self.replayed = 0
+
+    async def run(
+        self,
+        scope: str,
+        idempotency_key: Optional[str],
+        payload,
+        response: Response,
+        operation: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Result of `operation()`, run at most once per key while the stored response lives"""
+        if idempotency_key is None:
+            return await operation()
+        key = f"{scope}:{idempotency_key}"
+        fingerprint = request_fingerprint(payload)
+        while True:
+            stored = await self.backend.get(key)
+            if stored is None and key in self._in_flight:
+                stored = await asyncio.shield(self._in_flight[key])
+                if stored is None:
+                    continue  # The first attempt failed, the next one in line runs it again
+            if stored is not None:
+                return self.replay(stored, fingerprint, response)
+            return await self.execute(key, fingerprint, response, operation)
+
+    async def execute(self, key: str, fingerprint: str, response: Response, operation) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        stored = None
+        try:
+            if not await self.backend.claim(key):
+                # Another worker is running it: wait for its result rather than redoing the work
+                stored = await self.backend.wait(key, self.wait_timeout)
+                if stored is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail="A request with this Idempotency-Key is still in progress",
+                    )
+                return self.replay(stored, fingerprint, response)
+            try:
+                result = await operation()
+            except BaseException:
+                await self.backend.release(key)
+                raise
+            self.executed += 1
+            stored = StoredResponse(fingerprint, jsonable_encoder(result))
+            await self.backend.set(key, stored)
+            return result
+        finally:
+            del self._in_flight[key]
+            future.set_result(stored)
+
+    def replay(self, stored: StoredResponse, fingerprint: str, response: Response) -> Any:
+        if stored.fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                detail="Idempotency-Key was already used with a different request",
+            )
+        self.replayed += 1
+        response.headers["Idempotency-Replayed"] = "true"
+        return stored.body
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "in_flight": len(self._in_flight),
+            "executed": self.executed,
+            "replayed": self.replayed,
+            **self.backend.stats(),
+        }
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+@lru_cache
+def get_idempotency_store() -> IdempotencyStore:
+    settings = get_settings()
+    if settings.idempotency_backend == "redis":
+        backend = RedisIdempotencyBackend(
+            settings.idempotency_redis_url, ttl=settings.idempotency_ttl, claim_ttl=settings.idempotency_wait
+        )
+    elif settings.idempotency_backend == "local":
+        backend = LocalIdempotencyBackend(maxsize=settings.idempotency_max_keys, ttl=settings.idempotency_ttl)
+    else:
+        raise ValueError(f"Unknown IDEMPOTENCY_BACKEND '{settings.idempotency_backend}', expected 'local' or 'redis'")
+    return IdempotencyStore(backend, wait_timeout=settings.idempotency_wait)
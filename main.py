@@ -1,19 +1,99 @@
+import time
+
+STARTED = time.perf_counter()  # Before the heavy imports, so they count towards cold start
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .models import Base
-from .database import engine
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from .archive import run_archiver
+from .config import get_settings
+from .database import dispose_engines
+from .events import get_event_broker
+from .hashing import get_password_hasher
+from .idempotency import get_idempotency_store
+from .metrics import APP_COLD_START, APP_IMPORT_TIME, REGISTRY, MetricsMiddleware, TimedRoute
+from .profiling import ProfilingMiddleware
+from .ratelimit import get_login_rate_limiter
+from .responses import ORJSONResponse
 from .routers import auth, todo, admin, users
 
-app=FastAPI()
+logger = logging.getLogger("uvicorn.error")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema changes belong to `python -m <package>.migrate`, run once per
+    # deploy; every worker racing to create tables at import slowed boot
+    if get_settings().run_migrations_on_startup:
+        from .migrate import run_migrations
+        await run_in_threadpool(run_migrations)
+    cold_start = time.perf_counter() - STARTED
+    APP_COLD_START.set(value=cold_start)
+    logger.info("Worker ready in %.3fs (imports %.3fs)", cold_start, APP_IMPORT_TIME.value())
+    archiver = None
+    if get_settings().archive_worker and get_settings().archive_interval_seconds > 0:
+        archiver = asyncio.create_task(run_archiver(get_settings().archive_interval_seconds))
+    yield
+    if archiver is not None:
+        archiver.cancel()
+    if get_event_broker.cache_info().currsize:
+        await get_event_broker().close()
+    if get_idempotency_store.cache_info().currsize:
+        await get_idempotency_store().close()
+    if get_login_rate_limiter.cache_info().currsize:
+        await get_login_rate_limiter().close()
+    await dispose_engines()
+    get_password_hasher().shutdown()
+
+
+app=FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+app.router.route_class = TimedRoute  # Server-Timing `serialize` phase for routes declared on the app
+if get_settings().profiling_enabled or get_settings().profile_sample_rate > 0:
+    app.add_middleware(ProfilingMiddleware)  # Inside MetricsMiddleware: profiles cover the app, not the metrics
+app.add_middleware(MetricsMiddleware)
 
 @app.get('/healthy')
 def health_check():
     return {'status':'Healthy'}
 
-Base.metadata.create_all(bind=engine)
+@app.get('/metrics', response_class=PlainTextResponse, include_in_schema=False)
+def metrics():
+    # Prometheus text exposition of request, query, hash pool and token cache metrics
+    return REGISTRY.render()
+
+
+def collect_pool_and_cache_stats():
+    pool = get_password_hasher().stats()
+    cache = auth.get_token_cache().stats()
+    events = get_event_broker().stats()
+    idempotency = get_idempotency_store().stats()
+    rate_limits = get_login_rate_limiter().stats()
+    return [
+        ("hash_pool_workers", "gauge", "bcrypt pool workers", pool["workers"]),
+        ("hash_pool_in_flight", "gauge", "bcrypt jobs running or queued", pool["in_flight"]),
+        ("hash_pool_queued", "gauge", "bcrypt jobs waiting for a worker", pool["queued"]),
+        ("hash_pool_rejected_total", "counter", "bcrypt jobs shed with 503", pool["rejected"]),
+        ("token_cache_size", "gauge", "verified tokens cached", cache["size"]),
+        ("token_cache_hits_total", "counter", "verified-token cache hits", cache["hits"]),
+        ("token_cache_misses_total", "counter", "verified-token cache misses", cache["misses"]),
+        ("todo_event_subscribers", "gauge", "open /todos/events streams", events["subscribers"]),
+        ("todo_events_published_total", "counter", "todo change events published", events["published"]),
+        ("todo_event_overflows_total", "counter", "streams reset because the client fell behind", events["overflows"]),
+        ("idempotent_requests_executed_total", "counter", "requests with an Idempotency-Key that ran", idempotency["executed"]),
+        ("idempotent_requests_replayed_total", "counter", "repeats answered from the idempotency store", idempotency["replayed"]),
+        ("login_rate_limit_buckets", "gauge", "login rate limit buckets held in this worker", rate_limits.get("size", 0)),
+        ("login_rate_limit_evictions_total", "counter", "login rate limit buckets evicted from the full table", rate_limits.get("evictions", 0)),
+    ]
+
+
+REGISTRY.register_collector(collect_pool_and_cache_stats)
 
 app.include_router(auth.router)
 app.include_router(todo.router)
 app.include_router(admin.router)
 app.include_router(users.router)
 
-  
\ No newline at end of file
+APP_IMPORT_TIME.set(value=time.perf_counter() - STARTED)
@@ -0,0 +1,319 @@
+import functools
+import inspect
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def render(self) -> list:
+        """Sample lines of this metric; the registry writes its HELP and TYPE lines"""
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict = {}
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def render(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labelvalues, amount: float = 1) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, *labelvalues, value: float) -> None:
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: dict = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, *labelvalues, value: float) -> None:
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                series = self._values[labelvalues] = [0] * len(self.buckets) + [0.0, 0]
+            for index, upper in enumerate(self.buckets):
+                if value <= upper:
+                    series[index] += 1  # Stored non-cumulative, summed when rendering
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, *labelvalues) -> int:
+        series = self._values.get(labelvalues)
+        return series[-1] if series else 0
+
+    def render(self) -> list:
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._values.items()]
+        lines = []
+        for labels, series in items:
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets, series):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(upper) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    """Holds the process' metrics and renders them in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: list = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collect: Callable[[], list]) -> None:
+        """`collect()` returns [(name, kind, help, value)] read at scrape time (pool sizes, cache counters, ...)"""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, kind, documentation, value in collect():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being handled", ("method", "route"))
+HTTP_DB_QUERIES = REGISTRY.histogram(
+    "http_request_db_queries", "SQL statements issued per HTTP request", ("method", "route"),
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100),
+)
+HTTP_DB_TIME = REGISTRY.histogram("http_request_db_seconds", "Total SQL time per HTTP request", ("method", "route"))
+DB_QUERIES = REGISTRY.counter("db_queries_total", "SQL statements executed")
+DB_QUERY_TIME = REGISTRY.histogram("db_query_duration_seconds", "SQL statement latency")
+DB_SLOW_QUERIES = REGISTRY.counter("db_slow_queries_total", "SQL statements slower than DB_SLOW_QUERY_MS")
+APP_IMPORT_TIME = REGISTRY.gauge("app_import_seconds", "Time spent importing the app module in this worker")
+APP_COLD_START = REGISTRY.gauge("app_cold_start_seconds", "Time from importing the app to the worker accepting requests")
+WRITE_BATCH_SIZE = REGISTRY.histogram(
+    "write_batch_size", "Todo writes committed together by the write batcher", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+WRITE_BATCH_COMMIT_TIME = REGISTRY.histogram("write_batch_seconds", "Time to run and commit one batch of todo writes")
+PASSWORD_REHASHES = REGISTRY.counter(
+    "password_rehashes_total", "Outdated password hashes redone after a login (updated) or left for the next one (skipped)", ("outcome",),
+)
+LOGIN_ATTEMPTS = REGISTRY.counter(
+    "login_rate_limit_total", "Login attempts let through (bucket=all) or rejected by the named bucket", ("bucket", "outcome"),
+)
+PROFILED_REQUESTS = REGISTRY.counter(
+    "profiled_requests_total", "Requests profiled on an admin's X-Profile header (sample, cprofile) or by PROFILE_SAMPLE_RATE (background)", ("mode",),
+)
+
+
+@dataclass
+class RequestTimings:
+    """Per-request phase timings, shared (by reference) with threadpool workers via a ContextVar"""
+    phases: dict = field(default_factory=dict)  # phase name -> seconds
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    endpoint_done: Optional[float] = None  # perf_counter() when the endpoint returned
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def timed_phase(phase: str):
+    """Add the block's duration to `phase` of the current request's Server-Timing"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = request_timings.get()
+        if timings is not None:
+            timings.add(phase, time.perf_counter() - started)
+
+
+def record_query(seconds: float) -> None:
+    DB_QUERIES.inc()
+    DB_QUERY_TIME.observe(value=seconds)
+    timings = request_timings.get()
+    if timings is not None:
+        timings.db_queries += 1
+        timings.db_seconds += seconds
+
+
+def route_label(scope) -> str:
+    # Route template, not the raw path, so /todos/1 and /todos/2 share one series.
+    # The router stores the matched route in the scope; 404s have none.
+    return getattr(scope.get("route"), "path", "unmatched")
+
+
+class MetricsMiddleware:
+    """ASGI middleware: per-route latency metrics and a Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        timings = RequestTimings()
+        token = request_timings.set(timings)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                now = time.perf_counter()
+                if timings.endpoint_done is not None:
+                    timings.add("serialize", now - timings.endpoint_done)
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", self.server_timing(timings, now - started))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = route_label(scope)
+            HTTP_REQUESTS.inc(method, route, str(status_code))
+            HTTP_LATENCY.observe(method, route, value=elapsed)
+            HTTP_DB_QUERIES.observe(method, route, value=timings.db_queries)
+            HTTP_DB_TIME.observe(method, route, value=timings.db_seconds)
+            request_timings.reset(token)
+
+    @staticmethod
+    def server_timing(timings: RequestTimings, total: float) -> str:
+        entries = [f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in timings.phases.items()]
+        entries.append(f'db;dur={timings.db_seconds * 1000:.2f};desc="{timings.db_queries} queries"')
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that tracks in-flight requests per route and notes when the
+    endpoint returns, so the time FastAPI then spends validating and
+    serializing the response shows up as `serialize`"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, self.wrap_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def in_flight_handler(request):
+            HTTP_IN_FLIGHT.inc(request.method, path)
+            try:
+                return await handler(request)
+            finally:
+                HTTP_IN_FLIGHT.dec(request.method, path)
+
+        return in_flight_handler
+
+    @staticmethod
+    def wrap_endpoint(endpoint: Callable) -> Callable:
+        # functools.wraps keeps the signature FastAPI reads for dependencies/params
+        if inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def timed_endpoint(*args, **kwargs):
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    mark_endpoint_done()
+        else:
+            @functools.wraps(endpoint)
+            def timed_endpoint(*args, **kwargs):
+                try:
+                    return endpoint(*args, **kwargs)
+                finally:
+                    mark_endpoint_done()
+        return timed_endpoint
+
+
+def mark_endpoint_done() -> None:
+    timings = request_timings.get()
+    if timings is not None:
+        timings.endpoint_done = time.perf_counter()
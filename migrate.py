@@ -0,0 +1,67 @@
+"""Apply Alembic migrations up to head.
+
+Run once per deploy, before starting the workers:
+
+    python -m todoapp_fastapi.migrate
+
+(use the name of the directory the app lives in). With DATABASE_SHARD_URLS
+set, every shard is migrated as well. Workers never touch the schema
+themselves unless RUN_MIGRATIONS_ON_STARTUP is set.
+"""
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+
+from alembic import command
+from alembic.config import Config
+
+from .config import get_settings
+from .shards import get_shard_map, safe_url
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run migrations from one process
+    fcntl = None
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOCK_PATH = os.path.join(tempfile.gettempdir(), "todoapp-migrations.lock")
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def alembic_config(database_url: str = None) -> Config:
+    config = Config(os.path.join(PACKAGE_DIR, "alembic.ini"))
+    # Absolute paths so this works from any working directory
+    config.set_main_option("script_location", os.path.join(PACKAGE_DIR, "alembic"))
+    config.set_main_option("sqlalchemy.url", database_url or get_settings().database_url)
+    return config
+
+
+@contextmanager
+def migration_lock():
+    # Workers on the same host that all migrate on startup take turns; the
+    # first upgrades, the rest find the schema already at head
+    if fcntl is None:
+        yield
+        return
+    with open(LOCK_PATH, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def run_migrations(database_url: str = None, revision: str = "head") -> None:
+    """Upgrade `database_url`, or DATABASE_URL and every shard in DATABASE_SHARD_URLS"""
+    urls = [database_url] if database_url else [get_settings().database_url, *get_shard_map().urls.values()]
+    with migration_lock():
+        for url in dict.fromkeys(urls):  # A shard may be DATABASE_URL itself
+            command.upgrade(alembic_config(url), revision)
+            logger.info("Database %s migrated to %s", safe_url(url), revision)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_migrations()
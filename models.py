@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, Boolean
+from sqlalchemy import CheckConstraint, Column, DateTime, ForeignKey, Index, Integer, SmallInteger, String, Boolean, text
 from .database import Base
 
 class Users(Base):
@@ -19,9 +19,69 @@ class Todos(Base):
     id = Column(Integer, primary_key = True, index=True)
     title = Column(String)
     description = Column(String)
-    priority = Column(String)
+    priority = Column(SmallInteger, nullable=False)
     complete = Column(Boolean,default=False)
     owner_id = Column(Integer, ForeignKey("users.id"))
+    completed_at = Column(DateTime(timezone=True))  # When complete was set, NULL while open; drives archival (archive.py)
 
+    __table_args__ = (
+        # Bounds as CHECKs rather than VARCHAR(n), which SQLite doesn't enforce
+        CheckConstraint("priority BETWEEN 1 AND 5", name="ck_todos_priority"),
+        CheckConstraint("length(title) <= 200", name="ck_todos_title_length"),
+        CheckConstraint("length(description) <= 100", name="ck_todos_description_length"),
+        # Covers the owner-scoped list query: filters on complete/priority and keyset order by id.
+        # Its prefixes serve owner_id and (owner_id, complete) lookups too.
+        Index("ix_todos_owner_complete_priority_id", "owner_id", "complete", "priority", "id"),
+        # Priority-sorted listings without a complete filter
+        Index("ix_todos_owner_priority_id", "owner_id", "priority", "id"),
+        # The archival job's scan for old completed todos; open todos aren't in it
+        Index("ix_todos_completed_at", "completed_at",
+              sqlite_where=text("completed_at IS NOT NULL"), postgresql_where=text("completed_at IS NOT NULL")),
+        # Archived todos keep their id: SQLite must never hand it out again
+        {"sqlite_autoincrement": True},
+    )
 
-    
+
+class ArchivedTodos(Base):
+    """Completed todos moved out of todos by the archival job, same shard as their owner's todos"""
+    __tablename__ = 'archived_todos'
+
+    id = Column(Integer, primary_key=True)  # Kept from todos, never reused there (AUTOINCREMENT on SQLite)
+    title = Column(String)
+    description = Column(String)
+    priority = Column(SmallInteger, nullable=False)
+    complete = Column(Boolean, default=True)
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    completed_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        # Owner-scoped listing of the archive, keyset order by id
+        Index("ix_archived_todos_owner_id", "owner_id", "id"),
+    )
+
+
+class TodoVersions(Base):
+    """Per-owner counter bumped by every todo write, the source of todo ETags"""
+    __tablename__ = 'todo_versions'
+
+    owner_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class TodoStats(Base):
+    """Todo counts per owner, priority and completion, kept current by triggers on todos (see stats.py)"""
+    __tablename__ = 'todo_stats'
+
+    owner_id = Column(Integer, primary_key=True)
+    priority = Column(Integer, primary_key=True)
+    complete = Column(Boolean, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class TodoIdBlocks(Base):
+    """Next free todo id when todos are sharded, so ids stay unique across shards (see shards.py)"""
+    __tablename__ = 'todo_id_blocks'
+
+    name = Column(String, primary_key=True)
+    next_id = Column(Integer, nullable=False)
@@ -0,0 +1,110 @@
+import base64
+import binascii
+import json
+from enum import Enum
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+from starlette import status
+
+from .models import Todos
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class TodoSort(str, Enum):
+    """Sort orders supported by the todo list endpoints ('-' prefix means descending)"""
+    id_asc = "id"
+    id_desc = "-id"
+    priority_asc = "priority"
+    priority_desc = "-priority"
+
+
+def encode_cursor(values: dict) -> str:
+    # Opaque to clients: url-safe base64 of the last row's sort key
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    if not isinstance(values, dict) or not isinstance(values.get("id"), int):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+async def paginate_todos(db, stmt, sort: TodoSort, limit: int, cursor: Optional[str] = None, model=Todos):
+    """Apply keyset ordering/seek to a select of `model` (Todos or ArchivedTodos) columns and return one page.
+
+    Instead of OFFSET we seek past the last row of the previous page, so each
+    page costs the same index range scan no matter how deep the client pages.
+    """
+    descending = sort.value.startswith("-")
+    by_priority = sort.value.lstrip("-") == "priority"
+
+    if by_priority:
+        order_by = (model.priority.desc(), model.id.desc()) if descending else (model.priority, model.id)
+    else:
+        order_by = (model.id.desc(),) if descending else (model.id,)
+
+    if cursor is not None:
+        last = decode_cursor(cursor)
+        if by_priority:
+            if not isinstance(last.get("priority"), int):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+            if descending:
+                seek = or_(model.priority < last["priority"],
+                           and_(model.priority == last["priority"], model.id < last["id"]))
+            else:
+                seek = or_(model.priority > last["priority"],
+                           and_(model.priority == last["priority"], model.id > last["id"]))
+        else:
+            seek = model.id < last["id"] if descending else model.id > last["id"]
+        stmt = stmt.where(seek)
+
+    # Fetch one extra row to know whether another page exists without a COUNT(*)
+    rows = (await db.execute(stmt.order_by(*order_by).limit(limit + 1))).all()
+    items = rows[:limit]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last_row = items[-1]
+        key = {"id": last_row.id}
+        if by_priority:
+            key["priority"] = last_row.priority
+        next_cursor = encode_cursor(key)
+
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def merge_pages(pages: list, sort: TodoSort, limit: int):
+    """Combine the pages that paginate_todos returned for the same cursor on every shard into one.
+
+    Todo ids are unique across shards, so the keyset cursor means the same
+    thing on each of them: the first `limit` rows of the merged, re-sorted
+    items are exactly the page a single database would have returned.
+    """
+    descending = sort.value.startswith("-")
+    by_priority = sort.value.lstrip("-") == "priority"
+
+    def sort_key(row):
+        return (row.priority, row.id) if by_priority else (row.id,)
+
+    rows = sorted((row for page in pages for row in page["items"]), key=sort_key, reverse=descending)
+    items = rows[:limit]
+
+    next_cursor = None
+    if len(rows) > limit or any(page["next_cursor"] for page in pages):
+        last_row = items[-1]
+        key = {"id": last_row.id}
+        if by_priority:
+            key["priority"] = last_row.priority
+        next_cursor = encode_cursor(key)
+
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,397 @@
+"""Opt-in profiling of single requests, and sampled hot stacks per route.
+
+With PROFILING_ENABLED=true, an admin adds `X-Profile: sample` (or
+`X-Profile: cprofile`) to any request.
+The response carries an `X-Profile-Id`, and the profile is kept in a ring of
+the last PROFILE_RING_SIZE profiles of the worker that served it: listed by
+GET /admin/profiles, downloaded from GET /admin/profiles/{id}. The header is
+ignored unless the request's bearer token belongs to an admin.
+
+- sample: a sampler thread looks at the request's task every
+  PROFILE_INTERVAL_MS. While the task runs it records the event loop's
+  stack; while it waits it records where it is suspended (a query on the
+  threadpool, a bcrypt job, ...) under a "(waiting)" leaf, so the counts add
+  up to the request's wall-clock time. Downloaded as folded stacks, the
+  input of flamegraph.pl and speedscope.
+- cprofile: deterministic cProfile of the event loop thread for the length
+  of the request. It also counts whatever else the loop runs meanwhile and
+  misses the threadpool, so use it on a quiet worker for CPU-bound handlers.
+  One at a time per worker; a second one falls back to sampling.
+
+With PROFILE_SAMPLE_RATE > 0, that share of all requests is sampled the same
+way and their stacks are summed per route (GET /admin/profiles/hot).
+
+With PROFILING_ENABLED=false (the default) and PROFILE_SAMPLE_RATE=0 the
+middleware isn't installed; otherwise a request that isn't profiled costs a header lookup.
+"""
+import asyncio
+import cProfile
+import io
+import itertools
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from enum import Enum
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+from starlette.datastructures import MutableHeaders
+
+from .config import get_settings
+from .metrics import PROFILED_REQUESTS, route_label
+from .routers.auth import verify_token
+
+MAX_STACK_DEPTH = 128  # frames kept per sample, innermost first
+MAX_HOT_STACKS = 1000  # distinct stacks kept per route, later ones are counted as OTHER_STACK
+OTHER_STACK = "[other]"
+WAITING = "(waiting)"
+
+
+class ProfileMode(str, Enum):
+    sample = "sample"
+    cprofile = "cprofile"
+
+
+class ProfileFormat(str, Enum):
+    folded = "folded"  # sample profiles: "outer;...;inner count" lines
+    text = "text"  # cprofile profiles: pstats table by cumulative time
+    pstats = "pstats"  # cprofile profiles: binary .prof file
+
+
+def frame_label(frame) -> str:
+    return f'{frame.f_globals.get("__name__", "?")}.{frame.f_code.co_qualname}'
+
+
+def task_stack(task: asyncio.Task, loop_frame) -> Optional[str]:
+    """Folded stack ("outer;...;inner") of where `task` runs, or is suspended, right now.
+
+    Called from the sampler thread while the loop keeps going: a stack that
+    changes under us is at worst one odd sample.
+    """
+    coro = task.get_coro()
+    root = getattr(coro, "cr_frame", None)
+    if root is None:
+        return None  # Finished
+    frames = []
+    if asyncio.current_task(task.get_loop()) is task:
+        # Running: the loop thread's stack, from the innermost frame up to the task's coroutine
+        frame = loop_frame
+        while frame is not None and len(frames) < MAX_STACK_DEPTH:
+            frames.append(frame_label(frame))
+            if frame is root:
+                return ";".join(reversed(frames))
+            frame = frame.f_back
+        frames = []  # The loop moved on to another task meanwhile: read it as suspended
+    # Suspended: follow the chain of awaits down from the task's coroutine
+    while coro is not None and len(frames) < MAX_STACK_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    frames.append(WAITING)
+    return ";".join(frames)
+
+
+@dataclass
+class RequestSamples:
+    """Stack counts of one request's task, filled by the sampler thread"""
+    task: asyncio.Task
+    loop_thread: int
+    stacks: Counter = field(default_factory=Counter)
+
+    def take(self, frames: dict) -> None:
+        try:
+            stack = task_stack(self.task, frames.get(self.loop_thread))
+        except Exception:  # Raced the loop mid-step, skip this sample
+            return
+        if stack:
+            self.stacks[stack] += 1
+
+
+class Sampler:
+    """One daemon thread sampling every watched request each `interval` seconds.
+
+    The thread starts with the first watched request and sleeps on an event
+    while nothing is watched.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._watched: dict = {}
+        self._lock = threading.Lock()  # Also held while sampling, so unwatch() returns with the counts final
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, samples: RequestSamples) -> None:
+        with self._lock:
+            self._watched[id(samples)] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def unwatch(self, samples: RequestSamples) -> None:
+        with self._lock:
+            self._watched.pop(id(samples), None)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                if not self._watched:
+                    self._wakeup.clear()
+                    continue
+                frames = sys._current_frames()
+                for samples in self._watched.values():
+                    samples.take(frames)
+                del frames  # Don't keep the frames (and their locals) alive while sleeping
+            time.sleep(self.interval)
+
+
+@dataclass
+class RequestProfile:
+    id: str
+    mode: ProfileMode
+    method: str
+    path: str
+    started_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    route: str = ""
+    status: int = 500
+    duration: float = 0.0
+    stacks: Optional[Counter] = None  # sample mode
+    profiler: Optional[cProfile.Profile] = None  # cprofile mode
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "mode": self.mode.value,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            "samples": sum(self.stacks.values()) if self.stacks is not None else None,
+        }
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def stats_text(self, limit: int) -> str:
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+        return stream.getvalue()
+
+    def stats_dump(self) -> bytes:
+        """The .prof format written by cProfile, for `python -m pstats`, snakeviz, ..."""
+        self.profiler.create_stats()
+        return marshal.dumps(self.profiler.stats)
+
+
+class ProfileStore:
+    """The last `size` request profiles of this worker, oldest evicted first"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._profiles: OrderedDict = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def new_id(self) -> str:
+        return f"{os.getpid()}-{next(self._ids)}"  # The pid tells which worker holds it
+
+    def add(self, profile: RequestProfile) -> None:
+        self._profiles[profile.id] = profile
+        while len(self._profiles) > self.size:
+            self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> list:
+        return [profile.summary() for profile in reversed(self._profiles.values())]
+
+
+class HotStacks:
+    """Stack counts of the requests picked by PROFILE_SAMPLE_RATE, summed per route"""
+
+    def __init__(self, max_stacks: int = MAX_HOT_STACKS):
+        self.max_stacks = max_stacks
+        self._routes: dict = {}  # route -> [requests, Counter]
+        self._lock = threading.Lock()
+
+    def add(self, route: str, stacks: Counter) -> None:
+        with self._lock:
+            entry = self._routes.setdefault(route, [0, Counter()])
+            entry[0] += 1
+            totals = entry[1]
+            for stack, count in stacks.items():
+                if stack not in totals and len(totals) >= self.max_stacks:
+                    stack = OTHER_STACK
+                totals[stack] += count
+
+    def top(self, route: Optional[str] = None, limit: int = 20) -> list:
+        with self._lock:
+            routes = [(name, entry[0], entry[1].copy()) for name, entry in self._routes.items() if route in (None, name)]
+        report = []
+        for name, requests, stacks in routes:
+            samples = sum(stacks.values())
+            report.append({
+                "route": name,
+                "requests": requests,
+                "samples": samples,
+                "stacks": [
+                    {"stack": stack, "samples": count, "share": round(count / samples, 4)}
+                    for stack, count in stacks.most_common(limit)
+                ],
+            })
+        return sorted(report, key=lambda entry: entry["samples"], reverse=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+
+def profile_response(profile: RequestProfile, profile_format: Optional[ProfileFormat], limit: int) -> Response:
+    """The profile as a download: folded stacks for sample profiles, pstats text (default) or .prof for cprofile ones"""
+    if profile_format is None:
+        profile_format = ProfileFormat.folded if profile.mode is ProfileMode.sample else ProfileFormat.text
+    if (profile_format is ProfileFormat.folded) != (profile.mode is ProfileMode.sample):
+        raise HTTPException(status_code=400, detail=f"A {profile.mode.value} profile can't be downloaded as {profile_format.value}")
+    if profile_format is ProfileFormat.folded:
+        content, media_type, extension = profile.folded(), "text/plain; charset=utf-8", "folded"
+    elif profile_format is ProfileFormat.text:
+        content, media_type, extension = profile.stats_text(limit), "text/plain; charset=utf-8", "txt"
+    else:
+        content, media_type, extension = profile.stats_dump(), "application/octet-stream", "prof"
+    return Response(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile.id}.{extension}"'},
+    )
+
+
+@lru_cache
+def get_profile_store() -> ProfileStore:
+    return ProfileStore(get_settings().profile_ring_size)
+
+
+@lru_cache
+def get_hot_stacks() -> HotStacks:
+    return HotStacks()
+
+
+@lru_cache
+def get_sampler() -> Sampler:
+    return Sampler(get_settings().profile_interval_ms / 1000)
+
+
+_cprofile_lock = threading.Lock()  # cProfile hooks the whole thread: one profile at a time
+
+
+def start_cprofile() -> Optional[cProfile.Profile]:
+    """An enabled profiler, or None if one (or another profiler) is already running"""
+    if sys.getprofile() is not None or not _cprofile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_cprofile(profiler: cProfile.Profile) -> None:
+    profiler.disable()
+    _cprofile_lock.release()
+
+
+def requested_mode(scope) -> Optional[ProfileMode]:
+    """The X-Profile mode asked for, if the request comes from an admin"""
+    mode = authorization = None
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            mode = value.decode("latin-1").strip().lower() or ProfileMode.sample.value
+        elif name == b"authorization":
+            authorization = value.decode("latin-1")
+    if mode is None or authorization is None:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or mode not in ProfileMode.__members__:
+        return None
+    try:
+        user = verify_token(token.strip())
+    except HTTPException:
+        return None  # The endpoint's own authentication answers it
+    return ProfileMode(mode) if user.get("role") == "admin" else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware: profiles the requests asked for by an admin's X-Profile
+    header, and samples a PROFILE_SAMPLE_RATE share of all requests"""
+
+    def __init__(self, app, header_enabled: Optional[bool] = None, sample_rate: Optional[float] = None):
+        self.app = app
+        settings = get_settings()
+        self.header_enabled = settings.profiling_enabled if header_enabled is None else header_enabled
+        self.sample_rate = settings.profile_sample_rate if sample_rate is None else sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = requested_mode(scope) if self.header_enabled else None
+        background = self.sample_rate > 0 and random.random() < self.sample_rate
+        if mode is None and not background:
+            await self.app(scope, receive, send)
+            return
+        await self.profile(scope, receive, send, mode, background)
+
+    async def profile(self, scope, receive, send, mode: Optional[ProfileMode], background: bool):
+        profile = profiler = samples = None
+        if mode is not None:
+            profile = RequestProfile(get_profile_store().new_id(), mode, scope["method"], scope["path"])
+            if mode is ProfileMode.cprofile:
+                profiler = start_cprofile()
+                if profiler is None:
+                    profile.mode = ProfileMode.sample
+        if background or (profile is not None and profile.mode is ProfileMode.sample):
+            samples = RequestSamples(asyncio.current_task(), threading.get_ident())
+            get_sampler().watch(samples)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if profile is not None:
+                    MutableHeaders(scope=message).append("X-Profile-Id", profile.id)
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            if profiler is not None:
+                stop_cprofile(profiler)
+            if samples is not None:
+                get_sampler().unwatch(samples)
+            route = route_label(scope)
+            if background:
+                get_hot_stacks().add(route, samples.stacks)
+                PROFILED_REQUESTS.inc("background")
+            if profile is not None:
+                profile.route, profile.status, profile.duration = route, status_code, duration
+                if profiler is not None:
+                    profile.profiler = profiler
+                else:
+                    profile.stacks = samples.stacks
+                get_profile_store().add(profile)
+                PROFILED_REQUESTS.inc(profile.mode.value)
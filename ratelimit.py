@@ -0,0 +1,182 @@
+"""Token-bucket rate limiting for the login endpoint.
+
+Every POST /auth/token costs a user lookup and a full bcrypt verify, even
+for usernames that don't exist, so a credential-stuffing burst can take
+all the CPU of every worker. `LoginRateLimiter.check` takes one token
+from the client IP's bucket and one from the username's bucket before any
+of that work; an empty bucket is answered with 429 and a Retry-After
+right away.
+
+Buckets hold LOGIN_RATE_LIMIT_*_BURST tokens and refill at
+LOGIN_RATE_LIMIT_*_PER_MINUTE. `LocalRateLimitBackend` keeps them in a
+fixed-size LRU table in this process (an evicted bucket was idle long
+enough to be full again, or is just forgotten under a flood of new keys);
+`RedisRateLimitBackend` shares them between workers.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import HTTPException
+from starlette import status
+
+from .config import get_settings
+from .metrics import LOGIN_ATTEMPTS
+
+logger = logging.getLogger("uvicorn.error")
+
+REDIS_PREFIX = "ratelimit:"
+MAX_KEY_LENGTH = 255  # Longer usernames share the bucket of their prefix
+
+# Refill and take one token atomically; TIME keeps every worker on Redis' clock
+REDIS_TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(wait)
+"""
+
+
+@dataclass(frozen=True)
+class BucketLimit:
+    burst: float  # tokens a full bucket holds
+    rate: float  # tokens added per second
+
+
+class RateLimited(HTTPException):
+    """Raised before any database or bcrypt work when a bucket is empty"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, please retry later",
+            headers={"Retry-After": str(max(1, round(retry_after)))},
+        )
+
+
+class LocalRateLimitBackend:
+    """Buckets in this process only: a bounded LRU table of (tokens, last refill) pairs"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    async def acquire(self, key: str, limit: BucketLimit) -> float:
+        """Take a token from `key`'s bucket; 0 if there was one, otherwise seconds until there will be"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / limit.rate
+            self._buckets[key] = (tokens, now)  # Re-inserted last: most recently used
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+            return wait
+
+    def stats(self) -> dict:
+        return {"size": len(self._buckets), "maxsize": self.maxsize, "evictions": self.evictions}
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisRateLimitBackend:
+    """Buckets shared by every worker through Redis (`pip install redis`)"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis  # Optional dependency, only needed with LOGIN_RATE_LIMIT_BACKEND=redis
+
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(REDIS_TOKEN_BUCKET)
+        self.errors = 0
+
+    async def acquire(self, key: str, limit: BucketLimit) -> float:
+        from redis import RedisError
+
+        try:
+            return float(await self.script(keys=[REDIS_PREFIX + key], args=[limit.burst, limit.rate]))
+        except RedisError:
+            # Fail open: an unreachable Redis must not lock every user out
+            self.errors += 1
+            logger.warning("Rate limit check failed, letting the request through", exc_info=True)
+            return 0.0
+
+    def stats(self) -> dict:
+        return {"errors": self.errors}
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class LoginRateLimiter:
+    """Per-IP and per-username token buckets in front of the login endpoint"""
+
+    def __init__(self, backend, limits: dict):
+        self.backend = backend
+        self.limits = {bucket: limit for bucket, limit in limits.items() if limit is not None}  # bucket -> BucketLimit
+
+    async def check(self, **keys: Optional[str]) -> None:
+        """Take a token from each bucket in turn (e.g. ip=..., username=...), raising RateLimited at the first empty one"""
+        for bucket, value in keys.items():
+            limit = self.limits.get(bucket)
+            if limit is None or value is None:
+                continue
+            wait = await self.backend.acquire(f"{bucket}:{value[:MAX_KEY_LENGTH]}", limit)
+            if wait > 0:
+                LOGIN_ATTEMPTS.inc(bucket, "rejected")
+                raise RateLimited(wait)
+        LOGIN_ATTEMPTS.inc("all", "allowed")
+
+    def stats(self) -> dict:
+        return {"backend": type(self.backend).__name__, **self.backend.stats()}
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+def bucket_limit(burst: float, per_minute: float) -> Optional[BucketLimit]:
+    """None (no limit) when either setting is 0"""
+    if burst <= 0 or per_minute <= 0:
+        return None
+    return BucketLimit(burst=burst, rate=per_minute / 60)
+
+
+@lru_cache
+def get_login_rate_limiter() -> LoginRateLimiter:
+    settings = get_settings()
+    if settings.login_rate_limit_backend == "redis":
+        backend = RedisRateLimitBackend(settings.login_rate_limit_redis_url)
+    elif settings.login_rate_limit_backend == "local":
+        backend = LocalRateLimitBackend(maxsize=settings.login_rate_limit_max_keys)
+    else:
+        raise ValueError(
+            f"Unknown LOGIN_RATE_LIMIT_BACKEND '{settings.login_rate_limit_backend}', expected 'local' or 'redis'"
+        )
+    return LoginRateLimiter(backend, {
+        "ip": bucket_limit(settings.login_rate_limit_ip_burst, settings.login_rate_limit_ip_per_minute),
+        "username": bucket_limit(settings.login_rate_limit_user_burst, settings.login_rate_limit_user_per_minute),
+    })
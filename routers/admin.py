@@ -1,32 +1,221 @@
-from fastapi import APIRouter, HTTPException, Path
+from fastapi import APIRouter, HTTPException, Path, Query, Request
+from fastapi.responses import StreamingResponse
 from fastapi.params import Depends
 from starlette import status
-from typing import Annotated
-from ..database import get_db
-from .auth import get_current_user
-from sqlalchemy.orm import Session
-from ..models import Todos
+from starlette.concurrency import run_in_threadpool
+from typing import Annotated, Optional
+from ..database import get_read_db
+from ..etags import bump_todo_versions
+from ..events import get_event_broker, todo_ids_by_owner
+from ..export import ExportFormat, export_response
+from ..hashing import get_password_hasher, hash_cost_report
+from ..metrics import TimedRoute
+from ..pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, TodoSort, merge_pages, paginate_todos
+from ..profiling import ProfileFormat, get_hot_stacks, get_profile_store, profile_response
+from ..schemas import TODO_OUT_COLUMNS, BulkResults, TodoPage, TodoStatsOut
+from ..shards import ShardSessions, get_shard_dbs, get_shard_read_dbs
+from ..stats import get_global_stats, get_owner_stats, merge_stats
+from .auth import get_current_user, get_token_cache
+from .todo import bulk_ids
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models import Todos, Users
 
 router=APIRouter(
     prefix="/admin",
-    tags=["admin"]
+    tags=["admin"],
+    route_class=TimedRoute,
 )
 
 user_dependency = Annotated[dict, Depends(get_current_user)]
-db_dependency = Annotated[Session, Depends(get_db)]
+# Admin handlers span every owner, so they get a session per shard and query them concurrently
+shards_dependency = Annotated[ShardSessions, Depends(get_shard_dbs)]
+read_shards_dependency = Annotated[ShardSessions, Depends(get_shard_read_dbs)]
 
-@router.get("/todo", status_code=status.HTTP_200_OK)
-async def read_all(user:user_dependency, db:db_dependency):
+@router.get("/todo", status_code=status.HTTP_200_OK, response_model=TodoPage)
+async def read_all(
+    user:user_dependency,
+    dbs:read_shards_dependency,
+    complete: Optional[bool] = None,
+    priority: Optional[int] = Query(default=None, gt=0, lt=6),
+    owner_id: Optional[int] = Query(default=None, gt=0),
+    sort: TodoSort = TodoSort.id_asc,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
     if user is None or user.get('role') != 'admin':
         raise HTTPException(status_code=401, detail="Authentication Failed")
-    return db.query(Todos).all()
+    stmt = select(*TODO_OUT_COLUMNS)
+    if owner_id is not None:
+        stmt = stmt.where(Todos.owner_id == owner_id)
+    if complete is not None:
+        stmt = stmt.where(Todos.complete == complete)
+    if priority is not None:
+        stmt = stmt.where(Todos.priority == priority)
+    if owner_id is not None:
+        return await paginate_todos(dbs.for_owner(owner_id), stmt, sort, limit, cursor)
+    # Same page from every shard, merged: still one keyset range scan per shard
+    pages = await dbs.gather(lambda db: paginate_todos(db, stmt, sort, limit, cursor))
+    return merge_pages(pages, sort, limit)
+
+@router.get("/todo/export", response_class=StreamingResponse)
+async def export_all(
+    user:user_dependency,
+    dbs:read_shards_dependency,
+    request:Request,
+    format: ExportFormat = ExportFormat.ndjson,
+    complete: Optional[bool] = None,
+    priority: Optional[int] = Query(default=None, gt=0, lt=6),
+    owner_id: Optional[int] = Query(default=None, gt=0),
+):
+    # Every todo as NDJSON/CSV, streamed shard after shard (ordered by id within each) with constant memory
+    if user is None or user.get('role') != 'admin':
+        raise HTTPException(status_code=401, detail="Authentication Failed")
+    stmt = select(*TODO_OUT_COLUMNS)
+    if owner_id is not None:
+        stmt = stmt.where(Todos.owner_id == owner_id)
+    if complete is not None:
+        stmt = stmt.where(Todos.complete == complete)
+    if priority is not None:
+        stmt = stmt.where(Todos.priority == priority)
+    stmt = stmt.order_by(Todos.id)
+    shards = [dbs.for_owner(owner_id)] if owner_id is not None else list(dbs.values())
+    return export_response(request, [(db, stmt) for db in shards], [column.key for column in TODO_OUT_COLUMNS], format, "todos")
 
 @router.delete("/todo/{todo_id}", status_code=status.HTTP_200_OK)
-async def delete_todo(user:user_dependency, db:db_dependency, todo_id:int = Path(gt=0)):
+async def delete_todo(user:user_dependency, dbs:shards_dependency, todo_id:int = Path(gt=0)):
     if user is None or user.get('role') != 'admin':
         raise HTTPException(status_code=401, detail="Authentication Failed")
-    todo_model = db.query(Todos).filter(Todos.id == todo_id).first()
-    if todo_model is None:
+
+    async def delete_from(db):
+        # The id is on one shard at most; the others delete nothing
+        result = await db.execute(
+            delete(Todos)
+            .where(Todos.id == todo_id)
+            .returning(Todos.owner_id)
+            .execution_options(synchronize_session=False)
+        )
+        owner_id = result.scalar_one_or_none()
+        versions = {}
+        if owner_id is not None:
+            versions = await bump_todo_versions(db, [owner_id])  # Owner's cached ETags are no longer valid
+            await db.commit()
+        return owner_id, versions
+
+    deleted = [(owner_id, versions) for owner_id, versions in await dbs.gather(delete_from) if owner_id is not None]
+    if not deleted:
         raise HTTPException(status_code=404, detail="Todo not found")
-    db.query(Todos).filter(Todos.id == todo_id).delete()
-    db.commit()
\ No newline at end of file
+    owner_id, versions = deleted[0]
+    await get_event_broker().publish_changes(versions, "deleted", {owner_id: [todo_id]})
+
+@router.post("/todo/bulk/delete", status_code=status.HTTP_200_OK, response_model=BulkResults)
+async def delete_todos_bulk(
+    user:user_dependency,
+    dbs:shards_dependency,
+    todo_ids: bulk_ids,
+):
+    # One DELETE ... WHERE id IN (...) for any owner, with a per-id result
+    if user is None or user.get('role') != 'admin':
+        raise HTTPException(status_code=401, detail="Authentication Failed")
+
+    async def delete_from(db):
+        # One transaction per shard: each shard's deletes and version bumps commit together
+        result = await db.execute(
+            delete(Todos)
+            .where(Todos.id.in_(todo_ids))
+            .returning(Todos.id, Todos.owner_id)
+            .execution_options(synchronize_session=False)
+        )
+        deleted = result.all()
+        versions = await bump_todo_versions(db, {row.owner_id for row in deleted})
+        await db.commit()
+        return deleted, versions
+
+    deleted, versions = [], {}
+    for shard_deleted, shard_versions in await dbs.gather(delete_from):
+        deleted += shard_deleted
+        versions.update(shard_versions)
+    deleted_ids = {row.id for row in deleted}
+    await get_event_broker().publish_changes(versions, "deleted", todo_ids_by_owner(deleted))
+    return {"results": [
+        {"id": todo_id, "status": "deleted" if todo_id in deleted_ids else "not_found"}
+        for todo_id in todo_ids
+    ]}
+
+
+@router.get("/stats", status_code=status.HTTP_200_OK, response_model=TodoStatsOut)
+async def todo_stats(user:user_dependency, dbs:read_shards_dependency, owner_id: Optional[int] = Query(default=None, gt=0)):
+    # Todo counts of one owner, or of everyone, read from the todo_stats summary table of each shard
+    if user is None or user.get('role') != 'admin':
+        raise HTTPException(status_code=401, detail="Authentication Failed")
+    if owner_id is not None:
+        return await get_owner_stats(dbs.for_owner(owner_id), owner_id)
+    return merge_stats(await dbs.gather(get_global_stats))
+
+
+@router.get("/hash-pool", status_code=status.HTTP_200_OK)
+async def hash_pool_stats(user:user_dependency):
+    # Saturation of the bcrypt worker pool, used to size HASH_POOL_WORKERS per core
+    if user is None or user.get('role') != 'admin':
+        raise HTTPException(status_code=401, detail="Authentication Failed")
+    return get_password_hasher().stats()
+
+
+@router.get("/password-hashes", status_code=status.HTTP_200_OK)
+async def password_hash_costs(user:user_dependency, db:Annotated[AsyncSession, Depends(get_read_db)]):
+    # Stored hashes per scheme and bcrypt cost, and how many are rehashed at their owner's next login
+    if user is None or user.get('role') != 'admin':
+        raise HTTPException(status_code=401, detail="Authentication Failed")
+    hashed_passwords = (await db.scalars(select(Users.hashed_password))).all()
+    return await run_in_threadpool(hash_cost_report, hashed_passwords)
+
+
+@router.get("/token-cache", status_code=status.HTTP_200_OK)
+async def token_cache_stats(user:user_dependency):
+    # Hit/miss counters of the verified-token cache used by get_current_user
+    if user is None or user.get('role') != 'admin':
+        raise HTTPException(status_code=401, detail="Authentication Failed")
+    return get_token_cache().stats()
+
+
+@router.get("/profiles", status_code=status.HTTP_200_OK)
+async def list_profiles(user:user_dependency):
+    # Requests this worker profiled for an X-Profile header, newest first
+    if user is None or user.get('role') != 'admin':
+        raise HTTPException(status_code=401, detail="Authentication Failed")
+    return get_profile_store().list()
+
+
+@router.get("/profiles/hot", status_code=status.HTTP_200_OK)
+async def hot_stacks(
+    user:user_dependency,
+    route: Optional[str] = None,
+    limit: int = Query(default=20, gt=0, le=1000),
+):
+    # Most sampled stacks per route template, from the PROFILE_SAMPLE_RATE share of requests
+    if user is None or user.get('role') != 'admin':
+        raise HTTPException(status_code=401, detail="Authentication Failed")
+    return get_hot_stacks().top(route, limit)
+
+
+@router.delete("/profiles/hot", status_code=status.HTTP_204_NO_CONTENT)
+async def clear_hot_stacks(user:user_dependency):
+    if user is None or user.get('role') != 'admin':
+        raise HTTPException(status_code=401, detail="Authentication Failed")
+    get_hot_stacks().clear()
+
+
+@router.get("/profiles/{profile_id}", status_code=status.HTTP_200_OK)
+async def download_profile(
+    user:user_dependency,
+    profile_id: str,
+    format: Optional[ProfileFormat] = None,
+    limit: int = Query(default=50, gt=0, le=1000),
+):
+    # One profile as a file; `limit` caps the functions listed by format=text
+    if user is None or user.get('role') != 'admin':
+        raise HTTPException(status_code=401, detail="Authentication Failed")
+    profile = get_profile_store().get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found (evicted, or kept by another worker)")
+    return profile_response(profile, format, limit)
@@ -1,29 +1,39 @@
+import hashlib
+import time
 from datetime import datetime, timedelta, timezone
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException, Request, Response
 from fastapi.params import Depends
 from pydantic import BaseModel
 from ..models import Users
 from starlette import status
-from passlib.context import CryptContext
-from ..database import get_db
-from typing import Annotated
-from sqlalchemy.orm import Session
+from ..cache import TTLCache
+from ..config import get_settings
+from ..database import current_user_id, get_db, session_like
+from ..hashing import HashPoolBusy, get_password_hasher
+from ..idempotency import get_idempotency_store, request_fingerprint
+from ..metrics import PASSWORD_REHASHES, TimedRoute, timed_phase
+from ..ratelimit import get_login_rate_limiter
+from typing import Annotated, Optional
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from authlib.jose import jwt, JoseError
-import os
-from dotenv import load_dotenv
+from functools import lru_cache
 
-load_dotenv()
-
-router = APIRouter(prefix="/auth", tags=["auth"])
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+router = APIRouter(prefix="/auth", tags=["auth"], route_class=TimedRoute)
 oauth_bearer = OAuth2PasswordBearer(tokenUrl="auth/token")
 
-SECRET_KEY = os.getenv("SECRET_KEY")
 HEADER = {"alg": "HS256", "typ": "JWT"}
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
-db_dependency = Annotated[Session, Depends(get_db)]
+
+# Verified claims keyed by the token's SHA-256 digest, so repeat requests with
+# the same bearer token skip jwt.decode. Entries never outlive the token's exp.
+@lru_cache
+def get_token_cache() -> TTLCache:
+    settings = get_settings()
+    return TTLCache(maxsize=settings.token_cache_size, ttl=settings.token_cache_ttl)
+
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
 
 
 class CreateUserRequest(BaseModel):  # baseModel return what kind of type should pass
@@ -60,13 +70,27 @@ def create_access_token(username: str, user_id: int, user_role:str, expires_delt
     PAYLOAD = {"sub": username, "id": user_id, "role":user_role}
     expires = datetime.now(timezone.utc) + expires_delta
     PAYLOAD.update({"exp": expires})
-    token = jwt.encode(HEADER, PAYLOAD, SECRET_KEY)
+    token = jwt.encode(HEADER, PAYLOAD, get_settings().secret_key)
     return token
 
 
 async def get_current_user(token: Annotated[str, Depends(oauth_bearer)]):
+    with timed_phase("auth"):  # Reported as the `auth` entry of Server-Timing
+        user = verify_token(token)
+    current_user_id.set(user["id"])  # Lets get_read_db keep this user's reads on the primary after a write
+    return user
+
+
+def verify_token(token: str) -> dict:
+    """Return the user claims of a bearer token, raising 401 if it is invalid or expired"""
+    token_cache = get_token_cache()
+    digest = hashlib.sha256(token.encode()).digest()
+    cached_user = token_cache.get(digest)
+    if cached_user is not None:
+        return dict(cached_user)  # Copy so a handler can't mutate the cached claims
     try:
-        payload = jwt.decode(token, SECRET_KEY)
+        payload = jwt.decode(token, get_settings().secret_key)
+        payload.validate()  # Rejects expired tokens (exp)
         username: str = payload.get("sub")
         user_id: int = payload.get("id")
         user_role:str = payload.get("role")
@@ -75,51 +99,100 @@ async def get_current_user(token: Annotated[str, Depends(oauth_bearer)]):
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Could not validate user",
             )
-        return {"username": username, "id": user_id, "role":user_role}
+        current_user = {"username": username, "id": user_id, "role":user_role}
+        expires = payload.get("exp")
+        if expires is not None:
+            token_cache.set(digest, current_user, ttl=expires - time.time())
+        return dict(current_user)
     except JoseError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate user"
         )
 
 
-def authenticate_user(username: str, password: str, db):
-    user = db.query(Users).filter(Users.username == username).first()
+async def authenticate_user(username: str, password: str, db, background_tasks: Optional[BackgroundTasks] = None):
+    user = await db.scalar(select(Users).where(Users.username == username))
     if not user:
         return False
-    if not bcrypt_context.verify(password, user.hashed_password):
+    verified, needs_update = await get_password_hasher().verify_needs_update(password, user.hashed_password)
+    if not verified:
         return False
+    if needs_update and background_tasks is not None:
+        # Hashed at an old cost/scheme: redo it after the response is sent, the login doesn't wait for it
+        background_tasks.add_task(rehash_password, db, user.id, user.hashed_password, password)
     return user
 
 
+async def rehash_password(db, user_id: int, old_hash: str, password: str):
+    """Replace an outdated hash with one at the current scheme and cost"""
+    try:
+        new_hash = await get_password_hasher().hash(password)
+    except HashPoolBusy:
+        PASSWORD_REHASHES.inc("skipped")  # Logins come first, the next one tries again
+        return
+    session = session_like(db)  # The request's session is closed by now
+    try:
+        # Only if the password wasn't changed in the meantime
+        await session.execute(
+            update(Users).where(Users.id == user_id, Users.hashed_password == old_hash).values(hashed_password=new_hash)
+        )
+        await session.commit()
+    finally:
+        await session.close()
+    PASSWORD_REHASHES.inc("updated")
+
+
 @router.post("/", status_code=status.HTTP_201_CREATED)
-async def create_user(db: db_dependency, create_user_request: CreateUserRequest):
-    create_user_model = Users(
-        email=create_user_request.email,  # we have to assign each as hashed password and password is diff in baseModel class and actual class
-        username=create_user_request.username,  # therefore cant use Todos(**create_user_request.model_dump())
-        first_name=create_user_request.first_name,
-        last_name=create_user_request.last_name,
-        hashed_password=bcrypt_context.hash(create_user_request.password),
-        is_active=True,
-        role=create_user_request.role,
-        phone_number=create_user_request.phone_number
-    )
+async def create_user(
+    db: db_dependency,
+    create_user_request: CreateUserRequest,
+    response: Response,
+    idempotency_key: Annotated[Optional[str], Header(max_length=255)] = None,
+):
+    async def create():
+        create_user_model = Users(
+            email=create_user_request.email,  # we have to assign each as hashed password and password is diff in baseModel class and actual class
+            username=create_user_request.username,  # therefore cant use Todos(**create_user_request.model_dump())
+            first_name=create_user_request.first_name,
+            last_name=create_user_request.last_name,
+            hashed_password=await get_password_hasher().hash(create_user_request.password),
+            is_active=True,
+            role=create_user_request.role,
+            phone_number=create_user_request.phone_number
+        )
+
+        db.add(create_user_model)
+        await db.commit()
+
+    # A retried signup is answered from the store: no second bcrypt hash, no duplicate user.
+    # There is no user yet to scope the key by: scope it by the username, so two clients
+    # picking the same key don't collide, and a reused key with another body still gets 422
+    scope = f"create_user:{request_fingerprint(create_user_request.username)}"
+    return await get_idempotency_store().run(scope, idempotency_key, create_user_request, response, create)
+
 
-    db.add(create_user_model)
-    db.commit()
+async def rate_limited_login_form(
+    request: Request, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+) -> OAuth2PasswordRequestForm:
+    # Resolved before the session dependency: a rejected attempt never reaches the database or bcrypt
+    client_ip = request.client.host if request.client else None
+    await get_login_rate_limiter().check(ip=client_ip, username=form_data.username)
+    return form_data
 
 
 @router.post("/token", response_model=Token, status_code=status.HTTP_200_OK)
 async def login_for_access_token(
-    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends(rate_limited_login_form)],
     db: db_dependency,
+    background_tasks: BackgroundTasks,
 ):
-    user = authenticate_user(form_data.username, form_data.password, db)
+    user = await authenticate_user(form_data.username, form_data.password, db, background_tasks)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate user"
         )
     token = create_access_token(
-        user.username, user.id, user.role, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        user.username, user.id, user.role, timedelta(minutes=get_settings().access_token_expire_minutes)
     )
 
     return {"access_token": token, "token_type": "bearer"}
@@ -1,22 +1,40 @@
-from typing import Annotated
-from fastapi import Depends, APIRouter, HTTPException, Path
-from ..models import Todos
+from datetime import datetime, timezone
+from typing import Annotated, Optional
+from fastapi import Body, Depends, APIRouter, Header, HTTPException, Path, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from ..etags import bump_todo_versions, etag_matches, get_todo_version, make_etag, not_modified
+from ..events import event_stream, get_event_broker
+from ..export import ExportFormat, export_response
+from ..idempotency import get_idempotency_store
+from ..models import ArchivedTodos, Todos
+from ..pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, TodoSort, paginate_todos
+from ..schemas import ARCHIVED_TODO_OUT_COLUMNS, TODO_OUT_COLUMNS, ArchivedTodoPage, BulkResults, TodoOut, TodoPage, TodoStatsOut
+from ..search import search_todos
+from ..shards import assign_todo_ids, get_todo_db, get_todo_read_db, todo_session
+from ..stats import get_owner_stats
 from pydantic import BaseModel, Field
 from starlette import status
-from ..database import get_db
-from sqlalchemy.orm import Session
+from ..config import get_settings
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from .auth import get_current_user
+from ..metrics import TimedRoute
+from ..writes import commit_write
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 # Type annotations for dependency injection
-db_dependency = Annotated[Session, Depends(get_db)]  # Database session dependency
+# Declare the user before the session: the session goes to the user's shard
 user_dependency = Annotated[dict, Depends(get_current_user)]  # User authentication dependency
+db_dependency = Annotated[AsyncSession, Depends(get_todo_db)]  # Session on the user's shard
+read_db_dependency = Annotated[AsyncSession, Depends(get_todo_read_db)]  # Same, or a replica when unsharded
+
+MAX_BULK_ITEMS = 5000  # Upper bound on items per bulk request, keeps one transaction reasonably short
 
 
 class TodoRequest(BaseModel):
     """Schema for Todo request validation"""
-    title: str = Field(min_length=1)  # Title must have at least 1 character
+    title: str = Field(min_length=1, max_length=200)  # Title length: 1-200 chars
     description: str = Field(min_length=1, max_length=100)  # Description length: 1-100 chars
     priority: int = Field(gt=0, lt=6)  # Priority must be between 1 and 5
     complete: bool  # Todo completion status
@@ -33,26 +51,174 @@ class TodoRequest(BaseModel):
     }
 
 
-@router.get("/", status_code=status.HTTP_200_OK)
-async def read_todo(user: user_dependency, db: db_dependency):
-    """Get all todos for the authenticated user"""
+class TodoUpdateRequest(TodoRequest):
+    """Schema for one item of a bulk update"""
+    id: int = Field(gt=0)
+
+
+bulk_ids = Annotated[list[Annotated[int, Field(gt=0)]], Body(min_length=1, max_length=MAX_BULK_ITEMS)]
+
+
+def todo_row(todo_request: TodoRequest, **extra) -> dict:
+    """Column values for a new todo; completed_at starts the archival clock (see archive.py)"""
+    completed_at = datetime.now(timezone.utc) if todo_request.complete else None
+    return {**todo_request.model_dump(), "completed_at": completed_at, **extra}
+
+
+@router.get("/", status_code=status.HTTP_200_OK, response_model=TodoPage)
+async def read_todo(
+    user: user_dependency,
+    db: read_db_dependency,
+    request: Request,
+    response: Response,
+    complete: Optional[bool] = None,
+    priority: Optional[int] = Query(default=None, gt=0, lt=6),
+    sort: TodoSort = TodoSort.id_asc,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """Get one page of todos for the authenticated user, pass `next_cursor` back as `cursor` for the next page"""
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authenicate failed")
+    # Polling clients send the last ETag back; if the owner's version hasn't moved
+    # the page can't have changed, so answer 304 without touching the todos table
+    version = await get_todo_version(db, user.get("id"))
+    etag = make_etag(user.get("id"), version, "list", sorted(request.query_params.multi_items()))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    stmt = select(*TODO_OUT_COLUMNS).where(Todos.owner_id == user.get("id"))  # Retrieving todos filtered by user's owner_id (foreign key)
+    if complete is not None:
+        stmt = stmt.where(Todos.complete == complete)
+    if priority is not None:
+        stmt = stmt.where(Todos.priority == priority)
+    return await paginate_todos(db, stmt, sort, limit, cursor)
+
+
+# Declared before /todos/{todo_id} so "events", "stats", "search", "archived" and "export" are not parsed as ids
+@router.get("/todos/events", response_class=StreamingResponse)
+async def todo_events(
+    user: user_dependency,
+    db: read_db_dependency,
+    request: Request,
+    last_event_id: Annotated[Optional[int], Header()] = None,
+):
+    """Server-sent events for every change to the authenticated user's todos.
+
+    Each event's id is the user's todo version; browsers send it back as
+    Last-Event-ID when they reconnect and receive the changes they missed,
+    or a `reset` event when those are no longer buffered (reload the list).
+    """
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authenicate failed")
+    if last_event_id is None:
+        current_version = await get_todo_version(db, user.get("id"))
+        await db.rollback()  # Give the connection back to the pool, the stream may stay open for hours
+    else:
+        # Replay or reset is decided against the latest version: a lagging replica would hide missed changes
+        async with todo_session() as primary:
+            current_version = await get_todo_version(primary, user.get("id"))
+    broker = get_event_broker()
+    subscription = broker.subscribe(user.get("id"), last_event_id, current_version)
+    return StreamingResponse(
+        event_stream(request, broker, subscription, heartbeat=get_settings().events_heartbeat),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/todos/stats", status_code=status.HTTP_200_OK, response_model=TodoStatsOut)
+async def read_todo_stats(user: user_dependency, db: read_db_dependency, request: Request, response: Response):
+    """Open/completed todo counts of the authenticated user, overall and per priority
+
+    Archived todos are not counted: `completed` drops as the archival job moves them out.
+    """
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authenicate failed")
+    version = await get_todo_version(db, user.get("id"))
+    etag = make_etag(user.get("id"), version, "stats")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return await get_owner_stats(db, user.get("id"))  # Summary rows kept current by triggers, never a scan of todos
+
+
+@router.get("/todos/search", status_code=status.HTTP_200_OK, response_model=TodoPage)
+async def search_todo(
+    user: user_dependency,
+    db: read_db_dependency,
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """Full-text search over the authenticated user's todo titles and descriptions, best match first"""
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authenicate failed")
+    # No ETag here: relevance scores depend on the whole index, not just this owner's todos
+    return await search_todos(db, user.get("id"), q, limit, cursor)
+
+
+@router.get("/todos/archived", status_code=status.HTTP_200_OK, response_model=ArchivedTodoPage)
+async def read_archived_todos(
+    user: user_dependency,
+    db: read_db_dependency,
+    request: Request,
+    response: Response,
+    priority: Optional[int] = Query(default=None, gt=0, lt=6),
+    sort: TodoSort = TodoSort.id_asc,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """Get one page of the authenticated user's archived todos (completed ones moved out by the archival job)"""
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authenicate failed")
-    return (
-        db.query(Todos).filter(Todos.owner_id == user.get("id")).all()
-    )  # Retrieving todos filtered by user's owner_id (foreign key)
+    version = await get_todo_version(db, user.get("id"))  # Archiving bumps the version like any other write
+    etag = make_etag(user.get("id"), version, "archived", sorted(request.query_params.multi_items()))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    stmt = select(*ARCHIVED_TODO_OUT_COLUMNS).where(ArchivedTodos.owner_id == user.get("id"))
+    if priority is not None:
+        stmt = stmt.where(ArchivedTodos.priority == priority)
+    return await paginate_todos(db, stmt, sort, limit, cursor, model=ArchivedTodos)
 
 
-@router.get("/todos/{todo_id}", status_code=status.HTTP_200_OK)
+@router.get("/todos/export", response_class=StreamingResponse)
+async def export_todos(
+    user: user_dependency,
+    db: read_db_dependency,
+    request: Request,
+    format: ExportFormat = ExportFormat.ndjson,
+    complete: Optional[bool] = None,
+    priority: Optional[int] = Query(default=None, gt=0, lt=6),
+):
+    """Stream all of the authenticated user's todos as NDJSON or CSV (gzipped if the client accepts it)"""
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authenicate failed")
+    stmt = select(*TODO_OUT_COLUMNS).where(Todos.owner_id == user.get("id"))
+    if complete is not None:
+        stmt = stmt.where(Todos.complete == complete)
+    if priority is not None:
+        stmt = stmt.where(Todos.priority == priority)
+    stmt = stmt.order_by(Todos.id)
+    return export_response(request, [(db, stmt)], [column.key for column in TODO_OUT_COLUMNS], format, "todos")
+
+
+@router.get("/todos/{todo_id}", status_code=status.HTTP_200_OK, response_model=TodoOut)
 async def read_todo_by_id(
-    user: user_dependency, db: db_dependency, todo_id: int = Path(gt=0)
+    user: user_dependency, db: read_db_dependency, request: Request, response: Response, todo_id: int = Path(gt=0)
 ):
     """Get a specific todo by ID for the authenticated user"""
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authenicate failed")
-    todo_model = (
-        db.query(Todos).filter(Todos.id == todo_id).filter(Todos.owner_id == user.get("id")).first()
-    )  # Ensure user can only access their own todos
+    version = await get_todo_version(db, user.get("id"))
+    etag = make_etag(user.get("id"), version, "todo", todo_id)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    todo_model = (await db.execute(
+        select(*TODO_OUT_COLUMNS).where(Todos.id == todo_id).where(Todos.owner_id == user.get("id"))
+    )).first()  # Ensure user can only access their own todos
     if todo_model is not None:
         return todo_model
     raise HTTPException(status_code=404, detail="Todo not found")
@@ -60,51 +226,213 @@ async def read_todo_by_id(
 
 @router.post("/todos", status_code=status.HTTP_200_OK)
 async def create_todo(
-    user: user_dependency, db: db_dependency, todo_request: TodoRequest  # Make sure user is authenticated
+    user: user_dependency,  # Make sure user is authenticated
+    db: db_dependency,
+    todo_request: TodoRequest,
+    response: Response,
+    idempotency_key: Annotated[Optional[str], Header(max_length=255)] = None,
 ):
-    """Create a new todo for the authenticated user"""
+    """Create a new todo for the authenticated user.
+
+    Retries that send the same Idempotency-Key get the first response back
+    instead of creating the todo again.
+    """
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authenicate failed")
-    todo_model = Todos(
-        **todo_request.model_dump(), owner_id=user.get("id")
-    )  # Create todo with user's ID as owner_id (user is dict, use get() to retrieve id)
-    db.add(todo_model)
-    db.commit()
+
+    async def create():
+        row = todo_row(todo_request, owner_id=user.get("id"))  # Create todo with user's ID as owner_id (user is dict, use get() to retrieve id)
+        await assign_todo_ids([row])  # Ids unique across shards when sharded
+
+        async def write(db):
+            todo_id = await db.scalar(insert(Todos).values(**row).returning(Todos.id))
+            versions = await bump_todo_versions(db, [user.get("id")])  # Invalidates the owner's ETags in the same transaction
+            return todo_id, versions
+
+        todo_id, versions = await commit_write(db, write)
+        # Published only once committed, so subscribers never see a change that was rolled back
+        await get_event_broker().publish_changes(versions, "created", {user.get("id"): [todo_id]})
+
+    return await get_idempotency_store().run(
+        f"create_todo:{user.get('id')}", idempotency_key, todo_request, response, create
+    )
+
+
+# Bulk endpoints: each request is one transaction (or part of one batch, see writes.py)
+# and one statement per kind of write, and returns a result per item (in request order) instead of failing as a whole.
+# They are declared before /todos/{todo_id} so "bulk" is not parsed as an id.
+@router.post("/todos/bulk", status_code=status.HTTP_200_OK, response_model=BulkResults)
+async def create_todos_bulk(
+    user: user_dependency,
+    db: db_dependency,
+    todo_requests: Annotated[list[TodoRequest], Body(min_length=1, max_length=MAX_BULK_ITEMS)],
+):
+    """Create many todos for the authenticated user with a single multi-row INSERT"""
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authenicate failed")
+    rows = [todo_row(todo_request, owner_id=user.get("id")) for todo_request in todo_requests]
+    await assign_todo_ids(rows)
+
+    async def write(db):
+        result = await db.execute(insert(Todos).returning(Todos.id, sort_by_parameter_order=True), rows)
+        return result.scalars().all(), await bump_todo_versions(db, [user.get("id")])
+
+    created_ids, versions = await commit_write(db, write)
+    await get_event_broker().publish_changes(versions, "created", {user.get("id"): created_ids})
+    return {"results": [{"id": todo_id, "status": "created"} for todo_id in created_ids]}
+
+
+# Core UPDATE ... WHERE id = ? AND owner_id = ?, the SET columns come from each row's keys
+BULK_UPDATE = (
+    update(Todos.__table__)
+    .where(Todos.id == bindparam("todo_id"))
+    .where(Todos.owner_id == bindparam("todo_owner_id"))
+)
+
+
+@router.put("/todos/bulk", status_code=status.HTTP_200_OK, response_model=BulkResults)
+async def update_todos_bulk(
+    user: user_dependency,
+    db: db_dependency,
+    todo_requests: Annotated[list[TodoUpdateRequest], Body(min_length=1, max_length=MAX_BULK_ITEMS)],
+):
+    """Update many todos of the authenticated user, ids the user doesn't own are reported as not_found"""
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authenicate failed")
+    requested_ids = {todo_request.id for todo_request in todo_requests}
+
+    async def write(db):
+        completed_at = dict((await db.execute(
+            select(Todos.id, Todos.completed_at).where(Todos.id.in_(requested_ids)).where(Todos.owner_id == user.get("id"))
+        )).all())
+        owned_ids = set(completed_at)
+        rows = []
+        for todo_request in todo_requests:
+            if todo_request.id not in owned_ids:
+                continue
+            row = todo_row(todo_request)
+            if todo_request.complete and completed_at[todo_request.id] is not None:
+                row["completed_at"] = completed_at[todo_request.id]  # Already complete: keeps its completion time
+            rows.append(row)
+        if not rows:
+            return owned_ids, {}
+        # One executemany, scoped to the owner like every other todo write
+        await db.execute(BULK_UPDATE, [
+            {**row, "todo_id": row.pop("id"), "todo_owner_id": user.get("id")} for row in rows
+        ])
+        return owned_ids, await bump_todo_versions(db, [user.get("id")])
+
+    owned_ids, versions = await commit_write(db, write)
+    await get_event_broker().publish_changes(versions, "updated", {user.get("id"): owned_ids})
+    return {"results": [
+        {"id": todo_request.id, "status": "updated" if todo_request.id in owned_ids else "not_found"}
+        for todo_request in todo_requests
+    ]}
+
+
+@router.post("/todos/bulk/complete", status_code=status.HTTP_200_OK, response_model=BulkResults)
+async def complete_todos_bulk(user: user_dependency, db: db_dependency, todo_ids: bulk_ids):
+    """Mark many todos of the authenticated user as complete"""
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authenicate failed")
+
+    async def write(db):
+        result = await db.execute(
+            update(Todos)
+            .where(Todos.id.in_(todo_ids))
+            .where(Todos.owner_id == user.get("id"))
+            .values(complete=True, completed_at=func.coalesce(Todos.completed_at, datetime.now(timezone.utc)))
+            .returning(Todos.id)
+            .execution_options(synchronize_session=False)
+        )
+        completed_ids = set(result.scalars().all())
+        return completed_ids, await bump_todo_versions(db, [user.get("id")] if completed_ids else [])
+
+    completed_ids, versions = await commit_write(db, write)
+    await get_event_broker().publish_changes(versions, "updated", {user.get("id"): completed_ids})
+    return {"results": [
+        {"id": todo_id, "status": "completed" if todo_id in completed_ids else "not_found"}
+        for todo_id in todo_ids
+    ]}
+
+
+@router.post("/todos/bulk/delete", status_code=status.HTTP_200_OK, response_model=BulkResults)
+async def delete_todos_bulk(user: user_dependency, db: db_dependency, todo_ids: bulk_ids):
+    """Delete many todos of the authenticated user"""
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authenicate failed")
+
+    async def write(db):
+        result = await db.execute(
+            delete(Todos)
+            .where(Todos.id.in_(todo_ids))
+            .where(Todos.owner_id == user.get("id"))
+            .returning(Todos.id)
+            .execution_options(synchronize_session=False)
+        )
+        deleted_ids = set(result.scalars().all())
+        return deleted_ids, await bump_todo_versions(db, [user.get("id")] if deleted_ids else [])
+
+    deleted_ids, versions = await commit_write(db, write)
+    await get_event_broker().publish_changes(versions, "deleted", {user.get("id"): deleted_ids})
+    return {"results": [
+        {"id": todo_id, "status": "deleted" if todo_id in deleted_ids else "not_found"}
+        for todo_id in todo_ids
+    ]}
 
 
 @router.put("/todos/{todo_id}", status_code=status.HTTP_200_OK)
 async def update_todo(
-    db: db_dependency, user: user_dependency, todo_request: TodoRequest, todo_id: int = Path(gt=0)
+    user: user_dependency, db: db_dependency, todo_request: TodoRequest, todo_id: int = Path(gt=0)
 ):
     """Update an existing todo by ID for the authenticated user"""
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authenicate failed")
-    todo_model = db.query(Todos).filter(Todos.id == todo_id).filter(Todos.owner_id == user.get('id')).first()
-    if todo_model is None:
-        raise HTTPException(status_code=404, detail="not found")
-    
-    # Update todo fields with new values
-    todo_model.title = todo_request.title
-    todo_model.description = todo_request.description
-    todo_model.priority = todo_request.priority
-    todo_model.complete = todo_request.complete
-
-    db.add(todo_model)
-    db.commit()
+
+    async def write(db):
+        # Update todo fields with new values in a single UPDATE ... WHERE id AND owner_id,
+        # no rows matched means the todo doesn't exist or isn't the user's
+        result = await db.execute(
+            update(Todos)
+            .where(Todos.id == todo_id)
+            .where(Todos.owner_id == user.get('id'))
+            .values(
+                title=todo_request.title,
+                description=todo_request.description,
+                priority=todo_request.priority,
+                complete=todo_request.complete,
+                completed_at=func.coalesce(Todos.completed_at, datetime.now(timezone.utc)) if todo_request.complete else None,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            raise HTTPException(status_code=404, detail="not found")
+        return await bump_todo_versions(db, [user.get('id')])
+
+    versions = await commit_write(db, write)
+    await get_event_broker().publish_changes(versions, "updated", {user.get('id'): [todo_id]})
 
  # Delete a todo by ID for the authenticated user
 # This function ensures that only the owner of the todo (authenticated user) can delete it.
 # It matches the `todo_id` with the `owner_id` from the JWT payload to verify ownership.
-# If the todo does not exist or does not belong to the user, a 404 error is raised.
-# After successful verification, the todo is deleted from the database.
+# Ownership check and delete are one DELETE ... WHERE id AND owner_id statement:
+# if it matches no row the todo does not exist or does not belong to the user, and a 404 error is raised.
 @router.delete("/todos/{todo_id}", status_code=status.HTTP_200_OK)
-async def delete_todo(db: db_dependency, user: user_dependency, todo_id: int = Path(gt=0)):
+async def delete_todo(user: user_dependency, db: db_dependency, todo_id: int = Path(gt=0)):
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authenicate failed")
-    todo_model = db.query(Todos).filter(Todos.id == todo_id).filter(Todos.owner_id == user.get('id')).first()
-    if todo_model is None:
-        raise HTTPException(status_code=404, detail="not found")
-    
-    # Delete the todo from database
-    db.query(Todos).filter(Todos.id == todo_id).filter(Todos.owner_id == user.get('id')).delete()
-    db.commit()
+
+    async def write(db):
+        # Delete the todo from database
+        result = await db.execute(
+            delete(Todos)
+            .where(Todos.id == todo_id)
+            .where(Todos.owner_id == user.get('id'))
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            raise HTTPException(status_code=404, detail="not found")
+        return await bump_todo_versions(db, [user.get('id')])
+
+    versions = await commit_write(db, write)
+    await get_event_broker().publish_changes(versions, "deleted", {user.get('id'): [todo_id]})
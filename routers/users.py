@@ -3,16 +3,20 @@ from fastapi.params import Depends
 from pydantic import BaseModel, Field
 from starlette import status
 from typing import Annotated
-from ..database import get_db
+from ..database import get_db, get_read_db
 from .auth import get_current_user
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..models import Users
-from passlib.context import CryptContext
+from ..hashing import get_password_hasher
+from ..metrics import TimedRoute
+from ..schemas import USER_OUT_COLUMNS, UserOut
 
 # Create router for user-related endpoints with /user prefix
 router=APIRouter(
     prefix="/user",
-    tags=["user current details"]
+    tags=["user current details"],
+    route_class=TimedRoute,
 )
 
 # Pydantic model for password verification and update requests
@@ -26,17 +30,20 @@ class UserPhoneNumber(BaseModel):
     
 # Type annotations for dependency injection
 user_dependency = Annotated[dict, Depends(get_current_user)]  # Gets current authenticated user
-db_dependency = Annotated[Session, Depends(get_db)]  # Gets database session
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")  # Password hashing context
+db_dependency = Annotated[AsyncSession, Depends(get_db)]  # Gets database session
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_db)]  # Replica session for read-only handlers
 
-@router.get("/", status_code=status.HTTP_200_OK)
-async def get_user(user:user_dependency, db:db_dependency):
+@router.get("/", status_code=status.HTTP_200_OK, response_model=UserOut)
+async def get_user(user:user_dependency, db:read_db_dependency):
     # Check if user is authenticated and has admin role
     if user is None or user.get('role') != 'admin':
         raise HTTPException(status_code=401, detail="Authentication Failed: You have to be Admin")
     
-    # Query database to get user details by ID
-    return db.query(Users).filter(Users.id == user.get('id')).first()
+    # Query database to get user details by ID, only the columns in UserOut (never hashed_password)
+    user_model = (await db.execute(select(*USER_OUT_COLUMNS).where(Users.id == user.get('id')))).first()
+    if user_model is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user_model
 
 @router.put("/password", status_code=status.HTTP_204_NO_CONTENT)
 async def change_password(user:user_dependency, db:db_dependency, user_verification:UserVerfication):
@@ -45,22 +52,23 @@ async def change_password(user:user_dependency, db:db_dependency, user_verificat
         raise HTTPException(status_code=401, detail="Authentication Failed: You have to be Admin")
     
     # Get the user record from database
-    user_model = db.query(Users).filter(Users.id == user.get('id')).first()
+    user_model = await db.scalar(select(Users).where(Users.id == user.get('id')))
 
     # Verify the current password matches the stored hash
-    # bcrypt_context.verify(plain_password, hashed_password) - ORDER MATTERS!
+    # get_password_hasher().verify(plain_password, hashed_password) - ORDER MATTERS!
     # First param: plain text password entered by user
     # Second param: stored hashed password from database
-    if  not bcrypt_context.verify(user_verification.password, user_model.hashed_password):
+    # Runs on the bounded hash pool, answers 503 + Retry-After when it is saturated
+    if  not await get_password_hasher().verify(user_verification.password, user_model.hashed_password):
         raise HTTPException(status_code=401, detail="Error on password verification for old")
     
     # Hash the new password using bcrypt
-    hashed_new_password = bcrypt_context.hash(user_verification.new_password)
+    hashed_new_password = await get_password_hasher().hash(user_verification.new_password)
     
     # Update user's password in database
     user_model.hashed_password = hashed_new_password
     db.add(user_model)  # Mark the object as modified
-    db.commit()  # Commit changes to database
+    await db.commit()  # Commit changes to database
 
 @router.put("/phone_number", status_code=status.HTTP_204_NO_CONTENT)
 async def change_phone_number(user:user_dependency, db:db_dependency, phone_number:UserPhoneNumber):
@@ -68,10 +76,13 @@ async def change_phone_number(user:user_dependency, db:db_dependency, phone_numb
     if user is None or user.get('role') != 'admin':
         raise HTTPException(status_code=401, detail="Authentication Failed: You have to be Admin")
     
-    # Get the user record from database
-    user_model = db.query(Users).filter(Users.id == user.get('id')).first()
-    
-    # Update user's phone number in database
-    user_model.phone_number = phone_number.phone_number
-    db.add(user_model)  # Mark the object as modified
-    db.commit()  # Commit changes to database
\ No newline at end of file
+    # Update user's phone number in database with a single UPDATE, no SELECT first
+    result = await db.execute(
+        update(Users)
+        .where(Users.id == user.get('id'))
+        .values(phone_number=phone_number.phone_number)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="User not found")
+    await db.commit()  # Commit changes to database
\ No newline at end of file
@@ -0,0 +1,76 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+from .models import ArchivedTodos, Todos, Users
+
+
+# Response models: they fix the JSON shape of each endpoint, keep columns such
+# as hashed_password out of responses, and let FastAPI serialize rows with
+# pydantic's compiled serializer instead of introspecting ORM objects.
+class TodoOut(BaseModel):
+    id: int
+    title: str
+    description: str
+    priority: int
+    complete: bool
+    owner_id: int
+
+    model_config = {"from_attributes": True}
+
+
+class TodoPage(BaseModel):
+    items: list[TodoOut]
+    next_cursor: Optional[str] = None  # Pass back as `cursor` to get the next page, None on the last page
+
+
+class ArchivedTodoOut(TodoOut):
+    completed_at: Optional[datetime] = None
+    archived_at: datetime
+
+
+class ArchivedTodoPage(BaseModel):
+    items: list[ArchivedTodoOut]
+    next_cursor: Optional[str] = None
+
+
+class UserOut(BaseModel):
+    id: int
+    email: str
+    username: str
+    first_name: str
+    last_name: str
+    is_active: bool
+    role: str
+    phone_number: Optional[str] = None
+
+    model_config = {"from_attributes": True}
+
+
+class BulkItemResult(BaseModel):
+    id: int
+    status: str
+
+
+class BulkResults(BaseModel):
+    results: list[BulkItemResult]
+
+
+class PriorityStats(BaseModel):
+    priority: int
+    open: int
+    completed: int
+
+
+class TodoStatsOut(BaseModel):
+    total: int
+    open: int
+    completed: int
+    by_priority: list[PriorityStats]
+
+
+# Columns to SELECT for each response model, so queries load exactly what is returned
+TODO_OUT_COLUMNS = tuple(getattr(Todos, name) for name in TodoOut.model_fields)
+ARCHIVED_TODO_OUT_COLUMNS = tuple(getattr(ArchivedTodos, name) for name in ArchivedTodoOut.model_fields)
+USER_OUT_COLUMNS = tuple(getattr(Users, name) for name in UserOut.model_fields)
@@ -0,0 +1,110 @@
+import re
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import DDL, and_, column, event, func, literal_column, or_, select, table
+from starlette import status
+
+from .models import Todos
+from .pagination import decode_cursor, encode_cursor
+from .schemas import TODO_OUT_COLUMNS
+
+# Full-text search over todo title + description.
+#
+# SQLite: an external-content FTS5 table (it stores only the index, the text
+# stays in `todos`) kept in sync by triggers, so bulk Core UPDATE/DELETE
+# statements are covered too, not just ORM flushes. owner_id is indexed as a
+# token so a query only merges the caller's postings instead of ranking every
+# owner's matches and filtering afterwards.
+# Postgres: a GIN index on the tsvector expression; Postgres maintains it on
+# every write, no triggers needed. Queries use the exact same expression so
+# the planner picks the index.
+#
+# Both use English stemming ("buying" matches "buy") and AND the query terms.
+# The same DDL is applied by the 7d4f1b2c8e53 migration.
+
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5("
+    "title, description, owner_id, content='todos', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS todos_fts_ai AFTER INSERT ON todos BEGIN "
+    "INSERT INTO todos_fts(rowid, title, description, owner_id) VALUES (new.id, new.title, new.description, new.owner_id); END",
+    "CREATE TRIGGER IF NOT EXISTS todos_fts_ad AFTER DELETE ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, title, description, owner_id) VALUES ('delete', old.id, old.title, old.description, old.owner_id); END",
+    # Only indexed columns touch the index; toggling `complete` or priority doesn't
+    "CREATE TRIGGER IF NOT EXISTS todos_fts_au AFTER UPDATE OF title, description, owner_id ON todos BEGIN "
+    "INSERT INTO todos_fts(todos_fts, rowid, title, description, owner_id) VALUES ('delete', old.id, old.title, old.description, old.owner_id); "
+    "INSERT INTO todos_fts(rowid, title, description, owner_id) VALUES (new.id, new.title, new.description, new.owner_id); END",
+]
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS todos_fts_au",
+    "DROP TRIGGER IF EXISTS todos_fts_ad",
+    "DROP TRIGGER IF EXISTS todos_fts_ai",
+    "DROP TABLE IF EXISTS todos_fts",
+]
+
+POSTGRES_SEARCH_VECTOR = "to_tsvector('english'::regconfig, coalesce(title, '') || ' ' || coalesce(description, ''))"
+POSTGRES_SEARCH_INDEX = f"CREATE INDEX IF NOT EXISTS ix_todos_search ON todos USING GIN ({POSTGRES_SEARCH_VECTOR})"
+
+# Also build the search structures when the schema comes from create_all (tests, benchmarks)
+for statement in SQLITE_FTS_DDL:
+    event.listen(Todos.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in SQLITE_FTS_DROP:
+    event.listen(Todos.__table__, "before_drop", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Todos.__table__, "after_create", DDL(POSTGRES_SEARCH_INDEX).execute_if(dialect="postgresql"))
+
+todos_fts = table("todos_fts", column("rowid"), column("todos_fts"))
+# Qualified column names; literal text (not bound parameters) so it matches the index expression
+search_vector = literal_column(
+    "to_tsvector('english'::regconfig, coalesce(todos.title, '') || ' ' || coalesce(todos.description, ''))"
+)
+
+
+def search_terms(q: str) -> list:
+    # Only word characters reach the MATCH expression, so user input can't
+    # inject FTS5 query syntax (quotes, NEAR, column filters, ...)
+    terms = re.findall(r"\w+", q)
+    if not terms:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Search query has no searchable terms")
+    return terms
+
+
+def search_statement(dialect_name: str, owner_id: int, q: str):
+    """Select TodoOut columns plus `rank` (lower is better) of one owner's todos matching `q`"""
+    terms = search_terms(q)
+    if dialect_name == "postgresql":
+        query = func.plainto_tsquery(literal_column("'english'::regconfig"), " ".join(terms))
+        rank = -func.ts_rank(search_vector, query)
+        stmt = select(*TODO_OUT_COLUMNS, rank.label("rank")).where(search_vector.op("@@")(query))
+    else:
+        match = f'owner_id : "{int(owner_id)}" AND ' + " AND ".join(f'"{term}"' for term in terms)
+        # Negative, best matches first in ascending order; the owner_id column doesn't count towards relevance
+        rank = func.bm25(literal_column("todos_fts"), 1.0, 1.0, 0.0)
+        stmt = (
+            select(*TODO_OUT_COLUMNS, rank.label("rank"))
+            .join_from(todos_fts, Todos, Todos.id == todos_fts.c.rowid)
+            .where(todos_fts.c.todos_fts.op("MATCH")(match))
+        )
+    return stmt.where(Todos.owner_id == owner_id), rank
+
+
+async def search_todos(db, owner_id: int, q: str, limit: int, cursor: Optional[str] = None):
+    """One page of an owner's todos matching `q`, best match first.
+
+    Paginated with a keyset cursor on (rank, id) like the list endpoints, so a
+    deep page costs the same as the first one.
+    """
+    stmt, rank = search_statement(db.bind.dialect.name, owner_id, q)
+    if cursor is not None:
+        last = decode_cursor(cursor)
+        if not isinstance(last.get("rank"), (int, float)):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        stmt = stmt.where(or_(rank > last["rank"], and_(rank == last["rank"], Todos.id > last["id"])))
+
+    rows = (await db.execute(stmt.order_by(rank, Todos.id).limit(limit + 1))).all()
+    items = rows[:limit]
+
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor({"rank": items[-1].rank, "id": items[-1].id})
+
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,329 @@
+"""Owner-based sharding of the todo tables.
+
+With DATABASE_SHARD_URLS set, todos and the per-owner tables that follow
+them (archived_todos, todo_versions, todo_stats, the search index) live on N shard
+databases; users stay on DATABASE_URL. An owner's shard comes from a
+consistent-hash ring over the shard names, so adding a shard moves only
+about 1/N of the owners. Todo ids are handed out in blocks from
+DATABASE_URL so they stay unique across shards, and a todo keeps its id
+when it moves.
+
+Entries are `name=url` (or a bare url, named shard0, shard1, ... by
+position). Keep names stable: they, not the urls, decide placement.
+
+Move owners onto the shard the ring assigns them with:
+
+    python -m todoapp_fastapi.shards rebalance [--dry-run] [--drain URL ...]
+
+Run it once before switching the app to a new shard list (bulk copy) and
+once right after (moves whatever was written in between). --drain lists
+shards being removed.
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import logging
+import re
+import threading
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import delete, func, make_url, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from starlette.concurrency import run_in_threadpool
+
+from .config import get_settings
+from .database import current_user_id, engine_for, open_session, read_session
+from .models import ArchivedTodos, TodoIdBlocks, Todos, TodoStats, TodoVersions
+
+logger = logging.getLogger("uvicorn.error")
+
+VNODES = 128  # Points per shard on the ring, evens out the share of owners per shard
+ID_BLOCK_SIZE = 1000  # Todo ids reserved per trip to DATABASE_URL
+
+
+def safe_url(url: str) -> str:
+    return make_url(url).render_as_string(hide_password=True)
+
+
+def ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent-hash ring mapping owner ids to shard names"""
+
+    def __init__(self, names, vnodes: int = VNODES):
+        points = sorted((ring_hash(f"{name}#{vnode}"), name) for name in names for vnode in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    def node_for(self, key) -> str:
+        index = bisect.bisect(self._hashes, ring_hash(str(key))) % len(self._hashes)
+        return self._names[index]
+
+
+def parse_shard_urls(entries) -> dict:
+    shards = {}
+    for position, entry in enumerate(entries):
+        match = re.match(r"^(\w+)=(.+)$", entry)  # A url's scheme ("sqlite:") never matches \w+=
+        name, url = match.groups() if match else (f"shard{position}", entry)
+        shards[name] = url
+    return shards
+
+
+@dataclass(frozen=True)
+class ShardMap:
+    urls: dict  # shard name -> database url
+    ring: Optional[HashRing]
+
+    @property
+    def sharded(self) -> bool:
+        return self.ring is not None
+
+    def name_for(self, owner_id: int) -> str:
+        return self.ring.node_for(owner_id) if self.sharded else next(iter(self.urls))
+
+    def url_for(self, owner_id: int) -> str:
+        return self.urls[self.name_for(owner_id)]
+
+
+def build_shard_map(entries, database_url: str) -> ShardMap:
+    if not entries:
+        return ShardMap({"primary": database_url}, None)
+    urls = parse_shard_urls(entries)
+    return ShardMap(urls, HashRing(urls))
+
+
+@lru_cache
+def get_shard_map() -> ShardMap:
+    settings = get_settings()
+    return build_shard_map(settings.database_shard_urls, settings.database_url)
+
+
+def require_user_id() -> int:
+    user_id = current_user_id.get()
+    if user_id is None:
+        raise RuntimeError("Declare the todo database dependency after the authenticated user")
+    return user_id
+
+
+def shard_session(owner_id: int):
+    return open_session(get_shard_map().url_for(owner_id), "shard")
+
+
+def todo_session():
+    """Session on the authenticated user's shard, the primary when unsharded"""
+    if get_shard_map().sharded:
+        return shard_session(require_user_id())
+    return open_session(get_settings().database_url)
+
+
+async def get_todo_db():
+    """Session on the authenticated user's shard, where all of their todo rows live.
+
+    Like get_read_db, declare it after the user dependency. Unsharded it is
+    the primary, same as get_db.
+    """
+    async with todo_session() as db:
+        yield db
+
+
+async def get_todo_read_db():
+    """get_todo_db for read-only handlers; unsharded it reads from a replica (see get_read_db)"""
+    if get_shard_map().sharded:
+        async with shard_session(require_user_id()) as db:
+            yield db
+    else:
+        async with read_session() as db:
+            yield db
+
+
+class ShardSessions(dict):
+    """Shard name -> session, for admin handlers that span every owner"""
+
+    def for_owner(self, owner_id: int):
+        shard_map = get_shard_map()
+        return self[shard_map.name_for(owner_id)] if shard_map.sharded else next(iter(self.values()))
+
+    async def gather(self, query) -> list:
+        """Run `query(db)` on every shard concurrently, results in shard order"""
+        return await asyncio.gather(*(query(db) for db in self.values()))
+
+
+@asynccontextmanager
+async def shard_sessions():
+    async with AsyncExitStack() as stack:
+        # Sessions only check out a connection on their first query
+        yield ShardSessions({name: await stack.enter_async_context(open_session(url, "shard"))
+                             for name, url in get_shard_map().urls.items()})
+
+
+async def get_shard_dbs():
+    """One session per shard, or just the primary when unsharded"""
+    if get_shard_map().sharded:
+        async with shard_sessions() as sessions:
+            yield sessions
+    else:
+        async with open_session(get_settings().database_url) as db:
+            yield ShardSessions(primary=db)
+
+
+async def get_shard_read_dbs():
+    """get_shard_dbs for read-only handlers; unsharded it reads from a replica"""
+    if get_shard_map().sharded:
+        async with shard_sessions() as sessions:
+            yield sessions
+    else:
+        async with read_session() as db:
+            yield ShardSessions(primary=db)
+
+
+def dialect_insert(connection):
+    return (postgresql if connection.dialect.name == "postgresql" else sqlite).insert
+
+
+class TodoIdAllocator:
+    """Hands out todo ids from blocks reserved on DATABASE_URL, one round trip per block"""
+
+    def __init__(self, block_size: int = ID_BLOCK_SIZE):
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def allocate(self, count: int) -> list:
+        with self._lock:
+            ids = []
+            while len(ids) < count:
+                if self._next >= self._end:
+                    self._next, self._end = self._reserve(max(self.block_size, count - len(ids)))
+                take = min(count - len(ids), self._end - self._next)
+                ids.extend(range(self._next, self._next + take))
+                self._next += take
+            return ids
+
+    def _reserve(self, size: int) -> tuple:
+        bump = (
+            update(TodoIdBlocks)
+            .where(TodoIdBlocks.name == "todos")
+            .values(next_id=TodoIdBlocks.next_id + size)
+            .returning(TodoIdBlocks.next_id)
+        )
+        with engine_for(get_settings().database_url).begin() as connection:
+            end = connection.scalar(bump)
+            if end is None:
+                # First reservation: start above every id already on a shard
+                start = max_todo_id(get_shard_map()) + 1
+                connection.execute(
+                    dialect_insert(connection)(TodoIdBlocks).values(name="todos", next_id=start).on_conflict_do_nothing()
+                )
+                end = connection.scalar(bump)
+        return end - size, end
+
+
+def max_todo_id(shard_map: ShardMap) -> int:
+    # DATABASE_URL too: todos written there before sharding was switched on may not be moved yet.
+    # Archived todos keep their id, so theirs count as taken.
+    highest = 0
+    for url in {get_settings().database_url, *shard_map.urls.values()}:
+        with engine_for(url, name="shard").connect() as connection:
+            for model in (Todos, ArchivedTodos):
+                highest = max(highest, connection.scalar(select(func.max(model.id))) or 0)
+    return highest
+
+
+@lru_cache
+def get_todo_id_allocator() -> TodoIdAllocator:
+    return TodoIdAllocator()
+
+
+async def assign_todo_ids(rows: list) -> None:
+    """Give new todo rows ids that are unique across shards (unsharded, the database assigns them)"""
+    if not get_shard_map().sharded:
+        return
+    ids = await run_in_threadpool(get_todo_id_allocator().allocate, len(rows))
+    for row, todo_id in zip(rows, ids):
+        row["id"] = todo_id
+
+
+def move_owner(owner_id: int, source_engine, target_engine, batch_size: int) -> int:
+    """Copy an owner's todos, archived todos and version to the target shard, then delete them from the source.
+
+    The copy skips ids already on the target, so a move interrupted between
+    the two commits can simply be run again. Triggers on the target rebuild
+    its search index and stats rows as the todos arrive.
+    """
+    moved = 0
+    with source_engine.begin() as source, target_engine.begin() as target:
+        for model in (Todos, ArchivedTodos):
+            rows = source.execute(
+                select(model.__table__).where(model.owner_id == owner_id).order_by(model.id).execution_options(yield_per=batch_size)
+            ).mappings()
+            for batch in rows.partitions(batch_size):
+                target.execute(dialect_insert(target)(model).on_conflict_do_nothing(), [dict(row) for row in batch])
+                moved += len(batch)
+        # Keep the version (ETags, event ids) increasing on the new shard
+        version = source.scalar(select(TodoVersions.version).where(TodoVersions.owner_id == owner_id))
+        if version is not None:
+            target_version = target.scalar(select(TodoVersions.version).where(TodoVersions.owner_id == owner_id)) or 0
+            target.execute(
+                dialect_insert(target)(TodoVersions)
+                .values(owner_id=owner_id, version=max(version, target_version) + 1)
+                .on_conflict_do_update(index_elements=[TodoVersions.owner_id], set_={"version": max(version, target_version) + 1})
+            )
+        source.execute(delete(Todos).where(Todos.owner_id == owner_id))
+        source.execute(delete(ArchivedTodos).where(ArchivedTodos.owner_id == owner_id))
+        source.execute(delete(TodoVersions).where(TodoVersions.owner_id == owner_id))
+        source.execute(delete(TodoStats).where(TodoStats.owner_id == owner_id))
+    return moved
+
+
+def rebalance(shard_map: ShardMap, drain_urls=(), dry_run: bool = False, batch_size: int = 1000) -> list:
+    """Move every owner that sits on the wrong shard; returns [(owner_id, source url, target url, todos moved)]"""
+    moves = []
+    sources = list(shard_map.urls.values()) + [url for url in drain_urls if url not in shard_map.urls.values()]
+    for source_url in sources:
+        source_engine = engine_for(source_url, name="shard")
+        with source_engine.connect() as connection:
+            owners = set(connection.scalars(select(Todos.owner_id).distinct()))
+            owners |= set(connection.scalars(select(ArchivedTodos.owner_id).distinct()))
+            owners |= set(connection.scalars(select(TodoVersions.owner_id)))
+        for owner_id in sorted(owner for owner in owners if owner is not None):
+            target_url = shard_map.url_for(owner_id)
+            if target_url == source_url:
+                continue
+            moved = 0
+            if not dry_run:
+                moved = move_owner(owner_id, source_engine, engine_for(target_url, name="shard"), batch_size)
+            logger.info("Owner %s: %s -> %s (%d todos)", owner_id, safe_url(source_url), safe_url(target_url), moved)
+            moves.append((owner_id, source_url, target_url, moved))
+    return moves
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and rebalance the todo shards")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebalance_parser = subcommands.add_parser("rebalance", help="move owners onto the shard the ring assigns them")
+    rebalance_parser.add_argument("--dry-run", action="store_true", help="only list the moves")
+    rebalance_parser.add_argument("--drain", action="append", default=[], help="url of a shard being removed")
+    rebalance_parser.add_argument("--batch-size", type=int, default=1000)
+    locate_parser = subcommands.add_parser("locate", help="print the shard of an owner id")
+    locate_parser.add_argument("owner_id", type=int)
+    args = parser.parse_args()
+
+    shard_map = get_shard_map()
+    if args.command == "locate":
+        name = shard_map.name_for(args.owner_id)
+        print(f"{name} {safe_url(shard_map.urls[name])}")
+        return
+    moves = rebalance(shard_map, args.drain, args.dry_run, args.batch_size)
+    logger.info("%s %d owners", "Would move" if args.dry_run else "Moved", len(moves))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,167 @@
+"""Per-owner todo statistics.
+
+`todo_stats` holds one row per (owner, priority, complete) with a count.
+Triggers on `todos` adjust it in the same transaction as every insert,
+update and delete (single, bulk and admin writes alike), so reading an
+owner's stats is a primary-key range lookup of at most ten rows.
+
+Recompute it from scratch (after restoring a backup, or if it is ever in
+doubt) with:
+
+    python -m todoapp_fastapi.stats rebuild
+
+(use the name of the directory the app lives in). With DATABASE_SHARD_URLS
+set it rebuilds every shard.
+"""
+import argparse
+import logging
+
+from sqlalchemy import DDL, Boolean, Integer, cast, delete, event, func, insert, select, text
+
+from .database import engine_for
+from .models import Todos, TodoStats
+from .shards import get_shard_map
+
+logger = logging.getLogger("uvicorn.error")
+
+SQLITE_STATS_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS todo_stats_ai AFTER INSERT ON todos BEGIN "
+    "INSERT INTO todo_stats (owner_id, priority, complete, count) "
+    "VALUES (new.owner_id, coalesce(CAST(new.priority AS INTEGER), 0), coalesce(new.complete, 0), 1) "
+    "ON CONFLICT (owner_id, priority, complete) DO UPDATE SET count = count + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS todo_stats_ad AFTER DELETE ON todos BEGIN "
+    "UPDATE todo_stats SET count = count - 1 WHERE owner_id = old.owner_id "
+    "AND priority = coalesce(CAST(old.priority AS INTEGER), 0) AND complete = coalesce(old.complete, 0); END",
+    # Title/description edits don't move a todo between buckets
+    "CREATE TRIGGER IF NOT EXISTS todo_stats_au AFTER UPDATE OF owner_id, priority, complete ON todos BEGIN "
+    "UPDATE todo_stats SET count = count - 1 WHERE owner_id = old.owner_id "
+    "AND priority = coalesce(CAST(old.priority AS INTEGER), 0) AND complete = coalesce(old.complete, 0); "
+    "INSERT INTO todo_stats (owner_id, priority, complete, count) "
+    "VALUES (new.owner_id, coalesce(CAST(new.priority AS INTEGER), 0), coalesce(new.complete, 0), 1) "
+    "ON CONFLICT (owner_id, priority, complete) DO UPDATE SET count = count + 1; END",
+]
+SQLITE_STATS_DROP = [
+    "DROP TRIGGER IF EXISTS todo_stats_au",
+    "DROP TRIGGER IF EXISTS todo_stats_ad",
+    "DROP TRIGGER IF EXISTS todo_stats_ai",
+]
+
+POSTGRES_STATS_DDL = [
+    """CREATE OR REPLACE FUNCTION todo_stats_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE todo_stats SET count = count - 1
+        WHERE owner_id = OLD.owner_id
+          AND priority = coalesce(OLD.priority::integer, 0)
+          AND complete = coalesce(OLD.complete, false);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO todo_stats (owner_id, priority, complete, count)
+        VALUES (NEW.owner_id, coalesce(NEW.priority::integer, 0), coalesce(NEW.complete, false), 1)
+        ON CONFLICT (owner_id, priority, complete) DO UPDATE SET count = todo_stats.count + 1;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql""",
+    "CREATE TRIGGER todo_stats_sync AFTER INSERT OR DELETE OR UPDATE OF owner_id, priority, complete ON todos "
+    "FOR EACH ROW EXECUTE FUNCTION todo_stats_apply()",
+]
+POSTGRES_STATS_DROP = [
+    "DROP TRIGGER IF EXISTS todo_stats_sync ON todos",
+    "DROP FUNCTION IF EXISTS todo_stats_apply()",
+]
+
+# Also install the triggers when the schema comes from create_all (tests, benchmarks).
+# Table creation order doesn't matter, todo_stats is only looked up when a trigger fires.
+for statement in SQLITE_STATS_DDL:
+    event.listen(Todos.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in SQLITE_STATS_DROP:
+    event.listen(Todos.__table__, "before_drop", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_STATS_DDL:
+    event.listen(Todos.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in POSTGRES_STATS_DROP:
+    event.listen(Todos.__table__, "before_drop", DDL(statement).execute_if(dialect="postgresql"))
+
+
+def summarize(rows) -> dict:
+    """Fold (priority, complete, count) rows into the TodoStatsOut shape"""
+    by_priority = {}
+    for row in rows:
+        bucket = by_priority.setdefault(row.priority, {"priority": row.priority, "open": 0, "completed": 0})
+        bucket["completed" if row.complete else "open"] += row.count
+    completed = sum(bucket["completed"] for bucket in by_priority.values())
+    open_count = sum(bucket["open"] for bucket in by_priority.values())
+    return {
+        "total": open_count + completed,
+        "open": open_count,
+        "completed": completed,
+        "by_priority": [by_priority[priority] for priority in sorted(by_priority)],
+    }
+
+
+async def get_owner_stats(db, owner_id: int) -> dict:
+    rows = (await db.execute(
+        select(TodoStats.priority, TodoStats.complete, TodoStats.count)
+        .where(TodoStats.owner_id == owner_id, TodoStats.count > 0)
+    )).all()
+    return summarize(rows)
+
+
+async def get_global_stats(db) -> dict:
+    # Reads the summary table, one row per owner and bucket, never the todos table
+    rows = (await db.execute(
+        select(TodoStats.priority, TodoStats.complete, func.sum(TodoStats.count).label("count"))
+        .group_by(TodoStats.priority, TodoStats.complete)
+    )).all()
+    return summarize([row for row in rows if row.count])
+
+
+def merge_stats(summaries) -> dict:
+    """Add up summarize() results, one per shard"""
+    by_priority = {}
+    for summary in summaries:
+        for bucket in summary["by_priority"]:
+            total = by_priority.setdefault(bucket["priority"], {"priority": bucket["priority"], "open": 0, "completed": 0})
+            total["open"] += bucket["open"]
+            total["completed"] += bucket["completed"]
+    return {
+        "total": sum(summary["total"] for summary in summaries),
+        "open": sum(summary["open"] for summary in summaries),
+        "completed": sum(summary["completed"] for summary in summaries),
+        "by_priority": [by_priority[priority] for priority in sorted(by_priority)],
+    }
+
+
+def rebuild_todo_stats(connection) -> int:
+    """Recompute todo_stats from todos in the caller's transaction, returns the number of rows written"""
+    if connection.dialect.name == "postgresql":
+        # Writers wait for the rebuild instead of adjusting rows it is about to replace
+        connection.execute(text("LOCK TABLE todos IN SHARE MODE"))
+    connection.execute(delete(TodoStats))
+    priority = func.coalesce(cast(Todos.priority, Integer), 0)
+    complete = func.coalesce(Todos.complete, cast(False, Boolean))
+    result = connection.execute(
+        insert(TodoStats).from_select(
+            ["owner_id", "priority", "complete", "count"],
+            select(Todos.owner_id, priority, complete, func.count())
+            .where(Todos.owner_id.is_not(None))
+            .group_by(Todos.owner_id, priority, complete),
+        )
+    )
+    return result.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the todo_stats summary table")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    for url in get_shard_map().urls.values():
+        with engine_for(url, name="shard").begin() as connection:
+            rows = rebuild_todo_stats(connection)
+        logger.info("Rebuilt todo_stats on %s: %d rows", url, rows)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,4 @@
+import os
+
+# Settings are read at import time, give the app a signing key before it loads
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
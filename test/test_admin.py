@@ -0,0 +1,69 @@
+from fastapi import status
+from ..routers.auth import get_current_user
+from ..stats import rebuild_todo_stats
+from .utils import *
+
+override_databases()
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+def test_admin_read_all_authenticated(test_todo):
+    response = client.get("/admin/todo")
+    assert response.status_code == status.HTTP_200_OK
+    body = response.json()
+    assert [todo["title"] for todo in body["items"]] == ["Learn to code!"]
+    assert body["next_cursor"] is None
+
+
+def test_admin_read_all_paginates_across_owners(many_todos):
+    first = client.get("/admin/todo", params={"limit": 10}).json()
+    assert len(first["items"]) == 10
+    second = client.get("/admin/todo", params={"limit": 10, "cursor": first["next_cursor"]}).json()
+    assert len(second["items"]) == 5
+    assert second["next_cursor"] is None
+
+    body = client.get("/admin/todo", params={"owner_id": 2}).json()
+    assert len(body["items"]) == 3
+
+
+def test_admin_delete_todo(test_todo):
+    response = client.delete(f"/admin/todo/{test_todo.id}")
+    assert response.status_code == status.HTTP_200_OK
+    db = TestingSessionLocal()
+    assert db.query(Todos).filter(Todos.id == test_todo.id).first() is None
+
+
+def test_admin_delete_todo_not_found():
+    response = client.delete("/admin/todo/9999")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "Todo not found"}
+
+
+def test_admin_bulk_delete(many_todos):
+    db = TestingSessionLocal()
+    other_ids = [todo.id for todo in db.query(Todos).filter(Todos.owner_id == 2)]
+    results = client.post("/admin/todo/bulk/delete", json=other_ids + [99999]).json()["results"]
+    assert [item["status"] for item in results] == ["deleted"] * 3 + ["not_found"]
+    assert db.query(Todos).filter(Todos.owner_id == 2).count() == 0
+
+
+def test_admin_delete_issues_single_delete(test_todo):
+    todo_id = test_todo.id
+    with count_statements() as statements:
+        assert client.delete(f"/admin/todo/{todo_id}").status_code == status.HTTP_200_OK
+    # The DELETE plus the owner's ETag version bump
+    assert len(statements) == 2 and statements[0].startswith("DELETE FROM todos")
+
+
+def test_admin_stats(many_todos):
+    body = client.get("/admin/stats").json()
+    assert (body["total"], body["open"], body["completed"]) == (15, 11, 4)
+    body = client.get("/admin/stats", params={"owner_id": 2}).json()
+    assert body == {"total": 3, "open": 3, "completed": 0, "by_priority": [{"priority": 1, "open": 3, "completed": 0}]}
+
+
+def test_rebuild_todo_stats(many_todos):
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE todo_stats SET count = 100"))
+        rebuild_todo_stats(connection)
+    assert client.get("/admin/stats").json()["total"] == 15
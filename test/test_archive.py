@@ -0,0 +1,136 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import status
+from sqlalchemy import select, update
+from ..archive import archive_database
+from ..migrate import run_migrations
+from ..models import ArchivedTodos
+from ..routers.auth import get_current_user
+from .utils import *
+
+override_databases()
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+@asynccontextmanager
+async def open_test_db():
+    db = ThreadedSession(TestingSessionLocal())
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+@pytest.fixture
+def clean_todos():
+    yield
+    with engine.connect() as connection:
+        connection.execute(text("DELETE FROM todos;"))
+        connection.execute(text("DELETE FROM archived_todos;"))
+        connection.commit()
+
+
+def create(title, complete):
+    response = client.post("/todos", json={"title": title, "description": "d", "priority": 2, "complete": complete})
+    assert response.status_code == status.HTTP_200_OK
+
+
+def completed_at(title):
+    with engine.connect() as connection:
+        return connection.scalar(text("SELECT completed_at FROM todos WHERE title = :title"), {"title": title})
+
+
+def test_completion_time_is_kept_until_reopened(clean_todos):
+    create("t", complete=False)
+    assert completed_at("t") is None
+    todo_id = TestingSessionLocal().scalar(select(Todos.id))
+    todo = {"title": "t", "description": "d", "priority": 2, "complete": True}
+    client.put(f"/todos/{todo_id}", json=todo)
+    first = completed_at("t")
+    assert first is not None
+    client.put(f"/todos/{todo_id}", json={**todo, "priority": 3})
+    client.put("/todos/bulk", json=[{**todo, "id": todo_id}])
+    client.post("/todos/bulk/complete", json=[todo_id])
+    assert completed_at("t") == first
+    client.put(f"/todos/{todo_id}", json={**todo, "complete": False})
+    assert completed_at("t") is None
+
+
+def test_archive_moves_old_completed_todos_in_batches(clean_todos):
+    for title, complete in [("old1", True), ("old2", True), ("old3", True), ("recent", True), ("open", False)]:
+        create(title, complete)
+    long_ago = datetime.now(timezone.utc) - timedelta(days=60)
+    with engine.connect() as connection:
+        connection.execute(update(Todos).where(Todos.title.like("old%")).values(completed_at=long_ago))
+        connection.commit()
+    version = client.get("/").headers["etag"]
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=30)
+    assert asyncio.run(archive_database(open_test_db, cutoff, batch_size=2)) == 3
+    assert asyncio.run(archive_database(open_test_db, cutoff, batch_size=2)) == 0  # Nothing left, safe to rerun
+
+    db = TestingSessionLocal()
+    assert sorted(db.scalars(select(Todos.title))) == ["open", "recent"]
+    assert sorted(db.scalars(select(ArchivedTodos.title))) == ["old1", "old2", "old3"]
+    assert client.get("/").headers["etag"] != version  # Owners see the change
+
+    response = client.get("/todos/archived", params={"limit": 2})
+    assert response.status_code == status.HTTP_200_OK
+    page = response.json()
+    assert [item["title"] for item in page["items"]] == ["old1", "old2"]
+    assert page["items"][0]["complete"] is True and page["items"][0]["archived_at"]
+    rest = client.get("/todos/archived", params={"limit": 2, "cursor": page["next_cursor"]}).json()
+    assert [item["title"] for item in rest["items"]] == ["old3"] and rest["next_cursor"] is None
+
+
+def test_archived_ids_are_never_handed_out_again(clean_todos):
+    cutoff = datetime.now(timezone.utc) + timedelta(days=1)  # Everything completed counts as old
+    create("first", complete=True)
+    assert asyncio.run(archive_database(open_test_db, cutoff, batch_size=10)) == 1
+    create("second", complete=True)  # Would get the archived (highest) id back without AUTOINCREMENT
+    assert asyncio.run(archive_database(open_test_db, cutoff, batch_size=10)) == 1
+    db = TestingSessionLocal()
+    assert sorted(db.scalars(select(ArchivedTodos.title))) == ["first", "second"]
+
+
+def test_todo_ids_migration_moves_reused_archived_ids(tmp_path):
+    url = f"sqlite:///{tmp_path}/reused.db"
+    run_migrations(url, "e8c4b2a6f0d3")
+    legacy_engine = create_engine(url)
+    try:
+        with legacy_engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO todos (id, title, description, priority, complete, owner_id) VALUES (2, 'live', 'd', 3, 0, 1)"
+            ))
+            connection.execute(text(
+                "INSERT INTO archived_todos (id, title, description, priority, complete, owner_id, archived_at) "
+                "VALUES (2, 'archived', 'd', 3, 1, 1, CURRENT_TIMESTAMP)"
+            ))
+        run_migrations(url)
+        with legacy_engine.begin() as connection:
+            assert connection.execute(text("SELECT id, title FROM archived_todos")).all() == [(3, "archived")]
+            connection.execute(text("INSERT INTO todos (title, description, priority, complete, owner_id) VALUES ('new', 'd', 3, 0, 1)"))
+            assert connection.scalar(text("SELECT id FROM todos WHERE title = 'new'")) == 4
+    finally:
+        legacy_engine.dispose()
+
+
+def test_archive_migration_backfills_completion_time(tmp_path):
+    url = f"sqlite:///{tmp_path}/legacy.db"
+    run_migrations(url, "d1f5a8c3e7b9")
+    legacy_engine = create_engine(url)
+    try:
+        with legacy_engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO todos (id, title, description, priority, complete, owner_id) VALUES "
+                "(1, 'done', 'd', 3, 1, 1), (2, 'open', 'd', 3, 0, 1)"
+            ))
+        run_migrations(url)
+        with legacy_engine.connect() as connection:
+            rows = connection.execute(text("SELECT id, completed_at IS NOT NULL FROM todos ORDER BY id")).all()
+            assert rows == [(1, 1), (2, 0)]
+            assert connection.scalar(text("SELECT count(*) FROM archived_todos")) == 0
+    finally:
+        legacy_engine.dispose()
@@ -0,0 +1,98 @@
+import asyncio
+import dataclasses
+from datetime import timedelta
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from sqlalchemy import select
+from .. import hashing
+from ..config import get_settings
+from ..metrics import PASSWORD_REHASHES
+from ..models import Users
+from ..routers.auth import create_access_token, get_current_user, get_token_cache
+from .utils import *
+
+override_databases()
+
+
+def test_create_user_and_login():
+    request_data = {
+        "email": "new@example.com",
+        "username": "newuser",
+        "first_name": "New",
+        "last_name": "User",
+        "password": "testpassword",
+        "role": "user",
+        "phone_number": "1234567890",
+    }
+    response = client.post("/auth/", json=request_data)
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = client.post("/auth/token", data={"username": "newuser", "password": "testpassword"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["token_type"] == "bearer"
+
+    response = client.post("/auth/token", data={"username": "newuser", "password": "wrong"})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    db = TestingSessionLocal()
+    db.query(Users).delete()
+    db.commit()
+
+
+def test_get_current_user_caches_verified_token():
+    token_cache = get_token_cache()
+    token_cache.clear()
+    token = create_access_token("jdtest", 1, "admin", timedelta(minutes=20)).decode()
+    hits = token_cache.hits
+
+    user = asyncio.run(get_current_user(token))
+    assert user == {"username": "jdtest", "id": 1, "role": "admin"}
+    assert len(token_cache) == 1
+
+    assert asyncio.run(get_current_user(token)) == user
+    assert token_cache.hits == hits + 1
+
+
+def test_get_current_user_rejects_expired_token():
+    token = create_access_token("jdtest", 1, "admin", timedelta(minutes=-1)).decode()
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(get_current_user(token))
+    assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_login_rehashes_outdated_password_in_background(monkeypatch):
+    settings = dataclasses.replace(get_settings(), bcrypt_rounds=5)
+    monkeypatch.setattr(hashing, "get_settings", lambda: settings)
+    hashing.get_crypt_context.cache_clear()
+    rehashes = PASSWORD_REHASHES.value("updated")
+    try:
+        old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("testpassword")
+        db = TestingSessionLocal()
+        db.add(Users(email="old@example.com", username="olduser", first_name="Old", last_name="Hash",
+                     hashed_password=old_hash, is_active=True, role="user", phone_number="1234567890"))
+        db.commit()
+
+        response = client.post("/auth/token", data={"username": "olduser", "password": "testpassword"})
+        assert response.status_code == status.HTTP_200_OK
+        new_hash = TestingSessionLocal().scalar(select(Users.hashed_password).where(Users.username == "olduser"))
+        assert new_hash.startswith("$2b$05$")
+        assert PASSWORD_REHASHES.value("updated") == rehashes + 1
+
+        # Current cost: nothing to redo
+        client.post("/auth/token", data={"username": "olduser", "password": "testpassword"})
+        assert PASSWORD_REHASHES.value("updated") == rehashes + 1
+        assert hashing.hash_cost_report([old_hash, new_hash, new_hash, "plaintext"]) == {
+            "target": {"scheme": "bcrypt", "rounds": 5},
+            "total": 4,
+            "needs_update": 2,
+            "costs": [
+                {"scheme": "bcrypt", "rounds": 4, "count": 1, "needs_update": True},
+                {"scheme": "bcrypt", "rounds": 5, "count": 2, "needs_update": False},
+                {"scheme": "unknown", "rounds": None, "count": 1, "needs_update": True},
+            ],
+        }
+    finally:
+        hashing.get_crypt_context.cache_clear()
+        db = TestingSessionLocal()
+        db.query(Users).delete()
+        db.commit()
@@ -0,0 +1,23 @@
+import asyncio
+from ..benchmarks.run import SCENARIOS, compare, run_benchmark
+
+
+def test_benchmark_suite_covers_every_route_without_errors():
+    # Tiny run; bcrypt-heavy endpoints are skipped to keep the test fast
+    slow = {"POST /auth/", "POST /auth/token", "PUT /user/password"}
+    only = [scenario.name for scenario in SCENARIOS if scenario.name not in slow]
+    document = asyncio.run(run_benchmark(users=2, todos_per_user=10, requests=6, concurrency=3, only=only))
+
+    assert set(document["endpoints"]) == set(only)
+    for name, stats in document["endpoints"].items():
+        assert stats["errors"] == 0, name
+        assert stats["requests"] == 6
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+
+
+def test_compare_flags_regressions():
+    baseline = {"endpoints": {"GET /": {"p95_ms": 10.0, "throughput_rps": 100.0, "errors": 0}}}
+    same = {"endpoints": {"GET /": {"p95_ms": 11.0, "throughput_rps": 95.0, "errors": 0}}}
+    slower = {"endpoints": {"GET /": {"p95_ms": 15.0, "throughput_rps": 60.0, "errors": 1}}}
+    assert compare(baseline, same, max_regression=0.2) == []
+    assert len(compare(baseline, slower, max_regression=0.2)) == 3
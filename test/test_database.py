@@ -0,0 +1,158 @@
+import asyncio
+import dataclasses
+import time
+import pytest
+from fastapi import status
+from alembic import command
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, MetaData, String, Table, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from .. import database, shards
+from ..config import get_settings
+from ..database import current_user_id, dispose_engines, get_recent_writers, to_async_url
+from ..migrate import alembic_config, run_migrations
+from ..shards import get_shard_map
+from ..routers.auth import get_current_user
+from .utils import *
+
+
+def test_to_async_url():
+    assert to_async_url("sqlite:///./todosapp.db") == "sqlite+aiosqlite:///./todosapp.db"
+    assert to_async_url("postgresql://postgres:pw@localhost/todos") == "postgresql+asyncpg://postgres:pw@localhost/todos"
+    with pytest.raises(ValueError):
+        to_async_url("mysql://root@localhost/todos")
+
+
+def test_migrations_build_the_model_schema(tmp_path):
+    url = f"sqlite:///{tmp_path}/migrated.db"
+    run_migrations(url)
+    migrated_engine = create_engine(url)
+    try:
+        tables = set(inspect(migrated_engine).get_table_names()) - {"alembic_version"}
+        assert {name for name in tables if not name.startswith("todos_fts")} == set(Base.metadata.tables)
+        assert "todos_fts" in tables
+        assert {column["name"] for column in inspect(migrated_engine).get_columns("users")} == set(Users.__table__.columns.keys())
+    finally:
+        migrated_engine.dispose()
+
+
+def test_auto_created_database_upgrades_from_the_baseline(tmp_path):
+    # The schema older versions created with create_all() at import (models at 1080109feab3)
+    baseline = MetaData()
+    Table("users", baseline, Column("id", Integer, primary_key=True, index=True), Column("email", String, unique=True),
+          Column("username", String, unique=True), Column("first_name", String), Column("last_name", String),
+          Column("hashed_password", String), Column("is_active", Boolean), Column("role", String),
+          Column("phone_number", String))
+    Table("todos", baseline, Column("id", Integer, primary_key=True, index=True), Column("title", String),
+          Column("description", String), Column("priority", String), Column("complete", Boolean),
+          Column("owner_id", Integer, ForeignKey("users.id")))
+    url = f"sqlite:///{tmp_path}/auto_created.db"
+    legacy_engine = create_engine(url)
+    try:
+        baseline.create_all(legacy_engine)
+        with legacy_engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO todos (id, title, description, priority, complete, owner_id) VALUES (1, 'buy milk', 'd', '2', 0, 1)"
+            ))
+        command.stamp(alembic_config(url), "1080109feab3")  # What the README says to run
+        run_migrations(url)
+        tables = set(inspect(legacy_engine).get_table_names()) - {"alembic_version"}
+        assert {name for name in tables if not name.startswith("todos_fts")} == set(Base.metadata.tables)
+        with legacy_engine.connect() as connection:
+            assert connection.scalar(text("SELECT rowid FROM todos_fts WHERE todos_fts MATCH 'milk'")) == 1
+            assert connection.execute(text("SELECT owner_id, priority, complete, count FROM todo_stats")).all() == [(1, 2, 0, 1)]
+    finally:
+        legacy_engine.dispose()
+
+
+def test_priority_migration_converts_existing_rows(tmp_path):
+    url = f"sqlite:///{tmp_path}/legacy.db"
+    run_migrations(url, "b4d2e7f1c5a3")  # priority still a string column
+    legacy_engine = create_engine(url)
+    try:
+        with legacy_engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO todos (id, title, description, priority, complete, owner_id) VALUES "
+                "(1, 'buy milk', 'd', '3', 0, 1), (2, :long_title, 'd', '9', 1, 1)"
+            ), {"long_title": "x" * 250})
+        run_migrations(url)
+        with legacy_engine.connect() as connection:
+            rows = connection.execute(text("SELECT id, priority, typeof(priority), length(title) FROM todos ORDER BY id")).all()
+            assert rows == [(1, 3, "integer", 8), (2, 3, "integer", 200)]  # Out of range: the middle priority
+            # Triggers dropped with the rebuilt table are back
+            assert connection.scalar(text("SELECT rowid FROM todos_fts WHERE todos_fts MATCH 'milk'")) == 1
+            connection.execute(text("UPDATE todos SET priority = 5 WHERE id = 1"))
+            stats = connection.execute(text("SELECT priority, complete, count FROM todo_stats WHERE count > 0 ORDER BY priority"))
+            assert stats.all() == [(3, 1, 1), (5, 0, 1)]
+            with pytest.raises(IntegrityError):
+                connection.execute(text("UPDATE todos SET priority = 6 WHERE id = 1"))
+            with pytest.raises(IntegrityError):
+                connection.execute(text("UPDATE todos SET priority = NULL WHERE id = 1"))
+    finally:
+        legacy_engine.dispose()
+
+
+def test_routers_on_async_session(tmp_path):
+    pytest.importorskip("aiosqlite")
+    async_engine = create_async_engine(to_async_url(f"sqlite:///{tmp_path}/async.db"))
+    AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def create_schema():
+        async with async_engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+    asyncio.run(create_schema())
+
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
+    override_databases(override_get_async_db)
+    app.dependency_overrides[get_current_user] = override_get_current_user
+    try:
+        payload = {"title": "Async todo", "description": "Via AsyncSession", "priority": 2, "complete": False}
+        assert client.post("/todos", json=payload).status_code == status.HTTP_200_OK
+        items = client.get("/").json()["items"]
+        assert [todo["title"] for todo in items] == ["Async todo"]
+        assert client.delete(f"/todos/{items[0]['id']}").status_code == status.HTTP_200_OK
+        assert client.get("/").json()["items"] == []
+    finally:
+        override_databases()
+        asyncio.run(async_engine.dispose())
+
+
+def test_reads_go_to_replicas_until_the_user_writes(tmp_path, monkeypatch):
+    primary, replica = f"sqlite:///{tmp_path}/primary.db", f"sqlite:///{tmp_path}/replica.db"
+    for url, title in ((primary, "on primary"), (replica, "on replica")):
+        file_engine = create_engine(url)
+        Base.metadata.create_all(bind=file_engine)
+        with file_engine.begin() as connection:
+            connection.execute(Todos.__table__.insert().values(title=title, description="d", priority="1", complete=False, owner_id=1))
+        file_engine.dispose()
+    settings = dataclasses.replace(
+        get_settings(), database_url=primary, database_replica_urls=(replica,), read_your_writes_seconds=0.2
+    )
+    monkeypatch.setattr(database, "get_settings", lambda: settings)
+    monkeypatch.setattr(shards, "get_settings", lambda: settings)
+    get_recent_writers.cache_clear()
+    get_shard_map.cache_clear()
+
+    async def user_dependency():
+        current_user_id.set(1)  # What get_current_user does for a real token
+        return {"username": "jdtest", "id": 1, "role": "admin"}
+
+    clear_database_overrides()
+    app.dependency_overrides[get_current_user] = user_dependency
+    try:
+        titles = lambda: [todo["title"] for todo in client.get("/").json()["items"]]
+        assert titles() == ["on replica"]
+        payload = {"title": "new", "description": "d", "priority": 2, "complete": False}
+        assert client.post("/todos", json=payload).status_code == status.HTTP_200_OK
+        assert titles() == ["on primary", "new"]  # Reads its own write
+        time.sleep(0.25)
+        assert titles() == ["on replica"]  # Window over, back to the (lagging) replica
+    finally:
+        override_databases()
+        app.dependency_overrides[get_current_user] = override_get_current_user
+        asyncio.run(dispose_engines())
+        get_recent_writers.cache_clear()
+        get_shard_map.cache_clear()
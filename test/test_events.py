@@ -0,0 +1,102 @@
+import asyncio
+from ..etags import get_todo_version
+from ..events import EventBroker, LocalBackend, TodoEvent, event_stream, get_event_broker
+from ..routers.auth import get_current_user
+from .utils import *
+
+override_databases()
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+def drain(subscription):
+    async def collect():
+        events = []
+        while (event := await subscription.next_event(timeout=0)) is not None:
+            events.append((event.id, event.type))
+        return events
+    return asyncio.run(collect())
+
+
+def publish(broker, *events):
+    async def run():
+        for event in events:
+            await broker.publish(event)
+    asyncio.run(run())
+
+
+def current_version():
+    async def read():
+        db = ThreadedSession(TestingSessionLocal())
+        try:
+            return await get_todo_version(db, 1)
+        finally:
+            await db.close()
+    return asyncio.run(read())
+
+
+def test_resume_replays_missed_events():
+    broker = EventBroker(LocalBackend(), queue_size=10, replay_size=10)
+    publish(broker, *(TodoEvent(1, version, "updated", [7]) for version in range(1, 5)))
+    subscription = broker.subscribe(1, last_event_id=2, current_version=4)
+    assert drain(subscription) == [(3, "updated"), (4, "updated")]
+
+    publish(broker, TodoEvent(1, 5, "deleted", [7]), TodoEvent(2, 1, "created", [8]))
+    assert drain(subscription) == [(5, "deleted")]  # Other owners' events never show up
+
+
+def test_reset_when_resume_point_is_gone():
+    broker = EventBroker(LocalBackend(), queue_size=10, replay_size=2)
+    publish(broker, *(TodoEvent(1, version, "updated") for version in range(1, 6)))
+    assert drain(broker.subscribe(1, last_event_id=1, current_version=5)) == [(5, "reset")]
+    # Written by another worker, never seen here
+    assert drain(broker.subscribe(1, last_event_id=5, current_version=8)) == [(8, "reset")]
+
+
+def test_gap_and_slow_consumer_become_reset():
+    broker = EventBroker(LocalBackend(), queue_size=3, replay_size=10)
+    subscription = broker.subscribe(1, last_event_id=None, current_version=0)
+    publish(broker, TodoEvent(1, 1, "created"), TodoEvent(1, 3, "created"))
+    assert drain(subscription) == [(1, "created"), (3, "reset")]
+
+    publish(broker, *(TodoEvent(1, version, "updated") for version in range(4, 10)))
+    assert drain(subscription) == [(7, "reset"), (8, "updated"), (9, "updated")]
+    assert broker.stats()["overflows"] == 1
+
+
+def test_write_endpoints_publish_events(test_todo):
+    todo_id = test_todo.id
+    get_event_broker.cache_clear()  # Drop events other test modules published for owner 1
+    broker = get_event_broker()
+    subscription = broker.subscribe(1, last_event_id=None, current_version=current_version())
+    try:
+        client.put(f"/todos/{todo_id}", json={"title": "t", "description": "d", "priority": 1, "complete": True})
+        client.post("/todos/bulk", json=[{"title": "t", "description": "d", "priority": 1, "complete": False}])
+        client.delete(f"/todos/{todo_id}")
+        client.delete("/todos/999")  # 404, nothing published
+        events = drain(subscription)
+        assert [event_type for _, event_type in events] == ["updated", "created", "deleted"]
+        assert [event_id for event_id, _ in events] == list(range(events[0][0], events[0][0] + 3))
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def test_event_stream_format():
+    class Request:
+        checks = 0
+
+        async def is_disconnected(self):
+            self.checks += 1
+            return self.checks > 2
+
+    broker = EventBroker(LocalBackend(), queue_size=10, replay_size=10)
+    subscription = broker.subscribe(1, last_event_id=None, current_version=4)
+    publish(broker, TodoEvent(1, 5, "created", [3]))
+
+    async def collect():
+        return [chunk async for chunk in event_stream(Request(), broker, subscription, heartbeat=0.01)]
+
+    chunks = asyncio.run(collect())
+    assert chunks[0] == "retry: 3000\nid: 4\nevent: ready\ndata: {}\n\n"
+    assert chunks[1] == 'id: 5\nevent: created\ndata: {"type":"created","todo_ids":[3]}\n\n'
+    assert chunks[2] == ": ping\n\n"
+    assert broker.stats()["subscribers"] == 0
@@ -0,0 +1,69 @@
+import asyncio
+import csv
+import io
+import json
+import pytest
+from fastapi import status
+from sqlalchemy import insert, select
+from ..export import stream_rows
+from ..routers.auth import get_current_user
+from .utils import *
+
+override_databases()
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+@pytest.fixture
+def many_todos():
+    rows = [
+        {"title": f"todo {i}", "description": "d", "priority": i % 5 + 1, "complete": i % 2 == 0, "owner_id": 1}
+        for i in range(2500)
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(Todos), rows)
+        connection.execute(insert(Todos), [{"title": "theirs", "description": "d", "priority": 1, "complete": False, "owner_id": 2}])
+    yield
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM todos;"))
+
+
+def test_rows_are_fetched_one_batch_at_a_time(many_todos):
+    async def batch_sizes():
+        db = ThreadedSession(TestingSessionLocal())
+        try:
+            return [len(batch) async for batch in stream_rows(db, select(Todos.id).order_by(Todos.id), batch_size=1000)]
+        finally:
+            await db.close()
+
+    assert asyncio.run(batch_sizes()) == [1000, 1000, 501]
+
+
+def test_export_streams_ndjson_gzipped(many_todos):
+    with client.stream("GET", "/todos/export") as response:
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert response.headers["content-encoding"] == "gzip"  # The test client asks for it and decodes it
+        assert 'filename="todos.ndjson"' in response.headers["content-disposition"]
+        todos = [json.loads(line) for line in response.iter_lines() if line]
+    assert len(todos) == 2500
+    assert {todo["owner_id"] for todo in todos} == {1}
+    assert [todo["id"] for todo in todos] == sorted(todo["id"] for todo in todos)
+    assert set(todos[0]) == {"id", "title", "description", "priority", "complete", "owner_id"}
+
+
+def test_export_csv_with_filters_and_no_gzip(many_todos):
+    response = client.get("/todos/export", params={"format": "csv", "complete": True, "priority": 1},
+                          headers={"Accept-Encoding": "gzip;q=0, identity"})
+    assert response.status_code == status.HTTP_200_OK
+    assert "content-encoding" not in response.headers
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 250
+    assert all(row["complete"] == "True" and row["priority"] == "1" for row in rows)
+
+
+def test_admin_export_covers_every_owner(many_todos):
+    response = client.get("/admin/todo/export", params={"format": "csv"})
+    assert response.status_code == status.HTTP_200_OK
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 2501
+    assert client.get("/admin/todo/export", params={"owner_id": 2}).text.count("\n") == 1
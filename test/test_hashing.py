@@ -0,0 +1,42 @@
+import asyncio
+import threading
+import pytest
+from ..hashing import HashPoolBusy, PasswordHasher
+
+
+def test_hash_and_verify_on_pool():
+    hasher = PasswordHasher(workers=2, max_queue=2)
+
+    async def roundtrip():
+        hashed = await hasher.hash("secret123")
+        return await hasher.verify("secret123", hashed), await hasher.verify("wrong", hashed)
+
+    assert asyncio.run(roundtrip()) == (True, False)
+    stats = hasher.stats()
+    assert stats["completed"] == 3
+    assert stats["in_flight"] == 0
+    hasher.shutdown()
+
+
+def test_saturated_pool_sheds_load():
+    hasher = PasswordHasher(workers=1, max_queue=1, retry_after=7)
+    release = threading.Event()
+
+    async def burst():
+        # Two blocked jobs fill the worker and the single queue slot
+        pending = [asyncio.ensure_future(hasher._submit(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert hasher.stats()["queued"] == 1
+        with pytest.raises(HashPoolBusy) as exc_info:
+            await hasher._submit(release.wait)
+        release.set()
+        await asyncio.gather(*pending)
+        return exc_info.value
+
+    error = asyncio.run(burst())
+    assert error.status_code == 503
+    assert error.headers == {"Retry-After": "7"}
+    stats = hasher.stats()
+    assert stats["rejected"] == 1
+    assert stats["peak_in_flight"] == 2
+    hasher.shutdown()
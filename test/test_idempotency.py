@@ -0,0 +1,124 @@
+import asyncio
+import pytest
+from fastapi import HTTPException, Response, status
+from ..idempotency import IdempotencyStore, LocalIdempotencyBackend, get_idempotency_store
+from ..routers.auth import get_current_user
+from .utils import *
+
+override_databases()
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+TODO = {"title": "Buy milk", "description": "Two litres", "priority": 2, "complete": False}
+
+
+@pytest.fixture
+def clean_todos():
+    get_idempotency_store.cache_clear()
+    yield
+    with engine.connect() as connection:
+        connection.execute(text("DELETE FROM todos;"))
+        connection.commit()
+
+
+def test_retried_create_todo_is_created_once(clean_todos):
+    headers = {"Idempotency-Key": "retry-1"}
+    first = client.post("/todos", json=TODO, headers=headers)
+    second = client.post("/todos", json=TODO, headers=headers)
+    assert first.status_code == second.status_code == status.HTTP_200_OK
+    assert "idempotency-replayed" not in first.headers
+    assert second.headers["idempotency-replayed"] == "true"
+    assert TestingSessionLocal().query(Todos).count() == 1
+
+    # A new key (or none at all) is a new todo
+    client.post("/todos", json=TODO, headers={"Idempotency-Key": "retry-2"})
+    client.post("/todos", json=TODO)
+    assert TestingSessionLocal().query(Todos).count() == 3
+
+
+def test_key_reused_with_another_body_is_rejected(clean_todos):
+    headers = {"Idempotency-Key": "retry-1"}
+    client.post("/todos", json=TODO, headers=headers)
+    response = client.post("/todos", json={**TODO, "title": "Buy bread"}, headers=headers)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+    assert TestingSessionLocal().query(Todos).count() == 1
+
+
+def test_signup_keys_are_scoped_by_username():
+    get_idempotency_store.cache_clear()
+    user = {
+        "email": "first@example.com", "username": "first", "first_name": "Fi", "last_name": "Rst",
+        "password": "testpassword", "role": "user", "phone_number": "1234567890",
+    }
+    other = {**user, "email": "second@example.com", "username": "second"}
+    headers = {"Idempotency-Key": "1"}
+    try:
+        # Two clients that happen to pick the same key both sign up
+        assert client.post("/auth/", json=user, headers=headers).status_code == status.HTTP_201_CREATED
+        response = client.post("/auth/", json=other, headers=headers)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert "idempotency-replayed" not in response.headers
+        # The same signup retried with another body is still a client bug
+        response = client.post("/auth/", json={**user, "first_name": "Changed"}, headers=headers)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+        assert TestingSessionLocal().query(Users).count() == 2
+    finally:
+        with engine.connect() as connection:
+            connection.execute(text("DELETE FROM users;"))
+            connection.commit()
+
+
+def test_retried_signup_hashes_once():
+    get_idempotency_store.cache_clear()
+    user = {
+        "email": "retry@example.com", "username": "retry", "first_name": "Re", "last_name": "Try",
+        "password": "testpassword", "role": "user", "phone_number": "1234567890",
+    }
+    try:
+        for _ in range(2):
+            response = client.post("/auth/", json=user, headers={"Idempotency-Key": "signup-1"})
+            assert response.status_code == status.HTTP_201_CREATED
+        assert TestingSessionLocal().query(Users).count() == 1
+        assert get_idempotency_store().stats()["executed"] == 1
+    finally:
+        with engine.connect() as connection:
+            connection.execute(text("DELETE FROM users;"))
+            connection.commit()
+
+
+def test_concurrent_repeats_share_one_execution():
+    store = IdempotencyStore(LocalIdempotencyBackend(maxsize=10, ttl=60), wait_timeout=1)
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"id": len(calls)}
+
+    async def run_all():
+        responses = [Response() for _ in range(5)]
+        results = await asyncio.gather(*(store.run("scope", "key", {"a": 1}, response, operation) for response in responses))
+        return results, responses
+
+    results, responses = asyncio.run(run_all())
+    assert calls == [1]
+    assert results == [{"id": 1}] * 5
+    assert sum("idempotency-replayed" in response.headers for response in responses) == 4
+
+
+def test_failed_request_is_not_stored():
+    store = IdempotencyStore(LocalIdempotencyBackend(maxsize=10, ttl=60), wait_timeout=1)
+    attempts = []
+
+    async def operation():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise HTTPException(status_code=503)
+        return "created"
+
+    async def run():
+        with pytest.raises(HTTPException):
+            await store.run("scope", "key", {}, Response(), operation)
+        return await store.run("scope", "key", {}, Response(), operation)
+
+    assert asyncio.run(run()) == "created"
+    assert len(attempts) == 2
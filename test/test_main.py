@@ -1,5 +1,10 @@
+import dataclasses
+import pytest
 from fastapi.testclient import TestClient
+from .. import main
+from ..config import get_settings
 from ..main import app
+from ..metrics import APP_COLD_START, APP_IMPORT_TIME
 from fastapi import status
 
 client = TestClient(app)
@@ -7,4 +12,25 @@ client = TestClient(app)
 def test_health_check():
     response = client.get("/healthy")
     assert response.status_code == status.HTTP_200_OK
-    assert response.json() == {"status": "Healthy"}
\ No newline at end of file
+    assert response.json() == {"status": "Healthy"}
+
+def test_lifespan_records_cold_start():
+    with TestClient(app) as started_client:
+        assert started_client.get("/healthy").status_code == status.HTTP_200_OK
+    assert APP_COLD_START.value() > 0
+    assert APP_IMPORT_TIME.value() > 0
+
+
+@pytest.mark.parametrize("archive_worker", [False, True])
+def test_only_the_archive_worker_runs_the_archiver(monkeypatch, archive_worker):
+    settings = dataclasses.replace(get_settings(), archive_interval_seconds=60, archive_worker=archive_worker)
+    monkeypatch.setattr(main, "get_settings", lambda: settings)
+    started = []
+
+    async def run_archiver(interval):
+        started.append(interval)
+
+    monkeypatch.setattr(main, "run_archiver", run_archiver)
+    with TestClient(app) as started_client:
+        assert started_client.get("/healthy").status_code == status.HTTP_200_OK
+    assert started == ([60] if archive_worker else [])
@@ -0,0 +1,43 @@
+from fastapi import status
+from ..database import instrument_engine
+from ..metrics import Histogram, Registry
+from ..routers.auth import get_current_user
+from .utils import *
+
+override_databases()
+app.dependency_overrides[get_current_user] = override_get_current_user
+instrument_engine(engine)
+
+
+def test_server_timing_header(test_todo):
+    response = client.get(f"/todos/{test_todo.id}")
+    assert response.status_code == status.HTTP_200_OK
+    timing = response.headers["Server-Timing"]
+    assert 'db;dur=' in timing and '2 queries' in timing  # ETag version lookup + the todo
+    assert "serialize;dur=" in timing
+    assert "total;dur=" in timing
+
+
+def test_metrics_endpoint(test_todo):
+    client.get("/")
+    client.get(f"/todos/{test_todo.id}")
+    response = client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/todos/{todo_id}",status="200"}' in body
+    assert 'http_request_duration_seconds_count{method="GET",route="/"}' in body
+    assert 'http_requests_in_flight{method="GET",route="/metrics"} 1' in body
+    assert "db_queries_total" in body
+    assert "hash_pool_workers" in body and "token_cache_hits_total" in body
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.register(Histogram("latency_seconds", "test", ("route",), buckets=(0.1, 1)))
+    for value in (0.05, 0.5, 5):
+        histogram.observe("/", value=value)
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{route="/",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{route="/"} 3' in lines
@@ -0,0 +1,82 @@
+import marshal
+from datetime import timedelta
+import pytest
+from fastapi import status
+from ..metrics import PROFILED_REQUESTS
+from ..profiling import ProfilingMiddleware, get_hot_stacks, get_profile_store
+from ..routers.auth import create_access_token, get_current_user
+from .utils import *
+
+override_databases()
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+# PROFILING_ENABLED is off by default, so the app itself has no profiling middleware
+profiling_client = TestClient(ProfilingMiddleware(app, header_enabled=True))
+
+
+def bearer(role):
+    return {"Authorization": f"Bearer {create_access_token('jdtest', 1, role, timedelta(minutes=5)).decode()}"}
+
+
+@pytest.fixture
+def clean_profiles():
+    yield
+    get_profile_store()._profiles.clear()
+    get_hot_stacks().clear()
+
+
+def test_admin_request_is_profiled_with_samples(clean_profiles):
+    response = profiling_client.get("/", headers={**bearer("admin"), "X-Profile": "sample"})
+    assert response.status_code == status.HTTP_200_OK
+    profile_id = response.headers["x-profile-id"]
+
+    profiles = client.get("/admin/profiles").json()
+    assert [profile["id"] for profile in profiles] == [profile_id]
+    assert profiles[0]["mode"] == "sample" and profiles[0]["route"] == "/" and profiles[0]["status"] == 200
+
+    download = client.get(f"/admin/profiles/{profile_id}")
+    assert download.status_code == status.HTTP_200_OK
+    assert f'filename="profile-{profile_id}.folded"' in download.headers["content-disposition"]
+    for line in download.text.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0 and stack
+    assert client.get(f"/admin/profiles/{profile_id}", params={"format": "pstats"}).status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_cprofile_download_formats(clean_profiles):
+    response = profiling_client.get("/", headers={**bearer("admin"), "X-Profile": "cprofile"})
+    profile_id = response.headers["x-profile-id"]
+    text = client.get(f"/admin/profiles/{profile_id}")
+    assert "cumulative" in text.text and "function calls" in text.text
+    stats = marshal.loads(client.get(f"/admin/profiles/{profile_id}", params={"format": "pstats"}).content)
+    assert any(function == "read_todo" for _, _, function in stats)
+    assert client.get("/admin/profiles/0-0").status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_header_is_ignored_for_non_admins(clean_profiles):
+    profiled = PROFILED_REQUESTS.value("sample")
+    for headers in ({**bearer("user"), "X-Profile": "sample"}, {"X-Profile": "sample"}, {**bearer("admin"), "X-Profile": "flame"}):
+        response = profiling_client.get("/", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert "x-profile-id" not in response.headers
+    assert PROFILED_REQUESTS.value("sample") == profiled
+    assert get_profile_store().list() == []
+
+
+def test_sampled_requests_feed_hot_stacks_per_route(clean_profiles):
+    sampling_client = TestClient(ProfilingMiddleware(app, header_enabled=False, sample_rate=1.0))
+    for _ in range(3):
+        assert sampling_client.get("/").status_code == status.HTTP_200_OK
+    report = client.get("/admin/profiles/hot", params={"route": "/"}).json()
+    assert [entry["route"] for entry in report] == ["/"]
+    assert report[0]["requests"] == 3
+    assert sum(stack["samples"] for stack in report[0]["stacks"]) <= report[0]["samples"]
+    assert client.delete("/admin/profiles/hot").status_code == status.HTTP_204_NO_CONTENT
+    assert client.get("/admin/profiles/hot").json() == []
+
+
+def test_header_profiling_is_off_by_default(clean_profiles):
+    response = client.get("/", headers={**bearer("admin"), "X-Profile": "sample"})
+    assert response.status_code == status.HTTP_200_OK
+    assert "x-profile-id" not in response.headers
+    assert get_profile_store().list() == []
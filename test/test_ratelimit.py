@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+from fastapi import status
+from .. import ratelimit
+from ..database import get_db
+from ..metrics import LOGIN_ATTEMPTS
+from ..ratelimit import BucketLimit, LocalRateLimitBackend, LoginRateLimiter, RateLimited
+from ..routers import auth
+from .utils import *
+
+override_databases()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+def test_bucket_allows_burst_then_refills(clock):
+    backend = LocalRateLimitBackend(maxsize=10)
+    limit = BucketLimit(burst=3, rate=0.5)
+
+    async def attempts(count):
+        return [await backend.acquire("ip:1.2.3.4", limit) for _ in range(count)]
+
+    assert asyncio.run(attempts(3)) == [0, 0, 0]
+    assert asyncio.run(attempts(1)) == [2.0]  # One token comes back every 2 seconds
+    clock.now += 2
+    assert asyncio.run(attempts(2)) == [0, 2.0]
+
+
+def test_table_is_bounded_and_evicts_least_recently_used(clock):
+    backend = LocalRateLimitBackend(maxsize=2)
+    limit = BucketLimit(burst=1, rate=0.01)
+
+    async def run():
+        await backend.acquire("a", limit)
+        await backend.acquire("b", limit)
+        await backend.acquire("a", limit)  # a is now the most recently used
+        await backend.acquire("c", limit)  # evicts b
+        return await backend.acquire("a", limit), await backend.acquire("b", limit)
+
+    assert asyncio.run(run()) == (pytest.approx(100), 0)
+    assert backend.stats() == {"size": 2, "maxsize": 2, "evictions": 2}
+
+
+def test_rejected_login_never_touches_the_database(clock, monkeypatch):
+    limiter = LoginRateLimiter(LocalRateLimitBackend(maxsize=10), {
+        "ip": BucketLimit(burst=10, rate=1), "username": BucketLimit(burst=2, rate=1 / 60),
+    })
+    monkeypatch.setattr(auth, "get_login_rate_limiter", lambda: limiter)
+    sessions = []
+
+    async def counting_get_db():
+        sessions.append(1)
+        async for db in override_get_db():
+            yield db
+
+    app.dependency_overrides[get_db] = counting_get_db
+    try:
+        for _ in range(2):
+            response = client.post("/auth/token", data={"username": "nobody", "password": "guess"})
+            assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        rejected = LOGIN_ATTEMPTS.value("username", "rejected")
+        response = client.post("/auth/token", data={"username": "nobody", "password": "guess"})
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert response.headers["retry-after"] == "60"
+        assert len(sessions) == 2
+        assert LOGIN_ATTEMPTS.value("username", "rejected") == rejected + 1
+
+        # Another username from the same client still gets through
+        response = client.post("/auth/token", data={"username": "somebody", "password": "guess"})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    finally:
+        override_databases()
+
+
+def test_ip_bucket_is_checked_first(clock):
+    limiter = LoginRateLimiter(LocalRateLimitBackend(maxsize=10), {
+        "ip": BucketLimit(burst=1, rate=1), "username": BucketLimit(burst=5, rate=1), "unused": None,
+    })
+
+    async def run():
+        await limiter.check(ip="1.2.3.4", username="alice")
+        with pytest.raises(RateLimited):
+            await limiter.check(ip="1.2.3.4", username="alice")
+        # The rejected attempt didn't spend one of alice's tokens
+        return limiter.backend._buckets["username:alice"][0]
+
+    assert asyncio.run(run()) == 4
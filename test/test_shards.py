@@ -0,0 +1,145 @@
+import asyncio
+import dataclasses
+import pytest
+from fastapi import Request, status
+from sqlalchemy import func, select
+from .. import database, shards
+from ..config import get_settings
+from ..database import current_user_id, dispose_engines, get_recent_writers
+from ..models import TodoStats, TodoVersions
+from ..routers.auth import get_current_user
+from ..shards import HashRing, build_shard_map, get_shard_map, get_todo_id_allocator, parse_shard_urls, rebalance
+from .utils import *
+
+
+def test_parse_shard_urls():
+    assert parse_shard_urls(["a=sqlite:///a.db", "postgresql://u:p@host/todos"]) == {
+        "a": "sqlite:///a.db",
+        "shard1": "postgresql://u:p@host/todos",
+    }
+    assert not build_shard_map((), "sqlite:///primary.db").sharded
+
+
+def test_hash_ring_spreads_owners_and_moves_few_when_growing():
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b", "c", "d"])
+    owners = range(1, 10001)
+    counts = {name: sum(1 for owner in owners if before.node_for(owner) == name) for name in "abc"}
+    assert all(2500 < count < 4200 for count in counts.values())
+    moved = [owner for owner in owners if before.node_for(owner) != after.node_for(owner)]
+    assert all(after.node_for(owner) == "d" for owner in moved)  # Only onto the new shard
+    assert 1500 < len(moved) < 3500  # About a quarter
+
+
+@pytest.fixture
+def sharded(tmp_path, monkeypatch):
+    """DATABASE_URL plus two shards, each its own SQLite file; yields a function to switch the shard list"""
+    primary = f"sqlite:///{tmp_path}/primary.db"
+    urls = {name: f"sqlite:///{tmp_path}/{name}.db" for name in ("a", "b", "c")}
+    for url in [primary, *urls.values()]:
+        file_engine = create_engine(url)
+        Base.metadata.create_all(bind=file_engine)
+        file_engine.dispose()
+
+    def use_shards(*names):
+        settings = dataclasses.replace(
+            get_settings(), database_url=primary, database_shard_urls=tuple(f"{name}={urls[name]}" for name in names)
+        )
+        monkeypatch.setattr(database, "get_settings", lambda: settings)
+        monkeypatch.setattr(shards, "get_settings", lambda: settings)
+        get_shard_map.cache_clear()
+        return urls
+
+    async def user_dependency(request: Request):
+        user_id = int(request.headers.get("x-user", 1))
+        current_user_id.set(user_id)  # What get_current_user does for a real token
+        return {"username": f"user{user_id}", "id": user_id, "role": "admin"}
+
+    use_shards("a", "b")
+    get_todo_id_allocator.cache_clear()
+    clear_database_overrides()
+    app.dependency_overrides[get_current_user] = user_dependency
+    try:
+        yield use_shards
+    finally:
+        override_databases()
+        app.dependency_overrides[get_current_user] = override_get_current_user
+        asyncio.run(dispose_engines())
+        get_shard_map.cache_clear()
+        get_todo_id_allocator.cache_clear()
+        get_recent_writers.cache_clear()
+
+
+def owners_on(url):
+    with database.engine_for(url).connect() as connection:
+        return dict(connection.execute(select(Todos.owner_id, func.count()).group_by(Todos.owner_id)).all())
+
+
+def create_todos(owners, per_owner):
+    for owner_id in owners:
+        payload = [{"title": f"owner {owner_id}", "description": "d", "priority": 2, "complete": False}] * per_owner
+        response = client.post("/todos/bulk", json=payload, headers={"x-user": str(owner_id)})
+        assert response.status_code == status.HTTP_200_OK
+
+
+def test_todos_live_on_their_owners_shard(sharded):
+    urls = sharded("a", "b")
+    create_todos(range(1, 9), 3)
+    shard_map = get_shard_map()
+    for name in ("a", "b"):
+        owners = owners_on(urls[name])
+        assert owners and all(shard_map.name_for(owner_id) == name for owner_id in owners)
+        assert set(owners.values()) == {3}
+
+    owner = 1
+    items = client.get("/", headers={"x-user": str(owner)}).json()["items"]
+    assert [item["title"] for item in items] == [f"owner {owner}"] * 3
+    assert client.get("/todos/stats", headers={"x-user": str(owner)}).json()["total"] == 3
+
+    # Admin fan-out: one merged id order, ids unique across shards
+    first = client.get("/admin/todo", params={"limit": 20}).json()
+    second = client.get("/admin/todo", params={"limit": 20, "cursor": first["next_cursor"]}).json()
+    ids = [item["id"] for item in first["items"] + second["items"]]
+    assert ids == sorted(set(ids)) and len(ids) == 24
+    assert second["next_cursor"] is None
+    assert client.get("/admin/stats").json()["total"] == 24
+    assert client.get("/admin/stats", params={"owner_id": owner}).json()["total"] == 3
+
+    results = client.post("/admin/todo/bulk/delete", json=[ids[0], ids[-1], 99999]).json()["results"]
+    assert [item["status"] for item in results] == ["deleted", "deleted", "not_found"]
+    assert client.delete(f"/admin/todo/{ids[1]}").status_code == status.HTTP_200_OK
+    assert client.delete(f"/admin/todo/{ids[1]}").status_code == status.HTTP_404_NOT_FOUND
+    assert client.get("/admin/stats").json()["total"] == 21
+
+
+def test_rebalance_moves_owners_to_the_new_ring(sharded):
+    urls = sharded("a", "b")
+    create_todos(range(1, 13), 2)
+    versions = {}
+    for url in (urls["a"], urls["b"]):
+        with database.engine_for(url).connect() as connection:
+            versions.update(connection.execute(select(TodoVersions.owner_id, TodoVersions.version)).all())
+
+    sharded("a", "b", "c")
+    shard_map = get_shard_map()
+    planned = rebalance(shard_map, dry_run=True)
+    assert planned and all(target == urls["c"] for _, _, target, _ in planned)
+    assert rebalance(shard_map) == [(owner, source, target, 2) for owner, source, target, _ in planned]
+    assert rebalance(shard_map) == []  # Nothing left to move
+
+    for name, url in urls.items():
+        owners = owners_on(url)
+        assert all(shard_map.name_for(owner_id) == name for owner_id in owners)
+        with database.engine_for(url).connect() as connection:
+            # Stats and versions follow the todos
+            stats = dict(connection.execute(
+                select(TodoStats.owner_id, func.sum(TodoStats.count)).group_by(TodoStats.owner_id).having(func.sum(TodoStats.count) > 0)
+            ).all())
+            assert stats == owners
+            for owner_id, version in connection.execute(select(TodoVersions.owner_id, TodoVersions.version)):
+                assert version > versions[owner_id] if name == "c" else version == versions[owner_id]
+
+    moved_owner = planned[0][0]
+    items = client.get("/todos/search", params={"q": "owner"}, headers={"x-user": str(moved_owner)}).json()["items"]
+    assert len(items) == 2  # Search index rebuilt on the new shard
+    assert client.get("/admin/stats").json()["total"] == 24
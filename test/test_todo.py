@@ -0,0 +1,289 @@
+from fastapi import status
+from ..routers.auth import get_current_user
+from sqlalchemy import select
+from .utils import *
+
+override_databases()
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+def test_read_all_authenticated(test_todo):
+    response = client.get("/")
+    assert response.status_code == status.HTTP_200_OK
+    body = response.json()
+    assert body["next_cursor"] is None
+    assert len(body["items"]) == 1
+    assert body["items"][0]["title"] == "Learn to code!"
+
+
+def test_read_all_pages_with_cursor(many_todos):
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 5}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/", params=params).json()
+        seen.extend(todo["id"] for todo in body["items"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    # Only the caller's 12 todos, in id order, each exactly once
+    assert len(seen) == 12
+    assert seen == sorted(seen)
+
+
+def test_read_all_filters_and_sort(many_todos):
+    body = client.get("/", params={"complete": True}).json()
+    assert len(body["items"]) == 4
+    assert all(todo["complete"] for todo in body["items"])
+
+    body = client.get("/", params={"priority": 1}).json()
+    assert {todo["priority"] for todo in body["items"]} == {1}
+
+    pages = []
+    cursor = None
+    while True:
+        params = {"sort": "-priority", "limit": 4}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/", params=params).json()
+        pages.extend((todo["priority"], todo["id"]) for todo in body["items"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert len(pages) == 12
+    assert pages == sorted(pages, reverse=True)
+
+
+def test_read_all_invalid_cursor():
+    response = client.get("/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_read_one_authenticated(test_todo):
+    response = client.get(f"/todos/{test_todo.id}")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["title"] == "Learn to code!"
+
+
+def test_read_one_not_found():
+    response = client.get("/todos/999")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "Todo not found"}
+
+
+def test_create_todo():
+    request_data = {
+        "title": "New Todo!",
+        "description": "New todo description",
+        "priority": 5,
+        "complete": False,
+    }
+    response = client.post("/todos", json=request_data)
+    assert response.status_code == status.HTTP_200_OK
+
+    db = TestingSessionLocal()
+    model = db.query(Todos).filter(Todos.title == "New Todo!").first()
+    assert model.description == request_data["description"]
+    assert model.owner_id == 1
+    db.query(Todos).delete()
+    db.commit()
+
+
+def test_update_todo(test_todo):
+    request_data = {
+        "title": "Change the title of the todo already saved!",
+        "description": "Need to learn everyday!",
+        "priority": 5,
+        "complete": False,
+    }
+    response = client.put(f"/todos/{test_todo.id}", json=request_data)
+    assert response.status_code == status.HTTP_200_OK
+    db = TestingSessionLocal()
+    model = db.query(Todos).filter(Todos.id == test_todo.id).first()
+    assert model.title == "Change the title of the todo already saved!"
+
+
+def test_update_todo_not_found(test_todo):
+    request_data = {"title": "x", "description": "y", "priority": 5, "complete": False}
+    response = client.put("/todos/999", json=request_data)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "not found"}
+
+
+def test_delete_todo(test_todo):
+    response = client.delete(f"/todos/{test_todo.id}")
+    assert response.status_code == status.HTTP_200_OK
+    db = TestingSessionLocal()
+    assert db.query(Todos).filter(Todos.id == test_todo.id).first() is None
+
+
+def test_delete_todo_not_found():
+    response = client.delete("/todos/999")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "not found"}
+
+
+def test_bulk_create_update_complete_delete():
+    payload = [
+        {"title": f"Imported {i}", "description": "From import", "priority": 3, "complete": False}
+        for i in range(5)
+    ]
+    response = client.post("/todos/bulk", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    created = [item["id"] for item in response.json()["results"]]
+    assert len(created) == 5
+
+    updates = [
+        {"id": created[0], "title": "Renamed", "description": "Changed", "priority": 1, "complete": False},
+        {"id": 99999, "title": "Missing", "description": "Missing", "priority": 1, "complete": False},
+    ]
+    results = client.put("/todos/bulk", json=updates).json()["results"]
+    assert results == [{"id": created[0], "status": "updated"}, {"id": 99999, "status": "not_found"}]
+
+    results = client.post("/todos/bulk/complete", json=created[:2] + [99999]).json()["results"]
+    assert [item["status"] for item in results] == ["completed", "completed", "not_found"]
+
+    results = client.post("/todos/bulk/delete", json=created[2:]).json()["results"]
+    assert all(item["status"] == "deleted" for item in results)
+
+    db = TestingSessionLocal()
+    remaining = db.query(Todos).order_by(Todos.id).all()
+    assert [todo.id for todo in remaining] == created[:2]
+    assert remaining[0].title == "Renamed"
+    assert all(todo.complete for todo in remaining)
+    db.query(Todos).delete()
+    db.commit()
+
+
+def test_bulk_skips_other_owners_todos(many_todos):
+    db = TestingSessionLocal()
+    other_ids = [todo.id for todo in db.query(Todos).filter(Todos.owner_id == 2)]
+    results = client.post("/todos/bulk/delete", json=other_ids).json()["results"]
+    assert all(item["status"] == "not_found" for item in results)
+    assert db.query(Todos).filter(Todos.owner_id == 2).count() == 3
+
+
+def test_bulk_update_is_scoped_to_the_owner(many_todos):
+    db = TestingSessionLocal()
+    own_id = db.scalar(select(Todos.id).where(Todos.owner_id == 1))
+    other_id = db.scalar(select(Todos.id).where(Todos.owner_id == 2))
+    todo = {"title": "Mine now", "description": "d", "priority": 1, "complete": False}
+    with count_statements() as statements:
+        results = client.put("/todos/bulk", json=[{**todo, "id": own_id}, {**todo, "id": other_id}]).json()["results"]
+    assert results == [{"id": own_id, "status": "updated"}, {"id": other_id, "status": "not_found"}]
+    update_sql = next(statement for statement in statements if statement.startswith("UPDATE todos"))
+    assert "owner_id = ?" in update_sql.split("WHERE", 1)[1]  # The write itself checks the owner, not just the SELECT
+    db.expire_all()
+    assert db.get(Todos, other_id).title != "Mine now"
+
+
+def test_bulk_rejects_empty_payload():
+    assert client.post("/todos/bulk", json=[]).status_code == 422
+
+
+def test_single_writes_issue_one_statement(test_todo):
+    # One statement writes the todo (ownership check included); the only other
+    # statement is the owner's ETag version bump, and a 404 costs one statement
+    todo_id = test_todo.id
+    request_data = {"title": "Renamed", "description": "Need to learn everyday!", "priority": 4, "complete": True}
+    with count_statements() as statements:
+        assert client.put(f"/todos/{todo_id}", json=request_data).status_code == status.HTTP_200_OK
+    assert [statement.split()[0:2] for statement in statements] == [["UPDATE", "todos"], ["INSERT", "INTO"]]
+    assert "todo_versions" in statements[1]
+
+    with count_statements() as statements:
+        assert client.put("/todos/999", json=request_data).status_code == status.HTTP_404_NOT_FOUND
+    assert len(statements) == 1
+
+    with count_statements() as statements:
+        assert client.delete(f"/todos/{todo_id}").status_code == status.HTTP_200_OK
+    assert len(statements) == 2 and statements[0].startswith("DELETE FROM todos")
+
+    with count_statements() as statements:
+        assert client.delete(f"/todos/{todo_id}").status_code == status.HTTP_404_NOT_FOUND
+    assert len(statements) == 1
+
+
+def test_list_etag_and_not_modified(test_todo):
+    response = client.get("/")
+    etag = response.headers["ETag"]
+
+    with count_statements() as statements:
+        response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+    assert not any("FROM todos" in statement for statement in statements)
+
+    # Different query parameters are a different representation
+    assert client.get("/", params={"limit": 1}).headers["ETag"] != etag
+
+    # Any write by the owner invalidates the ETag
+    request_data = {"title": "New", "description": "New todo", "priority": 2, "complete": False}
+    client.post("/todos", json=request_data)
+    response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != etag
+
+
+def test_read_one_etag(test_todo):
+    etag = client.get(f"/todos/{test_todo.id}").headers["ETag"]
+    response = client.get(f"/todos/{test_todo.id}", headers={"If-None-Match": f'W/"x", {etag}'})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_search_ranks_and_pages(many_todos):
+    seen = []
+    cursor = None
+    while True:
+        params = {"q": "todo", "limit": 5}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/todos/search", params=params).json()
+        seen.extend(todo["id"] for todo in body["items"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    # Every match of the caller, each exactly once; owner 2's todos never show up
+    assert len(seen) == len(set(seen)) == 12
+    assert client.get("/todos/search", params={"q": "other"}).json()["items"] == []
+
+
+def test_search_follows_updates_and_deletes(test_todo):
+    todo_id = test_todo.id
+    assert [todo["id"] for todo in client.get("/todos/search", params={"q": "learning"}).json()["items"]] == [todo_id]
+
+    client.put(f"/todos/{todo_id}", json={
+        "title": "Water the plants", "description": "Balcony first", "priority": 2, "complete": False,
+    })
+    assert client.get("/todos/search", params={"q": "learn"}).json()["items"] == []
+    assert client.get("/todos/search", params={"q": "plant balcony"}).json()["items"][0]["id"] == todo_id
+
+    client.delete(f"/todos/{todo_id}")
+    assert client.get("/todos/search", params={"q": "plants"}).json()["items"] == []
+
+
+def test_search_rejects_query_without_terms():
+    response = client.get("/todos/search", params={"q": "!!* \""})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_stats_follow_every_write(many_todos):
+    body = client.get("/todos/stats").json()
+    assert (body["total"], body["open"], body["completed"]) == (12, 8, 4)
+    assert sum(bucket["open"] + bucket["completed"] for bucket in body["by_priority"]) == 12
+
+    open_ids = [todo["id"] for todo in client.get("/", params={"complete": False}).json()["items"]]
+    client.post("/todos/bulk/complete", json=open_ids[:2])
+    client.delete(f"/todos/{open_ids[2]}")
+    client.post("/todos", json={"title": "One more", "description": "x", "priority": 5, "complete": False})
+    body = client.get("/todos/stats").json()
+    assert (body["total"], body["open"], body["completed"]) == (12, 6, 6)
+
+
+def test_stats_etag(test_todo):
+    response = client.get("/todos/stats")
+    assert response.json()["total"] == 1
+    cached = client.get("/todos/stats", headers={"If-None-Match": response.headers["ETag"]})
+    assert cached.status_code == status.HTTP_304_NOT_MODIFIED
@@ -0,0 +1,34 @@
+from fastapi import status
+from ..routers.auth import get_current_user
+from .utils import *
+
+override_databases()
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+def test_return_user(test_user):
+    response = client.get("/user/")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["username"] == "jdtest"
+    assert response.json()["phone_number"] == "1111111111"
+
+
+def test_change_phone_number(test_user):
+    with count_statements() as statements:
+        response = client.put("/user/phone_number", json={"phone_number": "2222222222"})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert len(statements) == 1 and statements[0].startswith("UPDATE users")
+    db = TestingSessionLocal()
+    assert db.query(Users).filter(Users.id == test_user.id).first().phone_number == "2222222222"
+
+
+def test_change_phone_number_user_missing():
+    response = client.put("/user/phone_number", json={"phone_number": "2222222222"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_return_user_hides_password(test_user):
+    with count_statements() as statements:
+        body = client.get("/user/").json()
+    assert "hashed_password" not in body
+    assert "hashed_password" not in statements[0]
@@ -0,0 +1,181 @@
+import asyncio
+import dataclasses
+import httpx
+import pytest
+from fastapi import status
+from fastapi import Request
+from .. import database, shards, writes
+from ..config import get_settings
+from ..database import current_user_id, dispose_engines, get_recent_writers
+from ..metrics import WRITE_BATCH_SIZE
+from ..routers.auth import get_current_user
+from .utils import *
+
+
+@pytest.fixture
+def batched(tmp_path, monkeypatch):
+    """App writes to a SQLite file with a 20 ms group commit window"""
+    file_engine = create_engine(f"sqlite:///{tmp_path}/writes.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=file_engine)
+    FileSessionLocal = sessionmaker(autoflush=False, expire_on_commit=False, bind=file_engine)
+
+    async def get_file_db():
+        db = ThreadedSession(FileSessionLocal())
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    settings = dataclasses.replace(get_settings(), write_batch_window_ms=20, write_batch_max_ops=8)
+    monkeypatch.setattr(writes, "get_settings", lambda: settings)
+    override_databases(get_file_db)
+    app.dependency_overrides[get_current_user] = override_get_current_user
+    try:
+        yield file_engine
+    finally:
+        override_databases()
+        writes._batchers.pop(file_engine, None)
+        file_engine.dispose()
+
+
+def send_concurrently(requests):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            return await asyncio.gather(*(async_client.request(method, url, json=body) for method, url, body in requests))
+    return asyncio.run(run())
+
+
+def test_concurrent_writes_share_commits(batched):
+    batches_before = WRITE_BATCH_SIZE.count()
+    todo = {"title": "t", "description": "d", "priority": 1, "complete": False}
+    responses = send_concurrently([("POST", "/todos", todo)] * 20)
+    assert all(response.status_code == status.HTTP_200_OK for response in responses)
+    with batched.connect() as connection:
+        assert connection.scalar(text("SELECT count(*) FROM todos")) == 20
+        # Every write still bumped the owner's version once
+        assert connection.scalar(text("SELECT version FROM todo_versions WHERE owner_id = 1")) == 20
+    batches = WRITE_BATCH_SIZE.count() - batches_before
+    assert 3 <= batches < 20  # At most 8 per batch, and far fewer commits than writes
+
+
+def test_failed_write_only_fails_its_caller(batched):
+    with batched.begin() as connection:
+        connection.execute(text("INSERT INTO todos (id, title, description, priority, complete, owner_id) VALUES (1, 't', 'd', 1, 0, 1)"))
+    todo = {"title": "t", "description": "d", "priority": 2, "complete": True}
+    responses = send_concurrently([
+        ("PUT", "/todos/1", todo),
+        ("PUT", "/todos/999", todo),  # 404 inside the batch
+        ("POST", "/todos", todo),
+    ])
+    assert [response.status_code for response in responses] == [200, 404, 200]
+    with batched.connect() as connection:
+        assert connection.execute(text("SELECT id, priority FROM todos ORDER BY id")).all() == [(1, 2), (2, 2)]
+
+
+def test_failed_operation_is_rolled_back_to_its_savepoint(batched):
+    batcher = writes.WriteBatcher(window=0.01, max_ops=10)
+    insert_todo = "INSERT INTO todos (title, description, priority, complete, owner_id) VALUES (:title, 'd', 1, 0, 1)"
+
+    def operation(title, fail=False):
+        async def write(db):
+            await db.execute(text(insert_todo), {"title": title})
+            if fail:
+                raise ValueError(title)
+            return title
+        return write
+
+    async def run():
+        db = ThreadedSession(sessionmaker(bind=batched)())
+        try:
+            return await asyncio.gather(
+                *(batcher.submit(db, operation(title, fail=title == "b")) for title in "abc"), return_exceptions=True
+            )
+        finally:
+            await db.close()
+
+    results = asyncio.run(run())
+    assert results[0] == "a" and isinstance(results[1], ValueError) and results[2] == "c"
+    with batched.connect() as connection:
+        assert connection.scalars(text("SELECT title FROM todos ORDER BY id")).all() == ["a", "c"]
+
+
+def test_batch_is_invisible_until_its_single_commit(batched):
+    batcher = writes.WriteBatcher(window=0.01, max_ops=10)
+    insert_todo = "INSERT INTO todos (title, description, priority, complete, owner_id) VALUES (:title, 'd', 1, 0, 1)"
+    seen = []
+
+    def operation(title):
+        async def write(db):
+            with batched.connect() as other:  # Another connection, as another worker would read
+                seen.append(other.scalar(text("SELECT count(*) FROM todos")))
+            await db.execute(text(insert_todo), {"title": title})
+            return title
+        return write
+
+    async def run():
+        db = ThreadedSession(sessionmaker(bind=batched)())
+        try:
+            return await asyncio.gather(*(batcher.submit(db, operation(title)) for title in "abc"))
+        finally:
+            await db.close()
+
+    assert asyncio.run(run()) == ["a", "b", "c"]
+    assert seen == [0, 0, 0]  # Earlier writes of the batch were not committed on their own
+    with batched.connect() as connection:
+        assert connection.scalar(text("SELECT count(*) FROM todos")) == 3
+
+
+def test_batched_writers_all_read_their_own_writes(tmp_path, monkeypatch):
+    primary, replica = f"sqlite:///{tmp_path}/primary.db", f"sqlite:///{tmp_path}/replica.db"
+    for url in (primary, replica):
+        file_engine = create_engine(url)
+        Base.metadata.create_all(bind=file_engine)
+        file_engine.dispose()
+    settings = dataclasses.replace(
+        get_settings(), database_url=primary, database_replica_urls=(replica,), read_your_writes_seconds=60,
+        write_batch_window_ms=20, write_batch_max_ops=8,
+    )
+    for module in (database, shards, writes):
+        monkeypatch.setattr(module, "get_settings", lambda: settings)
+    get_recent_writers.cache_clear()
+    shards.get_shard_map.cache_clear()
+
+    async def user_from_header(request: Request):
+        user_id = int(request.headers["x-user"])
+        current_user_id.set(user_id)  # What get_current_user does for a real token
+        return {"username": f"user{user_id}", "id": user_id, "role": "user"}
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            todo = {"title": "t", "description": "d", "priority": 1, "complete": False}
+            posts = await asyncio.gather(*(
+                async_client.post("/todos", json=todo, headers={"x-user": str(user_id)}) for user_id in (1, 2, 3)
+            ))
+            reads = await asyncio.gather(*(
+                async_client.get("/", headers={"x-user": str(user_id)}) for user_id in (1, 2, 3)
+            ))
+            return posts, reads
+
+    clear_database_overrides()
+    app.dependency_overrides[get_current_user] = user_from_header
+    batches_before = WRITE_BATCH_SIZE.count()
+    try:
+        posts, reads = asyncio.run(run())
+    finally:
+        override_databases()
+        app.dependency_overrides[get_current_user] = override_get_current_user
+        asyncio.run(dispose_engines())
+        writes._batchers.clear()
+        shards.get_shard_map.cache_clear()
+    assert all(response.status_code == status.HTTP_200_OK for response in posts)
+    assert WRITE_BATCH_SIZE.count() - batches_before < 3  # They did share a commit
+    assert {user_id for user_id in (1, 2, 3) if get_recent_writers().get(user_id)} == {1, 2, 3}
+    get_recent_writers.cache_clear()
+    # The replica never got the todos: each user sees theirs, so every read went to the primary
+    assert [len(response.json()["items"]) for response in reads] == [1, 1, 1]
+    for response in posts:
+        # Each request's own queries are in its Server-Timing, not all in the first one's
+        assert 'queries"' in response.headers["server-timing"]
+        assert 'desc="0 queries"' not in response.headers["server-timing"]
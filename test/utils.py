@@ -0,0 +1,131 @@
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from fastapi.testclient import TestClient
+from ..database import Base, ThreadedSession, get_db, get_read_db
+from ..main import app
+from ..models import Todos, Users
+from ..shards import ShardSessions, get_shard_dbs, get_shard_read_dbs, get_todo_db, get_todo_read_db
+
+# In-memory SQLite shared across threads so tests never touch todosapp.db
+SQLALCHEMY_DATABASE_URL = "sqlite://"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+Base.metadata.create_all(bind=engine)
+
+
+async def override_get_db():
+    db = ThreadedSession(TestingSessionLocal())
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+SESSION_DEPENDENCIES = (get_db, get_read_db, get_todo_db, get_todo_read_db)
+SHARD_DEPENDENCIES = (get_shard_dbs, get_shard_read_dbs)
+
+
+def override_databases(get_session=override_get_db):
+    """Point every database dependency at `get_session` (the admin fan-out sees it as the only shard)"""
+    async def get_shard_sessions():
+        async for db in get_session():
+            yield ShardSessions(primary=db)
+
+    for dependency in SESSION_DEPENDENCIES:
+        app.dependency_overrides[dependency] = get_session
+    for dependency in SHARD_DEPENDENCIES:
+        app.dependency_overrides[dependency] = get_shard_sessions
+
+
+def clear_database_overrides():
+    """Let the app open its own sessions again"""
+    for dependency in SESSION_DEPENDENCIES + SHARD_DEPENDENCIES:
+        app.dependency_overrides.pop(dependency, None)
+
+
+def override_get_current_user():
+    return {'username': 'jdtest', 'id': 1, 'role': 'admin'}
+
+
+client = TestClient(app)
+
+
+@contextmanager
+def count_statements():
+    """Collect every SQL statement sent to the test database inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def test_todo():
+    todo = Todos(
+        title="Learn to code!",
+        description="Need to learn everyday!",
+        priority=5,
+        complete=False,
+        owner_id=1,
+    )
+
+    db = TestingSessionLocal()
+    db.add(todo)
+    db.commit()
+    yield todo
+    with engine.connect() as connection:
+        connection.execute(text("DELETE FROM todos;"))
+        connection.commit()
+
+
+@pytest.fixture
+def many_todos():
+    # 12 todos for owner 1 (priorities cycle 1..5, every third one complete) and 3 for owner 2
+    db = TestingSessionLocal()
+    for i in range(12):
+        db.add(Todos(title=f"todo {i}", description="bulk", priority=i % 5 + 1,
+                     complete=i % 3 == 0, owner_id=1))
+    for i in range(3):
+        db.add(Todos(title=f"other {i}", description="bulk", priority=1, complete=False, owner_id=2))
+    db.commit()
+    db.close()
+    yield
+    with engine.connect() as connection:
+        connection.execute(text("DELETE FROM todos;"))
+        connection.commit()
+
+
+@pytest.fixture
+def test_user():
+    user = Users(
+        username="jdtest",
+        email="jdtest@email.com",
+        first_name="Jaidev",
+        last_name="Singh",
+        hashed_password="not-a-real-hash",
+        role="admin",
+        phone_number="1111111111",
+    )
+    db = TestingSessionLocal()
+    db.add(user)
+    db.commit()
+    yield user
+    with engine.connect() as connection:
+        connection.execute(text("DELETE FROM users;"))
+        connection.commit()
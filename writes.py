@@ -0,0 +1,137 @@
+"""Group commit for todo writes.
+
+Every write handler hands its statements to `commit_write(db, operation)`
+as an `async def operation(db)` that must not commit. By default the
+operation runs on the request's session, which is then committed, just
+as if the handler had done it itself.
+
+With WRITE_BATCH_WINDOW_MS > 0, operations arriving within the window
+(or until WRITE_BATCH_MAX_OPS are queued) share one transaction and one
+commit, which on SQLite means a single fsync and one trip through the
+write lock instead of one per request. Each operation runs inside its
+own SAVEPOINT: one that fails (a 404, a constraint violation) is rolled
+back on its own and its caller gets the error, the rest still commit.
+While a batch commits, the next one fills up, so the batch size grows
+with the load.
+
+Each operation runs in a copy of its caller's context, so its queries
+count towards that request's Server-Timing, and once the batch commits
+every caller is remembered as a recent writer (read-your-writes), not
+just the one whose request started the batch.
+"""
+import asyncio
+import contextvars
+import time
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import text
+
+from .config import get_settings
+from .database import current_user_id, remember_writer_id, session_like
+from .metrics import WRITE_BATCH_COMMIT_TIME, WRITE_BATCH_SIZE
+
+Operation = Callable[[Any], Awaitable[Any]]
+
+
+class WriteBatcher:
+    """Queues write operations for one database and commits them in batches"""
+
+    def __init__(self, window: float, max_ops: int):
+        self.window = window
+        self.max_ops = max_ops
+        self._pending: list = []  # (operation, session to clone, future, caller's context)
+        self._runner = None
+        self._wakeup = None
+
+    async def submit(self, db, operation: Operation) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((operation, db, future, contextvars.copy_context()))
+        if len(self._pending) >= self.max_ops and self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+        if self._runner is None:
+            # A context of its own: the batch belongs to no single request
+            self._runner = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+        return await future
+
+    async def _run(self) -> None:
+        try:
+            while self._pending:
+                if len(self._pending) < self.max_ops:
+                    self._wakeup = asyncio.get_running_loop().create_future()
+                    await asyncio.wait([self._wakeup], timeout=self.window)
+                batch, self._pending = self._pending[:self.max_ops], self._pending[self.max_ops:]
+                await self._commit(batch)
+        finally:
+            self._runner = None
+            self._wakeup = None
+
+    @staticmethod
+    async def _run_operation(db, savepoint: str, operation: Operation) -> tuple:
+        """Run one operation inside its own savepoint, returns (result, error)"""
+        await db.execute(text(f"SAVEPOINT {savepoint}"))
+        try:
+            result = await operation(db)
+        except Exception as error:
+            await db.execute(text(f"ROLLBACK TO SAVEPOINT {savepoint}"))
+            return None, error
+        await db.execute(text(f"RELEASE SAVEPOINT {savepoint}"))
+        return result, None
+
+    async def _commit(self, batch: list) -> None:
+        started = time.perf_counter()
+        outcomes = []  # (future, result, error)
+        db = session_like(batch[0][1])
+        try:
+            if db.bind.dialect.name == "sqlite":
+                # pysqlite only opens a transaction by itself before DML: without this the first
+                # SAVEPOINT would open one and its RELEASE commit it, once per write. IMMEDIATE
+                # takes the write lock now rather than failing to upgrade a read lock later.
+                await db.execute(text("BEGIN IMMEDIATE"))
+            for index, (operation, _, future, context) in enumerate(batch):
+                step = self._run_operation(db, f"write_{index}", operation)
+                result, error = await asyncio.get_running_loop().create_task(step, context=context)
+                outcomes.append((future, result, error))
+            await db.commit()
+        except Exception as error:
+            # Nothing in the batch was committed: every caller gets the failure
+            await db.rollback()
+            outcomes = [(future, None, error) for _, _, future, _ in batch]
+        else:
+            for (_, _, _, context), (_, _, error) in zip(batch, outcomes):
+                if error is None:
+                    remember_writer_id(context.get(current_user_id))
+        finally:
+            await db.close()
+        WRITE_BATCH_SIZE.observe(value=len(batch))
+        WRITE_BATCH_COMMIT_TIME.observe(value=time.perf_counter() - started)
+        for future, result, error in outcomes:
+            if future.done():
+                continue  # The caller went away (request cancelled)
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_batchers: dict = {}  # engine -> WriteBatcher, one queue per database (shard)
+
+
+def get_write_batcher(db) -> WriteBatcher:
+    settings = get_settings()
+    if db.bind not in _batchers:
+        _batchers[db.bind] = WriteBatcher(settings.write_batch_window_ms / 1000, settings.write_batch_max_ops)
+    return _batchers[db.bind]
+
+
+async def commit_write(db, operation: Operation) -> Any:
+    """Run `operation(db)` and commit it, batched with concurrent writes when WRITE_BATCH_WINDOW_MS is set.
+
+    Returns the operation's result once its changes are committed (so it is
+    safe to publish events from it) or raises its error.
+    """
+    if get_settings().write_batch_window_ms <= 0:
+        result = await operation(db)
+        await db.commit()
+        return result
+    await db.rollback()  # End the request session's read transaction; the batch writes on its own connection
+    return await get_write_batcher(db).submit(db, operation)